@@ -0,0 +1,97 @@
+"""
+Benchmark: EXTRACT/date_trunc date filters vs. the half-open ranges sql_rewrite produces.
+
+Builds a synthetic sales table (10M rows by default) with an index on `date`, then
+runs each query in both forms under EXPLAIN ANALYZE and prints the scan type and
+execution time. Needs DATABASE_URL; the table is dropped afterwards unless --keep.
+
+    python bench_date_predicates.py --rows 10000000
+"""
+import argparse
+import json
+import statistics
+
+from sqlalchemy import create_engine, text
+
+from database import DATABASE_URL
+from sql_rewrite import make_date_filters_sargable
+
+BENCH_TABLE = "bench_sales"
+
+QUERIES = [
+    ("month (EXTRACT year+month)",
+     f"SELECT SUM(revenue) FROM {BENCH_TABLE} WHERE EXTRACT(YEAR FROM date) = 2024 AND EXTRACT(MONTH FROM date) = 1"),
+    ("quarter (EXTRACT year+quarter)",
+     f"SELECT region, SUM(revenue) FROM {BENCH_TABLE} WHERE EXTRACT(YEAR FROM date) = 2024 AND EXTRACT(QUARTER FROM date) = 2 GROUP BY region"),
+    ("year (EXTRACT year)",
+     f"SELECT product, SUM(units_sold) FROM {BENCH_TABLE} WHERE EXTRACT(YEAR FROM date) = 2023 GROUP BY product"),
+    ("two years (EXTRACT year IN)",
+     f"SELECT SUM(revenue) FROM {BENCH_TABLE} WHERE EXTRACT(YEAR FROM date) IN (2023, 2024)"),
+    ("month (date_trunc)",
+     f"SELECT SUM(revenue) FROM {BENCH_TABLE} WHERE date_trunc('month', date) = '2024-03-01'"),
+]
+
+def build_table(conn, rows: int):
+    print(f"🔄 Building {BENCH_TABLE} with {rows:,} rows...")
+    conn.execute(text(f"DROP TABLE IF EXISTS {BENCH_TABLE}"))
+    conn.execute(text(
+        f"""CREATE UNLOGGED TABLE {BENCH_TABLE} (
+                date DATE NOT NULL, region TEXT NOT NULL, product TEXT NOT NULL,
+                units_sold INTEGER NOT NULL, revenue NUMERIC(10, 2) NOT NULL)"""
+    ))
+    # Ten years of days, spread evenly over regions and products
+    conn.execute(text(
+        f"""INSERT INTO {BENCH_TABLE}
+            SELECT DATE '2015-01-01' + (i % 3653),
+                   (ARRAY['North', 'South', 'East', 'West'])[1 + i % 4],
+                   (ARRAY['Product A', 'Product B', 'Product C'])[1 + (i / 4) % 3],
+                   1 + (i * 7919) % 100,
+                   ((i * 104729) % 100000) / 100.0
+            FROM generate_series(1, :rows) AS i"""
+    ), {"rows": rows})
+    conn.execute(text(f"CREATE INDEX ix_{BENCH_TABLE}_date ON {BENCH_TABLE} (date)"))
+    conn.execute(text(f"ANALYZE {BENCH_TABLE}"))
+
+def scan_types(node: dict) -> list:
+    found = [node["Node Type"]] if "Scan" in node["Node Type"] else []
+    for child in node.get("Plans", []):
+        found += scan_types(child)
+    return found
+
+def measure(conn, sql: str, repeats: int) -> tuple:
+    """Scan node types and median execution time (ms) over `repeats` runs"""
+    times, scans = [], []
+    for _ in range(repeats):
+        raw = conn.execute(text(f"EXPLAIN (ANALYZE, FORMAT JSON) {sql}")).scalar()
+        plan = json.loads(raw) if isinstance(raw, str) else raw
+        times.append(plan[0]["Execution Time"])
+        scans = scan_types(plan[0]["Plan"])
+    return sorted(set(scans)), statistics.median(times)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--reuse", action="store_true", help=f"Use an existing {BENCH_TABLE} table")
+    parser.add_argument("--keep", action="store_true", help=f"Keep {BENCH_TABLE} afterwards")
+    args = parser.parse_args()
+
+    engine = create_engine(DATABASE_URL)
+    with engine.connect() as conn:
+        conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+        if not args.reuse:
+            build_table(conn, args.rows)
+
+        print(f"\n{'query':32} {'form':9} {'scan':34} {'median ms':>10}")
+        for label, sql in QUERIES:
+            rewritten, _ = make_date_filters_sargable(sql)
+            for form, query in (("original", sql), ("ranges", rewritten)):
+                scans, median_ms = measure(conn, query, args.repeats)
+                print(f"{label:32} {form:9} {', '.join(scans):34} {median_ms:10.1f}")
+
+        if not args.keep:
+            conn.execute(text(f"DROP TABLE {BENCH_TABLE}"))
+            print(f"\n✅ Dropped {BENCH_TABLE}")
+
+if __name__ == "__main__":
+    main()
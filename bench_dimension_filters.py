@@ -0,0 +1,70 @@
+"""
+Benchmark: ILIKE/LOWER() filters on dimension columns vs. the equality filters sql_rewrite produces.
+
+Builds a synthetic sales table (10M rows by default) with the (region, date) and
+(product, date) indexes the Sales model declares, then runs each filtered aggregate
+in both forms under EXPLAIN ANALYZE and prints the scan type and execution time.
+Needs DATABASE_URL; the table is dropped afterwards unless --keep.
+
+    python bench_dimension_filters.py --rows 10000000
+"""
+import argparse
+
+from sqlalchemy import create_engine, text
+
+from database import DATABASE_URL
+from dimension_aliases import build_alias_map
+from sql_rewrite import make_dimension_filters_sargable
+from bench_date_predicates import BENCH_TABLE, build_table, measure
+
+QUERIES = [
+    ("region ILIKE, one month",
+     f"SELECT SUM(revenue) FROM {BENCH_TABLE} WHERE region ILIKE 'north' AND date >= '2024-01-01' AND date < '2024-02-01'"),
+    ("region ILIKE %..%, one quarter",
+     f"SELECT product, SUM(units_sold) FROM {BENCH_TABLE} WHERE region ILIKE '%north%' "
+     f"AND date >= '2024-04-01' AND date < '2024-07-01' GROUP BY product"),
+    ("product ILIKE, one year",
+     f"SELECT region, SUM(revenue) FROM {BENCH_TABLE} WHERE product ILIKE 'product a' "
+     f"AND date >= '2023-01-01' AND date < '2024-01-01' GROUP BY region"),
+    ("LOWER(region) IN, one month",
+     f"SELECT SUM(revenue) FROM {BENCH_TABLE} WHERE LOWER(region) IN ('north', 'south') "
+     f"AND date >= '2024-03-01' AND date < '2024-04-01'"),
+    ("Arabic region, one month",
+     f"SELECT SUM(revenue) FROM {BENCH_TABLE} WHERE region = 'الشمالية' AND date >= '2024-01-01' AND date < '2024-02-01'"),
+]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--reuse", action="store_true", help=f"Use an existing {BENCH_TABLE} table")
+    parser.add_argument("--keep", action="store_true", help=f"Keep {BENCH_TABLE} afterwards")
+    args = parser.parse_args()
+
+    engine = create_engine(DATABASE_URL)
+    with engine.connect() as conn:
+        conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+        if not args.reuse:
+            build_table(conn, args.rows)
+            for column in ("region", "product"):
+                conn.execute(text(f"CREATE INDEX ix_{BENCH_TABLE}_{column}_date ON {BENCH_TABLE} ({column}, date)"))
+            conn.execute(text(f"ANALYZE {BENCH_TABLE}"))
+
+        alias_map = build_alias_map({
+            column: conn.execute(text(f"SELECT DISTINCT {column} FROM {BENCH_TABLE}")).scalars().all()
+            for column in ("region", "product")
+        })
+
+        print(f"\n{'query':32} {'form':9} {'scan':34} {'median ms':>10}")
+        for label, sql in QUERIES:
+            rewritten, _ = make_dimension_filters_sargable(sql, alias_map)
+            for form, query in (("original", sql), ("equality", rewritten)):
+                scans, median_ms = measure(conn, query, args.repeats)
+                print(f"{label:32} {form:9} {', '.join(scans):34} {median_ms:10.1f}")
+
+        if not args.keep:
+            conn.execute(text(f"DROP TABLE {BENCH_TABLE}"))
+            print(f"\n✅ Dropped {BENCH_TABLE}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Benchmark: chat persistence writes, delete-and-rewrite (save_chat_session) vs. append-only (append_chat_messages).
+
+Simulates a conversation of --turns question/answer pairs, saving after every
+message as session_manager.add_message does, and prints the message rows written
+and deleted, the WAL generated and the total save time for each strategy.
+Needs DATABASE_URL; the benchmark sessions are deleted afterwards unless --keep.
+
+    python bench_session_writes.py --turns 200
+"""
+import argparse
+import time
+import uuid
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from database import DATABASE_URL, ChatMessage, ChatSession, save_chat_session, append_chat_messages
+from chat_messages import Message, MessageMetadata
+
+MODULE = "SQL Query Assistant"
+
+def conversation(turns: int) -> list:
+    """Stored form of the messages session_manager.add_message builds"""
+    messages = []
+    for turn in range(turns):
+        messages.append(Message(role="user", content=f"What was the total revenue by region in month {turn % 12 + 1}?"))
+        messages.append(Message(
+            role="assistant",
+            content="Revenue by region: North 1,204,331.50, South 998,120.00, East 1,120,004.25, West 870,655.75. " * 3,
+            metadata=MessageMetadata(sql_query="SELECT region, SUM(revenue) FROM sales GROUP BY region", success=True)
+        ))
+    return [message.to_record() for message in messages]
+
+def wal_lsn(db) -> str:
+    return db.execute(text("SELECT pg_current_wal_lsn()")).scalar()
+
+def run(db, strategy: str, messages: list) -> dict:
+    session_id = str(uuid.uuid4())
+    written = deleted = 0
+    start_lsn = wal_lsn(db)
+    started = time.perf_counter()
+    for count in range(1, len(messages) + 1):
+        if strategy == "rewrite":
+            deleted += count - 1
+            written += count
+            save_chat_session(db, session_id, "bench", MODULE, messages[:count])
+        else:
+            written += 1
+            append_chat_messages(db, session_id, "bench", MODULE, messages[count - 1:count])
+    elapsed = time.perf_counter() - started
+    wal_bytes = db.execute(
+        text("SELECT pg_wal_lsn_diff(pg_current_wal_lsn(), :start)"), {"start": start_lsn}
+    ).scalar()
+    return {"session_id": session_id, "written": written, "deleted": deleted,
+            "wal_bytes": int(wal_bytes), "seconds": elapsed}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--keep", action="store_true", help="Keep the benchmark sessions afterwards")
+    args = parser.parse_args()
+
+    db = sessionmaker(bind=create_engine(DATABASE_URL))()
+    try:
+        results = {}
+        for strategy in ("rewrite", "append"):
+            # Fresh message ids per strategy, so neither run sees the other's rows
+            print(f"🔄 Saving {args.turns} turns with {strategy}...")
+            results[strategy] = run(db, strategy, conversation(args.turns))
+
+        print(f"\n{'strategy':9} {'rows written':>13} {'rows deleted':>13} {'WAL MB':>9} {'save s':>8}")
+        for strategy, result in results.items():
+            print(f"{strategy:9} {result['written']:13,} {result['deleted']:13,} "
+                  f"{result['wal_bytes'] / 1e6:9.1f} {result['seconds']:8.2f}")
+
+        if not args.keep:
+            session_ids = [result["session_id"] for result in results.values()]
+            db.query(ChatMessage).filter(ChatMessage.session_id.in_(session_ids)).delete(synchronize_session=False)
+            db.query(ChatSession).filter(ChatSession.session_id.in_(session_ids)).delete(synchronize_session=False)
+            db.commit()
+            print("\n✅ Deleted the benchmark sessions")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
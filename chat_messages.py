@@ -0,0 +1,80 @@
+import os
+import json
+import uuid
+from datetime import datetime
+from dataclasses import dataclass, field, fields
+
+# -------------------------------------------------------------------
+# Configuration
+# -------------------------------------------------------------------
+CHAT_MESSAGE_WINDOW = int(os.getenv("CHAT_MESSAGE_WINDOW", "40"))  # Messages kept in memory per chat session
+
+# -------------------------------------------------------------------
+# Message model
+# -------------------------------------------------------------------
+@dataclass(slots=True)
+class MessageMetadata:
+    """What a message carries besides its text; unset fields cost one pointer each"""
+    # SQL assistant answers
+    sql_query: str | None = None
+    sql_source: str | None = None
+    execution_status: str | None = None
+    query_plan: dict | None = None
+    result: dict | None = None  # result_store reference and summary stats
+    # Incident explainer
+    log_id: int | None = None
+    analysis_language: str | None = None
+    analysis_type: str | None = None
+    incident_type: str | None = None
+    # Either module
+    success: bool | None = None
+    error: str | None = None
+    timings: dict | None = None
+    trace_id: str | None = None
+    trace: list | None = None
+    extra: dict | None = None  # Keys without a field, kept so a round trip loses nothing
+
+    @classmethod
+    def from_dict(cls, data: dict = None) -> "MessageMetadata":
+        known = {f.name for f in fields(cls)} - {"extra"}
+        data = data or {}
+        extra = {key: value for key, value in data.items() if key not in known}
+        return cls(**{key: value for key, value in data.items() if key in known}, extra=extra or None)
+
+    def to_dict(self) -> dict:
+        """The set fields and extra keys as one flat dict (the inverse of from_dict)"""
+        data = {
+            f.name: getattr(self, f.name) for f in fields(self)
+            if f.name != "extra" and getattr(self, f.name) is not None
+        }
+        data.update(self.extra or {})
+        return data
+
+@dataclass(slots=True)
+class Message:
+    role: str  # user, assistant
+    content: str
+    id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    timestamp: datetime = field(default_factory=datetime.utcnow)  # UTC, stored as ChatMessage.created_at
+    metadata: MessageMetadata = field(default_factory=MessageMetadata)
+
+    def to_record(self) -> dict:
+        """Stored form for database.append_chat_messages, with the metadata as JSON-safe values"""
+        return {
+            "id": self.id,
+            "role": self.role,
+            "content": self.content,
+            "timestamp": self.timestamp,
+            "metadata": json.loads(json.dumps(self.metadata.to_dict(), default=str, ensure_ascii=False))
+        }
+
+    @classmethod
+    def from_record(cls, record: dict) -> "Message":
+        """Message from the form database.load_chat_session returns"""
+        return cls(
+            role=record["role"],
+            content=record["content"],
+            id=record["id"],
+            timestamp=record["timestamp"],
+            metadata=MessageMetadata.from_dict(record.get("metadata"))
+        )
@@ -0,0 +1,269 @@
+"""
+Columnar mirror of the fact tables: Parquet snapshots exported from PostgreSQL, queried with DuckDB.
+
+    python columnar_mirror.py   # export partitions that changed since the last refresh
+"""
+import os
+import json
+import time
+import threading
+from datetime import date
+from pathlib import Path
+
+import pandas as pd
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import ErrorLevel
+from sqlglot.optimizer.qualify import qualify
+from sqlglot.optimizer.annotate_types import annotate_types
+from sqlalchemy import inspect, text
+
+import metrics
+from database import SessionLocal, get_data_versions
+from result_cache import referenced_tables
+from sql_guard import SQL_STATEMENT_TIMEOUT_MS
+
+# -------------------------------------------------------------------
+# Configuration
+# -------------------------------------------------------------------
+ANALYTICS_ENGINE = os.getenv("ANALYTICS_ENGINE", "postgres")  # postgres | duckdb
+MIRROR_PATH = Path(os.getenv("MIRROR_PATH", ".cache/mirror"))
+MIRROR_TABLES = {"sales": "date", "churn": "month"}  # Mirrored table → date column it is partitioned by (monthly)
+
+MANIFEST_FORMAT = 1
+
+# -------------------------------------------------------------------
+# Dialect shim
+# -------------------------------------------------------------------
+class DialectMiss(ValueError):
+    """The query uses something the DuckDB translation can't reproduce exactly"""
+
+# Functions whose unaliased output column PostgreSQL names after the function itself
+VERIFIED_COLUMN_FUNCTIONS = {"sum", "count", "avg", "min", "max", "extract"}
+
+def _postgres_column_name(expression: exp.Expression) -> str:
+    """Name PostgreSQL gives an unaliased output column.
+
+    Raises DialectMiss where sqlglot's function name may differ from PostgreSQL's
+    (e.g. now() parses as CURRENT_TIMESTAMP) and for casts PostgreSQL names after the type.
+    """
+    cast = False
+    while isinstance(expression, (exp.Cast, exp.Paren)):
+        cast = cast or isinstance(expression, exp.Cast)
+        expression = expression.this
+    if isinstance(expression, exp.Column):
+        return expression.name
+    if isinstance(expression, exp.Func):
+        name = expression.sql_name().lower()
+        if isinstance(expression, exp.Anonymous) or name not in VERIFIED_COLUMN_FUNCTIONS:
+            raise DialectMiss(f"unaliased {expression.sql()} may not keep PostgreSQL's column name")
+        return name
+    if isinstance(expression, exp.Case):
+        return "case"
+    if cast:
+        raise DialectMiss(f"unaliased cast {expression.sql()} is named after its type in PostgreSQL")
+    return "?column?"
+
+def to_duckdb_sql(sql: str, schema: dict) -> str:
+    """Translate a PostgreSQL query to DuckDB with PostgreSQL semantics.
+
+    ILIKE, EXTRACT and NULLIF carry over as they are. Integer division is kept
+    integer (DuckDB's `/` always returns a double), date_trunc keeps returning a
+    timestamp, output columns keep PostgreSQL's names and :name parameters become
+    $name. Anything that can't be typed or translated raises DialectMiss.
+    """
+    try:
+        query = sqlglot.parse_one(sql, read="postgres")
+        select = query if isinstance(query, exp.Select) else query.find(exp.Select)
+        for projection in list(select.expressions if select else []):
+            if not isinstance(projection, (exp.Alias, exp.Star)) and not (isinstance(projection, exp.Column) and projection.is_star):
+                projection.replace(exp.alias_(projection.copy(), _postgres_column_name(projection), quoted=True))
+
+        # Typed division needs to know which operands are integers
+        query = annotate_types(qualify(query, schema=schema, dialect="postgres"), schema=schema)
+        for division in query.find_all(exp.Div):
+            if division.this.type is None or division.expression.type is None or \
+                    division.this.type.is_type(exp.DataType.Type.UNKNOWN) or \
+                    division.expression.type.is_type(exp.DataType.Type.UNKNOWN):
+                raise DialectMiss(f"can't type {division.sql()}")
+
+        query = query.transform(
+            lambda node: exp.cast(node, "TIMESTAMP") if isinstance(node, exp.TimestampTrunc)
+            and not isinstance(node.parent, exp.Cast) else node,
+            copy=False
+        )
+        return query.sql(dialect="duckdb", unsupported_level=ErrorLevel.RAISE)
+    except DialectMiss:
+        raise
+    except Exception as e:
+        raise DialectMiss(str(e)) from e
+
+# -------------------------------------------------------------------
+# Mirror
+# -------------------------------------------------------------------
+class ColumnarMirror:
+    """Monthly Parquet partitions of the mirrored tables plus a manifest of their data versions.
+
+    A refresh compares per-month checksums computed in PostgreSQL with the manifest
+    and re-exports only the months that changed. Queries are served only while the
+    manifest matches the current data version of every table they read.
+    """
+
+    def __init__(self, path: Path = MIRROR_PATH, tables: dict = None):
+        import duckdb  # Optional dependency, only needed with ANALYTICS_ENGINE=duckdb
+        self.duckdb = duckdb
+        self.path = Path(path)
+        self.tables = tables or MIRROR_TABLES
+        self._refresh_lock = threading.Lock()
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    @property
+    def manifest_path(self) -> Path:
+        return self.path / "manifest.json"
+
+    def _read_manifest(self) -> dict:
+        try:
+            manifest = json.loads(self.manifest_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return {"format": MANIFEST_FORMAT, "tables": {}}
+        return manifest if manifest.get("format") == MANIFEST_FORMAT else {"format": MANIFEST_FORMAT, "tables": {}}
+
+    def _write_manifest(self, manifest: dict):
+        temp_path = self.manifest_path.with_suffix(".tmp")
+        temp_path.write_text(json.dumps(manifest, indent=1), encoding="utf-8")
+        temp_path.replace(self.manifest_path)
+
+    # ---------------------------------------------------------------
+    # Refresh
+    # ---------------------------------------------------------------
+    def _refresh_table(self, session, table: str, date_column: str, entry: dict) -> dict:
+        columns = {column["name"]: str(column["type"]) for column in inspect(session.connection()).get_columns(table)}
+        version = get_data_versions(session, [table])[table]
+        if entry.get("columns") != columns:
+            entry = {"partitions": {}}  # Schema changed, re-export everything
+
+        checksums = {
+            row.part: f"{row.row_count}:{row.checksum}"
+            for row in session.execute(text(
+                f"""SELECT to_char({date_column}, 'YYYY-MM') AS part, COUNT(*) AS row_count,
+                           SUM(hashtext(t::text)::bigint) AS checksum
+                    FROM {table} t GROUP BY 1"""
+            ))
+        }
+        partitions = dict(entry.get("partitions", {}))
+        (self.path / table).mkdir(exist_ok=True)
+
+        exported = 0
+        for part, checksum in checksums.items():
+            if partitions.get(part, {}).get("checksum") == checksum:
+                continue
+            start = date.fromisoformat(f"{part}-01")
+            end = date(start.year + start.month // 12, start.month % 12 + 1, 1)
+            result = session.execute(
+                text(f"SELECT * FROM {table} WHERE {date_column} >= :start AND {date_column} < :end"),
+                {"start": start, "end": end}
+            )
+            frame = pd.DataFrame(result.fetchall(), columns=list(result.keys()))
+            file_name = f"{table}/{part}.parquet"
+            frame.to_parquet(self.path / f"{file_name}.tmp", index=False)
+            (self.path / f"{file_name}.tmp").replace(self.path / file_name)
+            partitions[part] = {"file": file_name, "checksum": checksum, "rows": len(frame)}
+            exported += 1
+
+        for part in set(partitions) - set(checksums):
+            (self.path / partitions.pop(part)["file"]).unlink(missing_ok=True)
+
+        metrics.incr("mirror.partitions_exported", exported)
+        print(f"✅ Mirrored {table}: {exported} of {len(partitions)} partitions exported")
+        return {"version": version, "columns": columns, "partitions": partitions, "refreshed_at": time.time()}
+
+    def refresh(self, session=None) -> dict:
+        """Bring every mirrored table up to date, exporting only the months that changed"""
+        own_session = session is None
+        session = session or SessionLocal()
+        try:
+            with self._refresh_lock:
+                manifest = self._read_manifest()
+                for table, date_column in self.tables.items():
+                    manifest["tables"][table] = self._refresh_table(
+                        session, table, date_column, manifest["tables"].get(table, {})
+                    )
+                    self._write_manifest(manifest)
+                return manifest
+        finally:
+            if own_session:
+                session.close()
+
+    def refresh_in_background(self):
+        """Start a refresh unless one is already running"""
+        if self._refresh_lock.locked():
+            return
+
+        def run():
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"⚠️ Mirror refresh failed: {str(e)}")
+        threading.Thread(target=run, name="mirror-refresh", daemon=True).start()
+
+    # ---------------------------------------------------------------
+    # Queries
+    # ---------------------------------------------------------------
+    def query(self, session, sql: str, params: dict) -> pd.DataFrame | None:
+        """Run a query on the mirror, or None when it must go to PostgreSQL instead.
+
+        Misses are queries over tables that aren't mirrored, a mirror that is behind
+        the current data versions (a refresh is started) and SQL the dialect shim or
+        DuckDB can't handle. A query that outlives the statement timeout raises.
+        """
+        tables = referenced_tables(sql)
+        manifest = self._read_manifest()["tables"]
+        if not tables or any(table not in manifest or not manifest[table]["partitions"] for table in tables):
+            metrics.incr("mirror.miss.coverage")
+            return None
+
+        try:
+            with session.begin_nested():
+                versions = get_data_versions(session, tables)
+        except Exception as e:
+            print(f"⚠️ Mirror skipped, data versions unavailable: {str(e)}")
+            return None
+        if any(manifest[table]["version"] != versions[table] for table in tables):
+            metrics.incr("mirror.miss.stale")
+            self.refresh_in_background()
+            return None
+
+        try:
+            duckdb_sql = to_duckdb_sql(sql, {table: manifest[table]["columns"] for table in tables})
+        except DialectMiss as e:
+            print(f"⚠️ Mirror dialect miss: {str(e)}")
+            metrics.incr("mirror.miss.dialect")
+            return None
+
+        conn = self.duckdb.connect()
+        timer = threading.Timer(SQL_STATEMENT_TIMEOUT_MS / 1000, conn.interrupt)
+        try:
+            for table in tables:
+                files = [str(self.path / part["file"]) for part in manifest[table]["partitions"].values()]
+                conn.execute(f"CREATE VIEW {table} AS SELECT * FROM read_parquet({files!r})")
+            timer.start()
+            started = time.perf_counter()
+            df = conn.execute(duckdb_sql, {name: value for name, value in params.items() if f"${name}" in duckdb_sql}).df()
+            metrics.observe("mirror.query_seconds", time.perf_counter() - started)
+            metrics.incr("mirror.hits")
+            return df
+        except self.duckdb.InterruptException:
+            raise TimeoutError("canceling statement due to statement timeout")
+        except self.duckdb.Error as e:
+            print(f"⚠️ Mirror query failed, falling back to PostgreSQL: {str(e)}")
+            metrics.incr("mirror.miss.dialect")
+            return None
+        finally:
+            timer.cancel()
+            conn.close()
+
+# -------------------------------------------------------------------
+# Script entrypoint
+# -------------------------------------------------------------------
+if __name__ == "__main__":
+    ColumnarMirror().refresh()
@@ -1,6 +1,6 @@
 import os
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
 from sqlalchemy import (
     create_engine,
     Column,
@@ -12,9 +12,16 @@ from sqlalchemy import (
     ForeignKey,
     String,
     JSON,
-    Boolean
+    Boolean,
+    Index,
+    inspect,
+    text,
+    func,
+    update,
+    tuple_
 )
 from sqlalchemy.orm import declarative_base, sessionmaker, relationship
+from sqlalchemy.dialects.postgresql import insert
 
 # -------------------------------------------------------------------
 # Configuration
@@ -42,9 +49,16 @@ class ChatSession(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     is_active = Column(Boolean, default=True)
+    message_count = Column(Integer, nullable=False, default=0, server_default="0")  # Kept by the save functions
+    last_message_at = Column(DateTime)
     
     # Relationships
     messages = relationship("ChatMessage", back_populates="chat_session", cascade="all, delete-orphan")
+    
+    # Serves the sidebar listing: one module's active sessions, newest first
+    __table_args__ = (
+        Index("ix_chat_sessions_module_active_updated", "module", "is_active", "updated_at"),
+    )
 
 class ChatMessage(Base):
     __tablename__ = "chat_messages"
@@ -58,6 +72,10 @@ class ChatMessage(Base):
     
     # Relationships
     chat_session = relationship("ChatSession", back_populates="messages")
+    
+    __table_args__ = (
+        Index("ix_chat_messages_session_created", "session_id", "created_at"),
+    )
 
 # -------------------------------------------------------------------
 # Existing Tables
@@ -70,12 +88,22 @@ class Sales(Base):
     units_sold = Column(Integer, nullable=False)
     revenue    = Column(Numeric(10, 2), nullable=False)
 
+    # The primary key leads with date; these serve equality filters on a dimension plus a date range
+    __table_args__ = (
+        Index("ix_sales_region_date", "region", "date"),
+        Index("ix_sales_product_date", "product", "date"),
+    )
+
 class Churn(Base):
     __tablename__ = "churn"
     month             = Column(Date, primary_key=True)
     segment           = Column(Text, primary_key=True)
     churned_customers = Column(Integer, nullable=False)
 
+    __table_args__ = (
+        Index("ix_churn_segment_month", "segment", "month"),
+    )
+
 # -------------------------------------------------------------------
 # Tables for Use Case #1
 # -------------------------------------------------------------------
@@ -101,6 +129,53 @@ class IncidentKB(Base):
     root_cause_ar = Column(Text, nullable=False)
     resolution_ar = Column(Text, nullable=False)
 
+# -------------------------------------------------------------------
+# Data Versions (bumped by loaders, invalidates cached query results)
+# -------------------------------------------------------------------
+class DataVersion(Base):
+    __tablename__ = "data_versions"
+    table_name = Column(Text, primary_key=True)
+    version    = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+def bump_data_version(db, *table_names: str):
+    """Mark tables as changed so cached results computed from them are no longer served"""
+    for table_name in table_names:
+        stmt = insert(DataVersion).values(table_name=table_name, version=1, updated_at=datetime.utcnow())
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=[DataVersion.table_name],
+            set_={"version": DataVersion.version + 1, "updated_at": datetime.utcnow()}
+        ))
+    db.commit()
+
+def get_data_versions(db, table_names) -> dict:
+    """Current version of each table (0 for tables no loader has bumped yet)"""
+    rows = db.query(DataVersion.table_name, DataVersion.version).filter(
+        DataVersion.table_name.in_(list(table_names))
+    ).all()
+    versions = {table_name: 0 for table_name in table_names}
+    versions.update({row.table_name: row.version for row in rows})
+    return versions
+
+# -------------------------------------------------------------------
+# Rollup Freshness (written by rollups.refresh_rollups)
+# -------------------------------------------------------------------
+class RollupState(Base):
+    __tablename__ = "rollup_state"
+    rollup_name    = Column(Text, primary_key=True)
+    source_table   = Column(Text, nullable=False)
+    source_version = Column(Integer, nullable=False)  # Data version of the source the rollup was built from
+    row_count      = Column(Integer, nullable=False)
+    refresh_ms     = Column(Integer, nullable=False)
+    refreshed_at   = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+def get_fresh_rollups(db) -> set:
+    """Rollups built from the current data version of their source table"""
+    rows = db.query(RollupState.rollup_name, RollupState.source_version, DataVersion.version).outerjoin(
+        DataVersion, DataVersion.table_name == RollupState.source_table
+    ).all()
+    return {row.rollup_name for row in rows if row.source_version == (row.version or 0)}
+
 # -------------------------------------------------------------------
 # Chat Session Management Functions
 # -------------------------------------------------------------------
@@ -126,6 +201,9 @@ def save_chat_session(db, session_id: str, title: str, module: str, messages: li
         # Delete existing messages for this session
         db.query(ChatMessage).filter(ChatMessage.session_id == session_id).delete()
         
+        chat_session.message_count = len(messages)
+        chat_session.last_message_at = datetime.utcnow() if messages else None
+        
         # Add messages
         for msg in messages:
             message = ChatMessage(
@@ -145,8 +223,89 @@ def save_chat_session(db, session_id: str, title: str, module: str, messages: li
         print(f"Error saving chat session: {str(e)}")
         return False
 
-def load_chat_session(db, session_id: str):
-    """Load a specific chat session with its messages"""
+def append_chat_messages(db, session_id: str, title: str, module: str, messages: list):
+    """Insert new messages of a chat session and upsert the session row, in one transaction.
+
+    Only `messages` are written; rows already stored under the same message id are
+    left alone, so retrying after a failure is safe.
+    """
+    return append_chat_batch(db, [{"session_id": session_id, "title": title, "module": module, "messages": messages}])
+
+def append_chat_batch(db, sessions: list):
+    """append_chat_messages for several sessions ({session_id, title, module, messages}) in one transaction"""
+    try:
+        now = datetime.utcnow()
+        rows = []
+        for chat in sessions:
+            db.execute(insert(ChatSession).values(
+                session_id=chat["session_id"], title=chat["title"], module=chat["module"],
+                created_at=now, updated_at=now, is_active=True
+            ).on_conflict_do_update(
+                index_elements=[ChatSession.session_id], set_={"title": chat["title"], "updated_at": now}
+            ))
+            rows.extend(
+                {
+                    "message_id": msg.get("id", str(uuid.uuid4())),
+                    "session_id": chat["session_id"],
+                    "role": msg["role"],
+                    "content": msg["content"],
+                    "message_metadata": msg.get("metadata", {}),
+                    "created_at": msg.get("timestamp"),
+                }
+                for msg in chat["messages"]
+            )
+        if rows:
+            # Messages are ordered by created_at, so untimed ones in a batch must not share one timestamp
+            for i, row in enumerate(rows):
+                row["created_at"] = row["created_at"] or now + timedelta(microseconds=i)
+            inserted = db.execute(
+                insert(ChatMessage).values(rows)
+                .on_conflict_do_nothing(index_elements=[ChatMessage.message_id])
+                .returning(ChatMessage.session_id, ChatMessage.created_at)
+            ).all()
+            # Count only messages that weren't stored already, so retries keep the counters right
+            summary = {}
+            for row in inserted:
+                count, last = summary.get(row.session_id, (0, row.created_at))
+                summary[row.session_id] = (count + 1, max(last, row.created_at))
+            for session_id, (count, last) in summary.items():
+                db.execute(update(ChatSession).where(ChatSession.session_id == session_id).values(
+                    message_count=ChatSession.message_count + count,
+                    last_message_at=func.greatest(func.coalesce(ChatSession.last_message_at, last), last),
+                    updated_at=now
+                ))
+        db.commit()
+        return True
+
+    except Exception as e:
+        db.rollback()
+        print(f"Error saving chat messages: {str(e)}")
+        return False
+
+def load_chat_messages(db, session_id: str, limit: int = None, before: tuple = None):
+    """Messages of a session in order, optionally only the latest `limit` before a (created_at, message_id) cursor.
+
+    Returns the messages and whether earlier ones exist.
+    """
+    query = db.query(ChatMessage).filter(ChatMessage.session_id == session_id)
+    if before:
+        query = query.filter(tuple_(ChatMessage.created_at, ChatMessage.message_id) < tuple_(*before))
+    query = query.order_by(ChatMessage.created_at.desc(), ChatMessage.message_id.desc())
+    messages = query.limit(limit + 1).all() if limit else query.all()
+    has_earlier = bool(limit) and len(messages) > limit
+    return [
+        {
+            "id": msg.message_id,
+            "role": msg.role,
+            "content": msg.content,
+            "timestamp": msg.created_at,
+            "metadata": msg.message_metadata or {}
+        }
+        for msg in reversed(messages[:limit] if limit else messages)
+    ], has_earlier
+
+def load_chat_session(db, session_id: str, limit: int = None):
+    """Load a specific chat session with its messages (the latest `limit` if given)"""
     try:
         chat_session = db.query(ChatSession).filter(ChatSession.session_id == session_id).first()
         
@@ -154,9 +313,7 @@ def load_chat_session(db, session_id: str):
             return None
         
         # Load messages
-        messages = db.query(ChatMessage).filter(
-            ChatMessage.session_id == session_id
-        ).order_by(ChatMessage.created_at).all()
+        messages, has_earlier = load_chat_messages(db, session_id, limit)
         
         return {
             "session_id": chat_session.session_id,
@@ -164,16 +321,8 @@ def load_chat_session(db, session_id: str):
             "module": chat_session.module,
             "created_at": chat_session.created_at,
             "updated_at": chat_session.updated_at,
-            "messages": [
-                {
-                    "id": msg.message_id,
-                    "role": msg.role,
-                    "content": msg.content,
-                    "timestamp": msg.created_at,
-                    "metadata": msg.message_metadata or {}
-                }
-                for msg in messages
-            ]
+            "messages": messages,
+            "has_earlier_messages": has_earlier
         }
     
     except Exception as e:
@@ -197,7 +346,8 @@ def load_all_chat_sessions(db, module: str = None):
                 "module": chat.module,
                 "created_at": chat.created_at,
                 "updated_at": chat.updated_at,
-                "message_count": len(chat.messages)
+                "message_count": chat.message_count,
+                "last_message_at": chat.last_message_at
             }
         
         return result
@@ -206,6 +356,41 @@ def load_all_chat_sessions(db, module: str = None):
         print(f"Error loading chat sessions: {str(e)}")
         return {}
 
+def list_chat_sessions(db, module: str = None, limit: int = 5, cursor: tuple = None):
+    """One page of active chat sessions, newest first, and the cursor of the next page.
+
+    `cursor` is the (updated_at, session_id) of the last session of the previous
+    page; the next cursor is None on the last page.
+    """
+    try:
+        query = db.query(ChatSession).filter(ChatSession.is_active == True)
+        
+        if module:
+            query = query.filter(ChatSession.module == module)
+        if cursor:
+            query = query.filter(tuple_(ChatSession.updated_at, ChatSession.session_id) < tuple_(*cursor))
+        
+        chat_sessions = query.order_by(ChatSession.updated_at.desc(), ChatSession.session_id.desc()).limit(limit + 1).all()
+        
+        page = [
+            {
+                "session_id": chat.session_id,
+                "title": chat.title,
+                "module": chat.module,
+                "created_at": chat.created_at,
+                "updated_at": chat.updated_at,
+                "message_count": chat.message_count,
+                "last_message_at": chat.last_message_at
+            }
+            for chat in chat_sessions[:limit]
+        ]
+        next_cursor = (page[-1]["updated_at"], page[-1]["session_id"]) if len(chat_sessions) > limit else None
+        return page, next_cursor
+    
+    except Exception as e:
+        print(f"Error listing chat sessions: {str(e)}")
+        return [], None
+
 def delete_chat_session(db, session_id: str):
     """Soft delete a chat session"""
     try:
@@ -230,6 +415,34 @@ def init_db():
     Create all tables in the database.
     """
     Base.metadata.create_all(bind=engine)
+    # create_all skips tables that already exist, so add columns and indexes declared since they were created
+    add_missing_columns()
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+def add_missing_columns():
+    """Add declared columns that existing tables lack, backfilling the chat session counters"""
+    added = set()
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspect(conn).get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                default = f" DEFAULT {column.server_default.arg}" if column.server_default is not None else ""
+                not_null = " NOT NULL" if not column.nullable and default else ""
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}{default}{not_null}"))
+                added.add(f"{table.name}.{column.name}")
+                print(f"✅ Added {table.name}.{column.name}")
+        
+        if "chat_sessions.message_count" in added:
+            conn.execute(text(
+                """UPDATE chat_sessions SET
+                       message_count = (SELECT COUNT(*) FROM chat_messages m WHERE m.session_id = chat_sessions.session_id),
+                       last_message_at = (SELECT MAX(created_at) FROM chat_messages m WHERE m.session_id = chat_sessions.session_id)"""
+            ))
 
 
 # -------------------------------------------------------------------
@@ -0,0 +1,275 @@
+import re
+from datetime import date, timedelta
+
+from query_cache import normalize_question, term_pattern
+
+# -------------------------------------------------------------------
+# Vocabulary (English and Arabic, matched on normalized text)
+# -------------------------------------------------------------------
+# Terms whose meaning depends on the current date. Bare demonstratives ("this product")
+# aren't dates; "this month" and the like are caught as RELATIVE_PHRASES.
+RELATIVE_DATE_PATTERN = re.compile(
+    r'\b(today|yesterday|tomorrow|last|previous|next|current|recent|ytd|mtd|qtd|ago|past)\b'
+    r'|(?<!\w)[وف]?[بكل]?(?:ال)?(اليوم|امس|غدا|الماضي|الماضيه|الحالي|الحاليه|القادم|السابق|الاخير|منذ)(?!\w)',
+)
+
+# Phrase id → spellings; each id has a resolver in _resolve_phrase, except
+# "same_period_last_year", which shifts the question's other period back a year
+RELATIVE_PHRASES = {
+    "today": ["today", "اليوم"],
+    "yesterday": ["yesterday", "امس", "البارحه"],
+    "this_week": ["this week", "current week", "هذا الاسبوع", "الاسبوع الحالي"],
+    "last_week": ["last week", "previous week", "الاسبوع الماضي", "الاسبوع السابق"],
+    "this_month": ["this month", "current month", "هذا الشهر", "الشهر الحالي"],
+    "last_month": ["last month", "previous month", "الشهر الماضي", "الشهر السابق"],
+    "month_to_date": ["month to date", "mtd", "منذ بدايه الشهر"],
+    "this_quarter": ["this quarter", "current quarter", "هذا الربع", "الربع الحالي"],
+    "last_quarter": ["last quarter", "previous quarter", "الربع الماضي", "الربع السابق"],
+    "quarter_to_date": ["quarter to date", "qtd", "منذ بدايه الربع"],
+    "this_year": ["this year", "current year", "هذا العام", "هذه السنه", "العام الحالي", "السنه الحاليه"],
+    "last_year": ["last year", "previous year", "العام الماضي", "السنه الماضيه", "العام السابق"],
+    "year_to_date": ["year to date", "ytd", "منذ بدايه العام", "منذ بدايه السنه"],
+    "same_period_last_year": [
+        "same period last year", "same period of last year", "نفس الفتره من العام الماضي", "نفس الفتره من السنه الماضيه",
+    ],
+}
+
+# "last 3 months", "past 30 days", "اخر 3 اشهر"
+TRAILING_PATTERN = re.compile(
+    r'\b(?:last|past|previous)\s+(\d+)\s+(day|week|month|year)s?\b'
+    r'|(?:اخر|الاخيره)\s+(\d+)\s+(يوم|ايام|اسبوع|اسابيع|شهر|اشهر|شهور|سنه|سنوات)'
+)
+ARABIC_UNITS = {
+    "يوم": "day", "ايام": "day", "اسبوع": "week", "اسابيع": "week",
+    "شهر": "month", "اشهر": "month", "شهور": "month", "سنه": "year", "سنوات": "year",
+}
+
+# -------------------------------------------------------------------
+# Calendar helpers
+# -------------------------------------------------------------------
+def add_months(day: date, months: int) -> date:
+    """First day of the month `months` away from `day`'s month"""
+    index = day.year * 12 + day.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+def quarter_start(day: date) -> date:
+    return date(day.year, 3 * ((day.month - 1) // 3) + 1, 1)
+
+def _one_year_earlier(day: date) -> date:
+    try:
+        return day.replace(year=day.year - 1)
+    except ValueError:  # 29 February
+        return day.replace(year=day.year - 1, day=28)
+
+def _quarter_label(start: date) -> str:
+    return f"Q{(start.month - 1) // 3 + 1} {start.year}"
+
+def _period_label(start: date, end: date, granularity: str) -> str:
+    """Readable label of a half-open period"""
+    if granularity == "day":
+        return start.isoformat()
+    if granularity == "week":
+        return f"week of {start.isoformat()}"
+    if granularity == "month":
+        return start.strftime("%B %Y")
+    if granularity == "quarter":
+        return _quarter_label(start)
+    if granularity == "year":
+        return str(start.year)
+    return f"{start.isoformat()} to {(end - timedelta(days=1)).isoformat()}"
+
+def _resolve_phrase(phrase_id: str, today: date) -> tuple:
+    """(start, end, granularity, label) of a relative phrase; ranges are half-open"""
+    tomorrow = today + timedelta(days=1)
+    month = today.replace(day=1)
+    quarter = quarter_start(today)
+    year = date(today.year, 1, 1)
+    week = today - timedelta(days=today.weekday())
+    to_date = f"{{}} to {today.isoformat()}"
+
+    if phrase_id == "today":
+        return today, tomorrow, "day", today.isoformat()
+    if phrase_id == "yesterday":
+        return today - timedelta(days=1), today, "day", (today - timedelta(days=1)).isoformat()
+    if phrase_id == "this_week":
+        return week, week + timedelta(days=7), "week", f"week of {week.isoformat()}"
+    if phrase_id == "last_week":
+        return week - timedelta(days=7), week, "week", f"week of {(week - timedelta(days=7)).isoformat()}"
+    if phrase_id == "this_month":
+        return month, add_months(month, 1), "month", month.strftime("%B %Y")
+    if phrase_id == "last_month":
+        return add_months(month, -1), month, "month", add_months(month, -1).strftime("%B %Y")
+    if phrase_id == "month_to_date":
+        return month, tomorrow, "range", to_date.format(month.isoformat())
+    if phrase_id == "this_quarter":
+        return quarter, add_months(quarter, 3), "quarter", _quarter_label(quarter)
+    if phrase_id == "last_quarter":
+        return add_months(quarter, -3), quarter, "quarter", _quarter_label(add_months(quarter, -3))
+    if phrase_id == "quarter_to_date":
+        return quarter, tomorrow, "range", to_date.format(quarter.isoformat())
+    if phrase_id == "this_year":
+        return year, date(today.year + 1, 1, 1), "year", str(today.year)
+    if phrase_id == "last_year":
+        return date(today.year - 1, 1, 1), year, "year", str(today.year - 1)
+    if phrase_id == "year_to_date":
+        return year, tomorrow, "range", to_date.format(year.isoformat())
+    raise ValueError(f"Unknown relative phrase: {phrase_id}")
+
+def _resolve_trailing(count: int, unit: str, today: date) -> tuple:
+    """The `count` complete units before the current one ("last 3 months" ends with last month)"""
+    if unit == "day":
+        start, end = today - timedelta(days=count), today
+    elif unit == "week":
+        end = today - timedelta(days=today.weekday())
+        start = end - timedelta(days=7 * count)
+    elif unit == "month":
+        end = today.replace(day=1)
+        start = add_months(end, -count)
+    else:
+        end = date(today.year, 1, 1)
+        start = date(today.year - count, 1, 1)
+    return start, end, "range", f"{start.isoformat()} to {(end - timedelta(days=1)).isoformat()}"
+
+# -------------------------------------------------------------------
+# Resolution
+# -------------------------------------------------------------------
+def _spans(text: str, term: str) -> list:
+    return [m.span() for m in re.finditer(term_pattern(normalize_question(term)), text)]
+
+def resolve_relative_periods(text: str, today: date) -> list:
+    """Relative periods in normalized question text, in order of appearance.
+
+    Longer phrases win over the shorter ones inside them ("same period last year"
+    over "last year"). Each period is a dict with the phrase id, half-open
+    [start, end) dates, granularity, a readable label and the numbers it consumed.
+    """
+    found = []
+    taken = [False] * len(text)
+
+    def claim(span: tuple) -> bool:
+        if any(taken[span[0]:span[1]]):
+            return False
+        taken[span[0]:span[1]] = [True] * (span[1] - span[0])
+        return True
+
+    for match in TRAILING_PATTERN.finditer(text):
+        count = int(match.group(1) or match.group(3))
+        unit = match.group(2) or ARABIC_UNITS[match.group(4)]
+        if count and claim(match.span()):
+            start, end, granularity, label = _resolve_trailing(count, unit, today)
+            found.append((match.start(), {
+                "phrase": f"last_{count}_{unit}s", "start": start, "end": end,
+                "granularity": granularity, "label": label, "numbers": [str(count)],
+            }))
+
+    terms = sorted(
+        ((term, phrase_id) for phrase_id, spellings in RELATIVE_PHRASES.items() for term in spellings),
+        key=lambda item: -len(item[0])
+    )
+    for term, phrase_id in terms:
+        for span in _spans(text, term):
+            if claim(span):
+                if phrase_id == "same_period_last_year":
+                    found.append((span[0], {"phrase": phrase_id, "numbers": []}))
+                    continue
+                start, end, granularity, label = _resolve_phrase(phrase_id, today)
+                found.append((span[0], {
+                    "phrase": phrase_id, "start": start, "end": end,
+                    "granularity": granularity, "label": label, "numbers": [],
+                }))
+
+    periods = [period for _, period in sorted(found, key=lambda item: item[0])]
+    resolved = []
+    for i, period in enumerate(periods):
+        if period["phrase"] != "same_period_last_year":
+            resolved.append(period)
+            continue
+        # "same period last year" is the question's other period shifted back a year,
+        # preferring the one mentioned before it; without one it is left unresolved
+        anchors = [other for other in periods[:i][::-1] + periods[i + 1:] if "start" in other]
+        if not anchors:
+            continue
+        anchor = anchors[0]
+        start, end = _one_year_earlier(anchor["start"]), _one_year_earlier(anchor["end"])
+        resolved.append({
+            **period, "start": start, "end": end, "granularity": anchor["granularity"],
+            "label": _period_label(start, end, anchor["granularity"]),
+        })
+    return resolved
+
+class DateContext:
+    """Relative dates of one question, resolved once against a fixed `today`.
+
+    Prompts, templates, cache keys and query parameters all read from the same
+    instance, so "last month" means the same range everywhere in a request.
+    """
+
+    def __init__(self, question: str, today: date = None):
+        self.today = today or date.today()
+        text = normalize_question(question)
+        self.periods = resolve_relative_periods(text, self.today)
+        self.has_relative_terms = bool(self.periods or RELATIVE_DATE_PATTERN.search(text))
+
+    @property
+    def params(self) -> dict:
+        """Bind parameters of the resolved periods (period_0_start, period_0_end, ...)"""
+        params = {}
+        for i, period in enumerate(self.periods):
+            params[f"period_{i}_start"] = period["start"]
+            params[f"period_{i}_end"] = period["end"]
+        return params
+
+    @property
+    def key(self) -> str:
+        """Date context a question's SQL depends on, for cache keys.
+
+        Resolved periods reach the SQL as bind parameters, so their SQL is valid on any
+        day and is keyed by phrase. Relative terms that couldn't be resolved scope the
+        entry to today; questions without relative terms share one entry.
+        """
+        if not self.has_relative_terms:
+            return "absolute"
+        if self.periods:
+            return "relative:" + ",".join(period["phrase"] for period in self.periods)
+        return self.today.isoformat()
+
+    def bind_params(self, sql: str) -> dict:
+        """The period parameters a query actually references"""
+        return {name: value for name, value in self.params.items() if re.search(rf':{name}\b', sql)}
+
+    def sql_is_portable(self, sql: str) -> bool:
+        """True if the SQL uses every period parameter, so it stays correct on later days"""
+        return all(re.search(rf':{name}\b', sql) for name in self.params)
+
+    def _today_lines(self) -> list:
+        return [
+            f"- Today's date: {self.today.isoformat()} ({self.today.strftime('%A')})",
+            f"- Current month: {self.today.strftime('%B %Y')}",
+            f"- Current quarter: {_quarter_label(quarter_start(self.today))}",
+        ]
+
+    def describe(self) -> str:
+        """Today's date and the resolved periods, for answer prompts"""
+        lines = self._today_lines()
+        for period in self.periods:
+            last_day = period["end"] - timedelta(days=1)
+            lines.append(
+                f"- \"{period['phrase'].replace('_', ' ')}\" = {period['label']} "
+                f"({period['start'].isoformat()} to {last_day.isoformat()})"
+            )
+        return "\n".join(lines)
+
+    def prompt_block(self) -> str:
+        """Date context for SQL prompts: resolved periods come with their bind parameters"""
+        lines = self._today_lines()
+        if self.periods:
+            lines.append(
+                "- Relative periods in this question are already resolved. Filter the table's date column "
+                "(sales.date, churn.month) with these bind parameters exactly as written, never with literal dates:"
+            )
+            for i, period in enumerate(self.periods):
+                lines.append(
+                    f"    * \"{period['phrase'].replace('_', ' ')}\" ({period['label']}) → "
+                    f"<date column> >= :period_{i}_start AND <date column> < :period_{i}_end"
+                )
+        return "\n".join(lines)
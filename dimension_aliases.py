@@ -0,0 +1,51 @@
+import re
+
+from query_cache import normalize_question
+from sql_templates import DIMENSION_VALUES
+
+# -------------------------------------------------------------------
+# Alias keys
+# -------------------------------------------------------------------
+def alias_key(value) -> str:
+    """Spelling-insensitive key of a dimension value.
+
+    Case, spacing, punctuation, Arabic letter variants and the Arabic article "ال"
+    are ignored, so "Product A", "product_a" and "PRODUCT  A" share a key, as do
+    "الشمالية" and "شماليه".
+    """
+    words = normalize_question(str(value)).split()
+    words = [word[2:] if word.startswith("ال") and len(word) > 4 else word for word in words]
+    return re.sub(r'[\W_]+', "", "".join(words))
+
+def build_alias_map(values_by_column: dict) -> dict:
+    """column → {alias key → canonical values} for the catalogued values of each dimension.
+
+    Every catalogued value is reachable through its own key and through the English
+    and Arabic spellings the vocabulary lists for it. Values the database doesn't hold
+    get no aliases, so a rewrite can never point a filter at a value that isn't there.
+    """
+    alias_map = {}
+    for column, values in values_by_column.items():
+        if not values:
+            continue
+        aliases = {}
+        for value in values:
+            aliases.setdefault(alias_key(value), []).append(value)
+        for canonical, spellings in DIMENSION_VALUES.get(column, {}).items():
+            targets = aliases.get(alias_key(canonical), [])
+            for spelling in spellings if targets else []:
+                resolved = aliases.setdefault(alias_key(spelling), [])
+                resolved.extend(value for value in targets if value not in resolved)
+        alias_map[column] = aliases
+    return alias_map
+
+def resolve_alias(alias_map: dict, column: str, text: str) -> list:
+    """Canonical values a user-facing spelling of a dimension value stands for"""
+    return list(alias_map.get(column, {}).get(alias_key(text), []))
+
+def column_values(alias_map: dict, column: str) -> list:
+    """Every canonical value of a dimension column"""
+    values = []
+    for targets in alias_map.get(column, {}).values():
+        values.extend(value for value in targets if value not in values)
+    return values
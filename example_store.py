@@ -0,0 +1,142 @@
+import os
+import re
+import math
+import time
+import uuid
+import hashlib
+import threading
+from pathlib import Path
+
+from qdrant_client import QdrantClient, models
+
+import metrics
+from query_cache import normalize_question, fingerprint
+
+# -------------------------------------------------------------------
+# Configuration
+# -------------------------------------------------------------------
+EXAMPLE_STORE_PATH = Path(os.getenv("EXAMPLE_STORE_PATH", ".cache/qdrant"))
+EXAMPLE_COLLECTION = "question_sql_examples"
+EXAMPLE_TOP_K = int(os.getenv("EXAMPLE_TOP_K", "3"))
+EXAMPLE_MIN_SCORE = float(os.getenv("EXAMPLE_MIN_SCORE", "0.35"))  # Below this an example is just noise
+EXAMPLE_REUSE_THRESHOLD = float(os.getenv("EXAMPLE_REUSE_THRESHOLD", "0.97"))
+EMBEDDING_DIM = 1024
+
+EXAMPLE_NAMESPACE = uuid.UUID("6f1d8a52-3c1e-4a8e-9d0b-5b7e2f4c9a11")
+
+# -------------------------------------------------------------------
+# Hashing vectorizer (local, no network or model download)
+# -------------------------------------------------------------------
+def _features(text: str) -> list:
+    """Word unigrams, word bigrams and character trigrams of a normalized question"""
+    words = re.findall(r'\w+', normalize_question(text))
+    features = [f"w:{w}" for w in words]
+    features += [f"b:{a}_{b}" for a, b in zip(words, words[1:])]
+    for word in words:
+        padded = f" {word} "
+        features += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+    return features
+
+def embed(text: str) -> list:
+    """Signed feature hashing into a fixed-size, L2-normalized vector"""
+    vector = [0.0] * EMBEDDING_DIM
+    for feature in _features(text):
+        digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+        bucket = int.from_bytes(digest[:4], "little") % EMBEDDING_DIM
+        sign = 1.0 if digest[4] & 1 else -1.0
+        # Whole words carry more signal than character trigrams
+        vector[bucket] += sign * (1.0 if feature[0] == "c" else 2.0)
+    norm = math.sqrt(sum(v * v for v in vector))
+    return [v / norm for v in vector] if norm else vector
+
+# -------------------------------------------------------------------
+# Example store
+# -------------------------------------------------------------------
+class ExampleStore:
+    """Past successful question→SQL pairs in an embedded, on-disk Qdrant collection"""
+
+    def __init__(self, path: Path = EXAMPLE_STORE_PATH):
+        Path(path).mkdir(parents=True, exist_ok=True)
+        self.client = QdrantClient(path=str(path))
+        # The local-mode client is not safe for concurrent use
+        self._lock = threading.Lock()
+        if not self.client.collection_exists(EXAMPLE_COLLECTION):
+            self.client.create_collection(
+                collection_name=EXAMPLE_COLLECTION,
+                vectors_config=models.VectorParams(size=EMBEDDING_DIM, distance=models.Distance.COSINE),
+            )
+
+    def add(self, question: str, english_question: str, sql: str, execution_status: str,
+            schema_info: str, date_context: str):
+        """Index a successful question→SQL pair (re-asking a question replaces its entry)"""
+        schema_version = fingerprint(schema_info)
+        point_id = str(uuid.uuid5(
+            EXAMPLE_NAMESPACE, f"{normalize_question(question)}|{schema_version}|{date_context}"
+        ))
+        with self._lock:
+            self.client.upsert(
+                collection_name=EXAMPLE_COLLECTION,
+                points=[models.PointStruct(
+                    id=point_id,
+                    vector=embed(question),
+                    payload={
+                        "question": question,
+                        "english_question": english_question,
+                        "sql": sql,
+                        "execution_status": execution_status,
+                        "schema_version": schema_version,
+                        "date_context": date_context,
+                        "created_at": time.time(),
+                    },
+                )],
+            )
+        metrics.incr("example_store.indexed")
+
+    def search(self, question: str, schema_info: str, limit: int = EXAMPLE_TOP_K) -> list:
+        """Nearest past examples for the current schema, best first, each with its score"""
+        with self._lock:
+            result = self.client.query_points(
+                collection_name=EXAMPLE_COLLECTION,
+                query=embed(question),
+                query_filter=models.Filter(must=[
+                    models.FieldCondition(
+                        key="schema_version", match=models.MatchValue(value=fingerprint(schema_info))
+                    )
+                ]),
+                limit=limit,
+                with_payload=True,
+            )
+        examples = [
+            {**point.payload, "score": point.score}
+            for point in result.points
+            if point.score >= EXAMPLE_MIN_SCORE
+        ]
+        metrics.incr("example_store.searches")
+        if examples:
+            metrics.observe("example_store.top_score", examples[0]["score"])
+        return examples
+
+def find_reusable_example(examples: list, question: str, date_context: str) -> dict | None:
+    """Top example if it is near-identical and was resolved against the same date context.
+
+    Numbers (years, days) barely move the similarity score but change the answer, so
+    they must match exactly for the SQL to be reused.
+    """
+    if not examples:
+        return None
+    top = examples[0]
+    same_numbers = re.findall(r'\d+', normalize_question(top["question"])) == re.findall(r'\d+', normalize_question(question))
+    if top["score"] >= EXAMPLE_REUSE_THRESHOLD and top["date_context"] == date_context and same_numbers:
+        metrics.incr("example_store.reused")
+        return top
+    return None
+
+def format_examples_for_prompt(examples: list) -> str:
+    """Render retrieved examples as a few-shot block for the SQL prompt"""
+    if not examples:
+        return ""
+    lines = ["Similar past questions and the SQL that answered them correctly:"]
+    for example in examples:
+        lines.append(f"Q: {example['english_question'] or example['question']}")
+        lines.append(f"SQL: {example['sql']}")
+    return "\n".join(lines)
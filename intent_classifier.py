@@ -0,0 +1,116 @@
+import os
+import re
+
+import metrics
+from query_cache import normalize_question, term_pattern
+from sql_templates import METRIC_TERMS, DIMENSION_TERMS, DIMENSION_VALUES, MONTHS, BUSINESS_GLOSSARY
+
+# -------------------------------------------------------------------
+# Configuration
+# -------------------------------------------------------------------
+INTENT_CONFIDENCE_THRESHOLD = float(os.getenv("INTENT_CONFIDENCE_THRESHOLD", "0.8"))
+
+# -------------------------------------------------------------------
+# Lexicons (English and Arabic, matched on normalized text)
+# -------------------------------------------------------------------
+SCHEMA_TERMS = [
+    "sales", "churn", "date", "month", "region", "product", "segment", "units_sold", "revenue",
+    "churned_customers", "year", "quarter", "q1", "q2", "q3", "q4",
+]
+
+DATA_TERMS = [
+    "data", "total", "sum", "how many", "how much", "count", "show", "list", "report", "top",
+    "highest", "lowest", "most", "least", "growth", "trend", "average", "customers", "performance",
+    "بيانات", "اجمالي", "مجموع", "كم", "اعرض", "اظهر", "تقرير", "اعلي", "اقل", "نمو", "العملاء",
+    "عملاء", "اداء", "الربع", "الشهر", "السنه", "العام", "متوسط",
+]
+
+GREETING_TERMS = [
+    "hi", "hello", "hey", "good morning", "good afternoon", "good evening", "how are you", "thanks",
+    "thank you", "bye", "goodbye", "who are you", "what can you do",
+    "مرحبا", "اهلا", "السلام عليكم", "صباح الخير", "مساء الخير", "كيف حالك", "شكرا", "مع السلامه",
+    "من انت", "ماذا تستطيع",
+]
+
+# Tables, metrics and dimensions; generic DATA_TERMS ("show", "how many", "كم") alone
+# could be about anything, so a confident data_query needs one of these as well
+DOMAIN_TERMS = ["sales", "churn", "region", "product", "segment", "units_sold", "revenue", "churned_customers"]
+
+IRRELEVANT_TERMS = [
+    "weather", "football", "soccer", "match", "matches", "movie", "movies", "film", "films", "song", "songs",
+    "music", "recipe", "recipes", "cook", "joke", "jokes", "poem", "poems", "news", "politics", "game", "games",
+    "travel", "flight", "flights", "hotel", "hotels", "goal", "goals", "singer", "singers", "actor", "actors",
+    "الطقس", "كره القدم", "مباراه", "فيلم", "اغنيه", "موسيقي", "وصفه", "طبخ", "نكته", "قصيده",
+    "اخبار", "سياسه", "لعبه", "سفر", "رحله", "فندق",
+]
+
+def _lexicon(*groups) -> list:
+    terms = []
+    for group in groups:
+        terms.extend(normalize_question(term) for term in group)
+    return sorted(set(terms))
+
+DATA_LEXICON = _lexicon(
+    SCHEMA_TERMS, DATA_TERMS, BUSINESS_GLOSSARY, BUSINESS_GLOSSARY.values(),
+    *METRIC_TERMS.values(),
+    *(terms["singular"] + terms["plural"] for terms in DIMENSION_TERMS.values()),
+    *(spellings for values in DIMENSION_VALUES.values() for spellings in values.values()),
+    *MONTHS.values(),
+)
+DOMAIN_LEXICON = _lexicon(
+    DOMAIN_TERMS, *METRIC_TERMS.values(),
+    *(terms["singular"] + terms["plural"] for terms in DIMENSION_TERMS.values()),
+    *(spellings for values in DIMENSION_VALUES.values() for spellings in values.values()),
+)
+GREETING_LEXICON = _lexicon(GREETING_TERMS)
+IRRELEVANT_LEXICON = _lexicon(IRRELEVANT_TERMS)
+
+def _count_hits(text: str, lexicon: list) -> int:
+    return sum(1 for term in lexicon if re.search(term_pattern(term), text))
+
+# -------------------------------------------------------------------
+# Classification
+# -------------------------------------------------------------------
+def classify_intent_locally(question: str) -> tuple:
+    """Rule-based intent with a confidence score in [0, 1].
+
+    Confident when exactly one lexicon matches; mixed or empty evidence (e.g. a bare
+    "why?" that depends on the conversation) gets a low score, and so does a data
+    question that names no table, metric or dimension ("how many goals...").
+    """
+    text = normalize_question(question)
+    data_hits = _count_hits(text, DATA_LEXICON) + len(re.findall(r'\b20\d{2}\b', text))
+    greeting_hits = _count_hits(text, GREETING_LEXICON)
+    irrelevant_hits = _count_hits(text, IRRELEVANT_LEXICON)
+    domain_hits = _count_hits(text, DOMAIN_LEXICON)
+    word_count = len(text.split())
+
+    if data_hits and not domain_hits and not irrelevant_hits:
+        return "data_query", 0.5
+    if data_hits and not greeting_hits and not irrelevant_hits:
+        return "data_query", min(0.99, 0.8 + 0.07 * data_hits)
+    if greeting_hits and not data_hits and not irrelevant_hits:
+        # Long messages that open with a greeting usually carry another request
+        return "greeting", 0.95 if word_count <= 6 else 0.6
+    if irrelevant_hits and not data_hits:
+        return "irrelevant", min(0.95, 0.75 + 0.1 * irrelevant_hits)
+    if data_hits and greeting_hits and not irrelevant_hits:
+        # "Hi, what were sales last month?" is a data question
+        return "data_query", 0.85 if data_hits >= 2 else 0.6
+
+    return "data_query", 0.3
+
+def decide_intent(question: str, threshold: float = INTENT_CONFIDENCE_THRESHOLD) -> str | None:
+    """Local intent when confident enough, otherwise None so the caller asks the LLM"""
+    intent, confidence = classify_intent_locally(question)
+    metrics.observe("intent.local_confidence", confidence)
+    if confidence >= threshold:
+        metrics.incr("intent.local_decisions")
+        metrics.incr(f"intent.local.{intent}")
+        return intent
+    metrics.incr("intent.llm_fallbacks")
+    return None
+
+def fallback_rate() -> float:
+    """Share of questions the local classifier handed to the LLM"""
+    return metrics.ratio("intent.llm_fallbacks", ["intent.llm_fallbacks", "intent.local_decisions"])
@@ -0,0 +1,241 @@
+import os
+import re
+import math
+import json
+import time
+import random
+import hashlib
+import itertools
+import threading
+from pathlib import Path
+from types import SimpleNamespace
+
+# -------------------------------------------------------------------
+# Configuration
+# -------------------------------------------------------------------
+LLM_BACKEND = os.getenv("LLM_BACKEND", "cohere")  # cohere | stub
+LLM_MODEL = os.getenv("LLM_MODEL", "command-r-08-2024")
+LLM_RECORD_PATH = os.getenv("LLM_RECORD_PATH")  # Cohere backend appends every exchange here
+LLM_REPLAY_PATH = os.getenv("LLM_REPLAY_PATH")  # Stub backend replays exchanges from here
+LLM_STUB_LATENCY = os.getenv("LLM_STUB_LATENCY", "lognormal:0.8,0.4")
+LLM_STUB_TOKEN_DELAY = float(os.getenv("LLM_STUB_TOKEN_DELAY", "0.02"))
+LLM_STUB_ERROR_RATE = float(os.getenv("LLM_STUB_ERROR_RATE", "0"))
+LLM_STUB_SEED = os.getenv("LLM_STUB_SEED")
+
+# -------------------------------------------------------------------
+# Request fingerprints and response shapes
+# -------------------------------------------------------------------
+def request_kind(kwargs: dict) -> str:
+    """Coarse request type, used to replay a similar response when there is no exact match"""
+    if kwargs.get("tools"):
+        return "tools"
+    if kwargs.get("response_format"):
+        return "json"
+    return "text"
+
+def request_fingerprint(kwargs: dict) -> str:
+    """Hash of the conversation without the system prompt, which embeds today's date"""
+    messages = [
+        {"role": m.get("role"), "content": m.get("content")}
+        for m in kwargs.get("messages", []) if m.get("role") != "system"
+    ]
+    payload = json.dumps([request_kind(kwargs), messages], sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:24]
+
+def make_response(text: str, tool_calls: list = None, input_tokens: int = 0, output_tokens: int = 0):
+    """Object shaped like a Cohere V2 chat response"""
+    calls = [
+        SimpleNamespace(
+            id=call["id"], type="function",
+            function=SimpleNamespace(name=call["name"], arguments=call["arguments"])
+        )
+        for call in tool_calls or []
+    ]
+    return SimpleNamespace(
+        message=SimpleNamespace(
+            role="assistant",
+            content=[SimpleNamespace(type="text", text=text)] if text else [],
+            tool_calls=calls or None,
+        ),
+        usage=SimpleNamespace(tokens=SimpleNamespace(input_tokens=input_tokens, output_tokens=output_tokens)),
+    )
+
+def make_delta_event(text: str):
+    """Object shaped like a Cohere V2 content-delta stream event"""
+    return SimpleNamespace(
+        type="content-delta",
+        delta=SimpleNamespace(message=SimpleNamespace(content=SimpleNamespace(text=text))),
+    )
+
+def make_end_event(output_tokens: int = 0):
+    """Object shaped like a Cohere V2 message-end stream event"""
+    return SimpleNamespace(
+        type="message-end",
+        delta=SimpleNamespace(usage=SimpleNamespace(tokens=SimpleNamespace(input_tokens=0, output_tokens=output_tokens))),
+    )
+
+def response_text(response) -> str:
+    content = getattr(response.message, "content", None) or []
+    return "".join(getattr(block, "text", "") for block in content)
+
+# -------------------------------------------------------------------
+# Cohere backend
+# -------------------------------------------------------------------
+class CohereBackend:
+    """Cohere V2 API, optionally recording every exchange for later replay"""
+
+    def __init__(self, api_key: str, record_path: str = LLM_RECORD_PATH):
+        import cohere
+
+        self.client = cohere.ClientV2(api_key=api_key)
+        self.record_path = Path(record_path) if record_path else None
+        self._lock = threading.Lock()
+
+    def _record(self, kwargs: dict, text: str, tool_calls: list, latency: float):
+        if not self.record_path:
+            return
+        entry = {
+            "fingerprint": request_fingerprint(kwargs),
+            "kind": request_kind(kwargs),
+            "text": text,
+            "tool_calls": tool_calls,
+            "latency": round(latency, 3),
+        }
+        with self._lock, open(self.record_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def chat(self, **kwargs):
+        started = time.perf_counter()
+        response = self.client.chat(**kwargs)
+        tool_calls = [
+            {"id": call.id, "name": call.function.name, "arguments": call.function.arguments}
+            for call in getattr(response.message, "tool_calls", None) or []
+        ]
+        self._record(kwargs, response_text(response), tool_calls, time.perf_counter() - started)
+        return response
+
+    def chat_stream(self, **kwargs):
+        started = time.perf_counter()
+        parts = []
+        for event in self.client.chat_stream(**kwargs):
+            if event.type == "content-delta":
+                parts.append(event.delta.message.content.text)
+            yield event
+        self._record(kwargs, "".join(parts), [], time.perf_counter() - started)
+
+# -------------------------------------------------------------------
+# Offline stub backend
+# -------------------------------------------------------------------
+class StubServiceError(Exception):
+    """Injected failure shaped like an HTTP 503 from the API"""
+    status_code = 503
+
+def parse_latency_spec(spec: str):
+    """Latency sampler from "fixed:S", "uniform:LO,HI", "lognormal:MEDIAN,SIGMA" or "recorded" """
+    kind, _, args = spec.partition(":")
+    values = [float(v) for v in args.split(",") if v]
+    if kind == "fixed":
+        return lambda rng, recorded: values[0]
+    if kind == "uniform":
+        return lambda rng, recorded: rng.uniform(values[0], values[1])
+    if kind == "lognormal":
+        return lambda rng, recorded: rng.lognormvariate(math.log(values[0]), values[1])
+    if kind == "recorded":
+        return lambda rng, recorded: recorded if recorded is not None else 0.0
+    raise ValueError(f"Unknown latency spec: {spec}")
+
+class StubBackend:
+    """In-process stand-in for the Cohere API for load tests and offline development.
+
+    Replays exchanges recorded by CohereBackend: an exact match on the conversation
+    first, otherwise the next recording of the same kind (text, JSON plan, tool call).
+    Without recordings it synthesizes plausible responses. Latency follows a
+    configurable distribution and failures can be injected at a fixed rate.
+    """
+
+    def __init__(self, replay_path: str = LLM_REPLAY_PATH, latency: str = LLM_STUB_LATENCY,
+                 token_delay: float = LLM_STUB_TOKEN_DELAY, error_rate: float = LLM_STUB_ERROR_RATE,
+                 seed: str = LLM_STUB_SEED):
+        self.sample_latency = parse_latency_spec(latency)
+        self.token_delay = token_delay
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.exact = {}
+        by_kind = {}
+        if replay_path and Path(replay_path).exists():
+            with open(replay_path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.exact[entry["fingerprint"]] = entry
+                        by_kind.setdefault(entry["kind"], []).append(entry)
+        self.by_kind = {kind: itertools.cycle(entries) for kind, entries in by_kind.items()}
+
+    def _pick(self, kwargs: dict) -> dict:
+        with self._lock:
+            entry = self.exact.get(request_fingerprint(kwargs))
+            if entry is None and request_kind(kwargs) in self.by_kind:
+                entry = next(self.by_kind[request_kind(kwargs)])
+            latency = self.sample_latency(self.rng, entry.get("latency") if entry else None)
+            fail = self.rng.random() < self.error_rate
+        return entry or self._synthesize(kwargs), latency, fail
+
+    def _synthesize(self, kwargs: dict) -> dict:
+        messages = kwargs.get("messages", [])
+        system = next((m["content"] for m in messages if m.get("role") == "system"), "")
+        last_user = next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "")
+        sql = "SELECT region, SUM(revenue) AS total_revenue FROM sales GROUP BY region ORDER BY total_revenue DESC"
+
+        if kwargs.get("tools"):
+            log_id = re.search(r'\d+', last_user)
+            return {"text": "", "tool_calls": [{
+                "id": "stub_call_0", "name": "fetch_failure",
+                "arguments": json.dumps({"log_id": int(log_id.group()) if log_id else 1}),
+            }]}
+        if kwargs.get("response_format"):
+            return {"text": json.dumps({
+                "intent": "data_query", "english_question": last_user, "sql": sql, "reply": "",
+            }), "tool_calls": []}
+        if "classifier" in system:
+            return {"text": "data_query", "tool_calls": []}
+        if "SQL generator" in system:
+            return {"text": sql, "tool_calls": []}
+        if "translator" in system:
+            return {"text": last_user, "tool_calls": []}
+        return {"text": "Stub response: revenue is spread across all four regions, led by the North.", "tool_calls": []}
+
+    def _wait(self, latency: float, kwargs: dict):
+        timeout = (kwargs.get("request_options") or {}).get("timeout_in_seconds")
+        if timeout is not None and latency > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"Stub response took longer than {timeout}s")
+        time.sleep(latency)
+
+    def chat(self, **kwargs):
+        entry, latency, fail = self._pick(kwargs)
+        self._wait(latency, kwargs)
+        if fail:
+            raise StubServiceError("Injected stub failure")
+        text = entry.get("text", "")
+        return make_response(text, entry.get("tool_calls"), output_tokens=len(text.split()))
+
+    def chat_stream(self, **kwargs):
+        entry, latency, fail = self._pick(kwargs)
+        # The sampled latency is the time to first token
+        self._wait(latency, kwargs)
+        if fail:
+            raise StubServiceError("Injected stub failure")
+        tokens = re.findall(r'\S+\s*', entry.get("text", ""))
+        for token in tokens:
+            time.sleep(self.token_delay)
+            yield make_delta_event(token)
+        yield make_end_event(len(tokens))
+
+def create_backend(api_key: str = None):
+    """Backend selected by LLM_BACKEND"""
+    if LLM_BACKEND == "stub":
+        return StubBackend()
+    if LLM_BACKEND == "cohere":
+        return CohereBackend(api_key)
+    raise ValueError(f"Unknown LLM_BACKEND: {LLM_BACKEND}")
@@ -0,0 +1,267 @@
+import os
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import metrics
+import tracing
+
+# -------------------------------------------------------------------
+# Configuration
+# -------------------------------------------------------------------
+# Total time budget per stage in seconds, across retries (override with LLM_DEADLINE_<STAGE>)
+STAGE_DEADLINES = {
+    "classify": 8,
+    "translate": 8,
+    "plan": 20,
+    "generate_sql": 20,
+    "rewrite_sql": 20,
+    "contextual_reply": 15,
+    "summarize": 30,
+    "incident_tools": 30,
+    "incident_report": 45,
+}
+LLM_DEFAULT_DEADLINE = float(os.getenv("LLM_DEFAULT_DEADLINE", "30"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_CAP = float(os.getenv("LLM_BACKOFF_CAP", "4"))
+
+# Hedging: send a duplicate request once a call outlives this latency percentile of its stage
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "0") == "1"
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+
+# Circuit breaker: open after this many consecutive failures, probe again after the cooldown
+LLM_BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", "5"))
+LLM_BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+# -------------------------------------------------------------------
+# Errors
+# -------------------------------------------------------------------
+class LLMUnavailableError(Exception):
+    """The LLM call failed after retries or its deadline ran out"""
+
+class CircuitOpenError(LLMUnavailableError):
+    """The circuit breaker is open and calls fail fast"""
+
+def is_retryable(error: Exception) -> bool:
+    """Timeouts, connection problems, rate limits and 5xx responses are worth retrying"""
+    status_code = getattr(error, "status_code", None)
+    if status_code is not None:
+        return status_code in RETRYABLE_STATUS_CODES
+    name = type(error).__name__
+    return isinstance(error, (TimeoutError, ConnectionError)) or "Timeout" in name or "Connect" in name or "Transport" in name
+
+def token_usage(usage) -> dict:
+    """Input/output token counts from a Cohere usage object, if it reports them"""
+    tokens = getattr(usage, "tokens", None)
+    if tokens is None:
+        return {}
+    return {
+        "input_tokens": getattr(tokens, "input_tokens", None),
+        "output_tokens": getattr(tokens, "output_tokens", None),
+    }
+
+def stage_deadline(stage: str) -> float:
+    override = os.getenv(f"LLM_DEADLINE_{stage.upper()}")
+    if override:
+        return float(override)
+    return STAGE_DEADLINES.get(stage, LLM_DEFAULT_DEADLINE)
+
+# -------------------------------------------------------------------
+# Circuit breaker
+# -------------------------------------------------------------------
+class CircuitBreaker:
+    """Consecutive-failure breaker with a single half-open probe after the cooldown"""
+
+    def __init__(self, threshold: int = LLM_BREAKER_THRESHOLD, cooldown: float = LLM_BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.cooldown else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+        metrics.set_gauge("llm.circuit_open", 0)
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.threshold:
+                if self.opened_at is None or self.probing:
+                    print(f"⚠️ LLM circuit breaker opened after {self.failures} consecutive failures")
+                self.opened_at = time.monotonic()
+                self.probing = False
+                metrics.set_gauge("llm.circuit_open", 1)
+
+# -------------------------------------------------------------------
+# Gateway
+# -------------------------------------------------------------------
+class LLMGateway:
+    """Single entry point for LLM calls: deadlines, retries, hedging, circuit breaking and metrics"""
+
+    def __init__(self, client, model: str):
+        self.client = client
+        self.model = model
+        self.breaker = CircuitBreaker()
+        self._hedge_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="llm-hedge")
+
+    def _record_outcome(self, error: Exception):
+        # A client error (bad request, auth) means the service answered, so it isn't an outage
+        if is_retryable(error):
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+
+    def _call_once(self, stage: str, timeout: float, kwargs: dict):
+        started = time.perf_counter()
+        response = self.client.chat(
+            model=self.model,
+            request_options={"timeout_in_seconds": max(1, int(timeout)), "max_retries": 0},
+            **kwargs
+        )
+        metrics.observe(f"llm.latency.{stage}", time.perf_counter() - started)
+        return response
+
+    def _call_hedged(self, stage: str, timeout: float, kwargs: dict):
+        """Send the request; if it outlives the stage's latency percentile, race a duplicate"""
+        hedge_after = None
+        if LLM_HEDGE_ENABLED:
+            snapshot = metrics.snapshot()["latencies"].get(f"llm.latency.{stage}")
+            if snapshot and snapshot["count"] >= LLM_HEDGE_MIN_SAMPLES:
+                hedge_after = metrics.percentile(f"llm.latency.{stage}", LLM_HEDGE_PERCENTILE)
+
+        if hedge_after is None or hedge_after >= timeout:
+            return self._call_once(stage, timeout, kwargs)
+
+        primary = self._hedge_pool.submit(self._call_once, stage, timeout, kwargs)
+        done, _ = wait([primary], timeout=hedge_after)
+        if done:
+            return primary.result()
+
+        metrics.incr(f"llm.hedges.{stage}")
+        hedge = self._hedge_pool.submit(self._call_once, stage, timeout - hedge_after, kwargs)
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def chat(self, stage: str, **kwargs):
+        """Chat completion for a pipeline stage; raises LLMUnavailableError when it can't be served"""
+        with tracing.span(f"llm.{stage}", model=self.model):
+            response = self._chat(stage, **kwargs)
+            tracing.annotate(**token_usage(getattr(response, "usage", None)))
+            return response
+
+    def _chat(self, stage: str, **kwargs):
+        if not self.breaker.allow():
+            metrics.incr("llm.circuit_rejections")
+            raise CircuitOpenError(f"LLM circuit open, skipping {stage}")
+
+        metrics.incr(f"llm.calls.{stage}")
+        deadline = time.monotonic() + stage_deadline(stage)
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            tracing.annotate(attempts=attempt + 1)
+            try:
+                response = self._call_hedged(stage, remaining, kwargs)
+                self.breaker.record_success()
+                return response
+            except Exception as e:
+                metrics.incr(f"llm.errors.{stage}")
+                self._record_outcome(e)
+                backoff = random.uniform(0, min(LLM_BACKOFF_CAP, LLM_BACKOFF_BASE * 2 ** attempt))
+                remaining = deadline - time.monotonic()
+                if not is_retryable(e) or attempt >= LLM_MAX_RETRIES or backoff >= remaining:
+                    print(f"❌ LLM {stage} failed after {attempt + 1} attempt(s): {str(e)}")
+                    raise LLMUnavailableError(f"{stage} failed after {attempt + 1} attempt(s): {str(e)}") from e
+                if not self.breaker.allow():
+                    raise CircuitOpenError(f"LLM circuit opened during {stage}") from e
+                metrics.incr(f"llm.retries.{stage}")
+                print(f"⚠️ LLM {stage} attempt {attempt + 1} failed ({str(e)}), retrying in {backoff:.2f}s")
+                time.sleep(backoff)
+                attempt += 1
+
+    def chat_stream(self, stage: str, on_delta, **kwargs) -> str:
+        """Stream a chat completion, calling `on_delta` with each text delta.
+
+        Retries only happen before the first token; once text has been shown a failure
+        is raised to the caller. Returns the full text.
+        """
+        with tracing.span(f"llm.{stage}", model=self.model, streamed=True):
+            return self._chat_stream(stage, on_delta, **kwargs)
+
+    def _chat_stream(self, stage: str, on_delta, **kwargs) -> str:
+        if not self.breaker.allow():
+            metrics.incr("llm.circuit_rejections")
+            raise CircuitOpenError(f"LLM circuit open, skipping {stage}")
+
+        metrics.incr(f"llm.calls.{stage}")
+        deadline = time.monotonic() + stage_deadline(stage)
+        attempt = 0
+        while True:
+            parts = []
+            started = time.perf_counter()
+            tracing.annotate(attempts=attempt + 1)
+            try:
+                for event in self.client.chat_stream(
+                    model=self.model,
+                    request_options={
+                        "timeout_in_seconds": max(1, int(deadline - time.monotonic())), "max_retries": 0
+                    },
+                    **kwargs
+                ):
+                    if event.type == "content-delta":
+                        if not parts:
+                            metrics.observe(f"llm.first_token.{stage}", time.perf_counter() - started)
+                            tracing.annotate(first_token_ms=round((time.perf_counter() - started) * 1000, 1))
+                        parts.append(event.delta.message.content.text)
+                        on_delta(parts[-1])
+                    elif event.type == "message-end":
+                        tracing.annotate(**token_usage(getattr(event.delta, "usage", None)))
+                metrics.observe(f"llm.latency.{stage}", time.perf_counter() - started)
+                self.breaker.record_success()
+                return "".join(parts)
+            except Exception as e:
+                metrics.incr(f"llm.errors.{stage}")
+                self._record_outcome(e)
+                backoff = random.uniform(0, min(LLM_BACKOFF_CAP, LLM_BACKOFF_BASE * 2 ** attempt))
+                remaining = deadline - time.monotonic()
+                if parts or not is_retryable(e) or attempt >= LLM_MAX_RETRIES or backoff >= remaining:
+                    print(f"❌ LLM {stage} stream failed after {attempt + 1} attempt(s): {str(e)}")
+                    raise LLMUnavailableError(f"{stage} stream failed: {str(e)}") from e
+                if not self.breaker.allow():
+                    raise CircuitOpenError(f"LLM circuit opened during {stage}") from e
+                metrics.incr(f"llm.retries.{stage}")
+                time.sleep(backoff)
+                attempt += 1
@@ -0,0 +1,60 @@
+import threading
+from collections import deque
+
+# -------------------------------------------------------------------
+# In-process metrics registry (counters, gauges and latency samples)
+# -------------------------------------------------------------------
+MAX_SAMPLES = 1000  # Samples kept per observed metric for percentiles
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_samples = {}
+
+def incr(name: str, amount: float = 1):
+    """Increment a counter"""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+def set_gauge(name: str, value: float):
+    """Set a gauge to its current value"""
+    with _lock:
+        _gauges[name] = value
+
+def observe(name: str, value: float):
+    """Record a sample (e.g. a latency in seconds) for percentile reporting"""
+    with _lock:
+        if name not in _samples:
+            _samples[name] = deque(maxlen=MAX_SAMPLES)
+        _samples[name].append(value)
+
+def get_counter(name: str) -> float:
+    """Current value of a counter (0 if never incremented)"""
+    with _lock:
+        return _counters.get(name, 0)
+
+def ratio(numerator: str, denominator_parts: list) -> float:
+    """Ratio of one counter to the sum of several, e.g. hits / (hits + misses)"""
+    with _lock:
+        total = sum(_counters.get(name, 0) for name in denominator_parts)
+        return _counters.get(numerator, 0) / total if total else 0.0
+
+def percentile(name: str, pct: float) -> float | None:
+    """Percentile of the recent samples of a metric, or None without samples"""
+    with _lock:
+        values = sorted(_samples.get(name, ()))
+    if not values:
+        return None
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+def snapshot() -> dict:
+    """Copy of all counters and gauges plus p50/p95 of every sampled metric"""
+    with _lock:
+        result = {"counters": dict(_counters), "gauges": dict(_gauges)}
+        names = list(_samples)
+    result["latencies"] = {
+        name: {"p50": percentile(name, 50), "p95": percentile(name, 95), "count": len(_samples[name])}
+        for name in names
+    }
+    return result
@@ -0,0 +1,173 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from contextlib import contextmanager
+from pathlib import Path
+
+import metrics
+
+# -------------------------------------------------------------------
+# Configuration
+# -------------------------------------------------------------------
+NL_SQL_CACHE_PATH = Path(os.getenv("NL_SQL_CACHE_PATH", ".cache/nl_sql_cache.sqlite3"))
+NL_SQL_CACHE_TTL_SECONDS = int(os.getenv("NL_SQL_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+NL_SQL_CACHE_MAX_ENTRIES = int(os.getenv("NL_SQL_CACHE_MAX_ENTRIES", "5000"))
+NL_SQL_CACHE_BYPASS = os.getenv("NL_SQL_CACHE_BYPASS", "0") == "1"
+
+# -------------------------------------------------------------------
+# Question normalization
+# -------------------------------------------------------------------
+ARABIC_DIACRITICS = re.compile(r'[\u0610-\u061A\u064B-\u065F\u0670\u06D6-\u06ED\u0640]')
+ARABIC_CHAR_MAP = str.maketrans({
+    "أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا",
+    "ى": "ي", "ة": "ه", "ؤ": "و", "ئ": "ي",
+    "؟": "?", "،": ",", "؛": ";",
+    "٠": "0", "١": "1", "٢": "2", "٣": "3", "٤": "4",
+    "٥": "5", "٦": "6", "٧": "7", "٨": "8", "٩": "9",
+})
+
+def normalize_question(question: str) -> str:
+    """Normalize case, whitespace, Arabic letter variants, diacritics and digits"""
+    text = unicodedata.normalize("NFKC", question)
+    text = ARABIC_DIACRITICS.sub("", text).translate(ARABIC_CHAR_MAP)
+    text = re.sub(r'\s+', " ", text.lower()).strip()
+    return text.rstrip("?!. ")
+
+def term_pattern(term: str) -> str:
+    """Regex for a normalized term as a whole word; Arabic terms may carry attached prefixes (و, ف, ب, ك, ل, ال)"""
+    if not re.search(r'[؀-ۿ]', term):
+        return rf'\b{re.escape(term)}\b'
+    body = re.escape(term)
+    if term.startswith("ال"):
+        # ل before ال contracts to لل ("للعام الماضي")
+        body = f"(?:{body}|لل{re.escape(term[2:])})"
+    # Two-letter terms only take و/ف, so كم doesn't match لكم ("for you")
+    prefix = "[وف]?" if len(term) <= 2 else "[وف]?[بكل]?(?:ال)?"
+    return rf'(?<!\w){prefix}{body}(?!\w)'
+
+def fingerprint(value) -> str:
+    """Short stable hash of a string or JSON-serializable value"""
+    if not isinstance(value, str):
+        value = json.dumps(value, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()[:16]
+
+def build_cache_key(question: str, schema_info: str, date_context: str, conversation_context: list = None) -> str:
+    """Cache key from the normalized question, schema version, date context and prior turns"""
+    return fingerprint([
+        normalize_question(question),
+        fingerprint(schema_info),
+        date_context,
+        fingerprint(conversation_context or []),
+    ])
+
+# -------------------------------------------------------------------
+# Persistent cache
+# -------------------------------------------------------------------
+class NLSQLCache:
+    """Question-to-SQL cache stored in a local SQLite file with LRU and TTL eviction"""
+
+    def __init__(self, path: Path = NL_SQL_CACHE_PATH, ttl_seconds: int = NL_SQL_CACHE_TTL_SECONDS,
+                 max_entries: int = NL_SQL_CACHE_MAX_ENTRIES, bypass: bool = NL_SQL_CACHE_BYPASS):
+        self.path = Path(path)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.bypass = bypass
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS nl_sql_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    question TEXT NOT NULL,
+                    english_question TEXT,
+                    sql TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_nl_sql_cache_last_access ON nl_sql_cache (last_access)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            with conn:  # Commits on success, rolls back on error
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, cache_key: str) -> dict | None:
+        """Return the cached entry for a key, or None on a miss or when bypassed"""
+        if self.bypass:
+            metrics.incr("nl_sql_cache.bypass")
+            return None
+
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT question, english_question, sql, created_at FROM nl_sql_cache WHERE cache_key = ?",
+                (cache_key,)
+            ).fetchone()
+
+            if row and now - row[3] > self.ttl_seconds:
+                conn.execute("DELETE FROM nl_sql_cache WHERE cache_key = ?", (cache_key,))
+                metrics.incr("nl_sql_cache.expired")
+                row = None
+
+            if not row:
+                metrics.incr("nl_sql_cache.misses")
+                return None
+
+            conn.execute(
+                "UPDATE nl_sql_cache SET last_access = ?, hits = hits + 1 WHERE cache_key = ?",
+                (now, cache_key)
+            )
+
+        metrics.incr("nl_sql_cache.hits")
+        return {"question": row[0], "english_question": row[1], "sql": row[2]}
+
+    def put(self, cache_key: str, question: str, english_question: str, sql: str):
+        """Store a question's SQL and evict the least recently used entries over capacity"""
+        if self.bypass:
+            return
+
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                """INSERT OR REPLACE INTO nl_sql_cache
+                   (cache_key, question, english_question, sql, created_at, last_access, hits)
+                   VALUES (?, ?, ?, ?, ?, ?, 0)""",
+                (cache_key, question, english_question, sql, now, now)
+            )
+            evicted = conn.execute(
+                """DELETE FROM nl_sql_cache WHERE cache_key IN (
+                       SELECT cache_key FROM nl_sql_cache
+                       ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                   )""",
+                (self.max_entries,)
+            ).rowcount
+
+        if evicted:
+            metrics.incr("nl_sql_cache.evictions", evicted)
+
+    def clear(self):
+        """Remove every cached entry"""
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM nl_sql_cache")
+
+    def stats(self) -> dict:
+        """Hit/miss counters and the current number of entries"""
+        with self._lock, self._connect() as conn:
+            entries = conn.execute("SELECT COUNT(*) FROM nl_sql_cache").fetchone()[0]
+        return {
+            "entries": entries,
+            "hits": metrics.get_counter("nl_sql_cache.hits"),
+            "misses": metrics.get_counter("nl_sql_cache.misses"),
+            "hit_ratio": metrics.ratio("nl_sql_cache.hits", ["nl_sql_cache.hits", "nl_sql_cache.misses"]),
+        }
@@ -0,0 +1,68 @@
+import os
+import json
+
+from sqlalchemy import text
+
+import metrics
+
+# -------------------------------------------------------------------
+# Configuration
+# -------------------------------------------------------------------
+SQL_MAX_PLAN_COST = float(os.getenv("SQL_MAX_PLAN_COST", "1000000"))  # Planner cost units
+SQL_MAX_PLAN_ROWS = float(os.getenv("SQL_MAX_PLAN_ROWS", "5000000"))  # Largest row estimate of a sort, hash or join
+SQL_COST_ACTION = os.getenv("SQL_COST_ACTION", "rewrite")  # rewrite | reject | off
+
+# Nodes that build or multiply rows. Scans are left out: a full scan feeding an
+# aggregate is cheap per row and already priced into the total cost.
+MATERIALIZING_NODES = {
+    "Sort", "Incremental Sort", "Hash", "Materialize", "Hash Join", "Merge Join", "Nested Loop", "WindowAgg",
+}
+
+# -------------------------------------------------------------------
+# EXPLAIN
+# -------------------------------------------------------------------
+def _walk(node: dict, depth: int = 0):
+    yield node, depth
+    for child in node.get("Plans", []):
+        yield from _walk(child, depth + 1)
+
+def summarize_plan(root: dict, max_lines: int = 25) -> str:
+    """Indented one-line-per-node outline of a JSON plan"""
+    lines = []
+    for node, depth in _walk(root):
+        relation = f" on {node['Relation Name']}" if node.get("Relation Name") else ""
+        lines.append(
+            f"{'  ' * depth}{node['Node Type']}{relation} "
+            f"(cost={node.get('Total Cost', 0):.0f} rows={node.get('Plan Rows', 0):.0f})"
+        )
+    if len(lines) > max_lines:
+        lines = lines[:max_lines] + [f"... {len(lines) - max_lines} more nodes"]
+    return "\n".join(lines)
+
+def explain_query(session, sql: str, params: dict) -> dict:
+    """Planner estimates for a query from EXPLAIN (FORMAT JSON), without running it"""
+    raw = session.execute(text(f"EXPLAIN (FORMAT JSON) {sql}"), params).scalar()
+    plan = json.loads(raw) if isinstance(raw, str) else raw
+    root = plan[0]["Plan"]
+    nodes = [node for node, _ in _walk(root)]
+    estimate = {
+        "total_cost": root.get("Total Cost", 0.0),
+        "plan_rows": root.get("Plan Rows", 0),
+        "max_node_rows": max(
+            (node.get("Plan Rows", 0) for node in nodes if node["Node Type"] in MATERIALIZING_NODES), default=0
+        ),
+        "node_types": sorted({node["Node Type"] for node in nodes}),
+        "summary": summarize_plan(root),
+    }
+    metrics.observe("sql_cost.total_cost", estimate["total_cost"])
+    return estimate
+
+def over_budget(estimate: dict) -> str | None:
+    """Why a plan is too expensive to run, or None if it is within the thresholds"""
+    if SQL_COST_ACTION == "off":
+        return None
+    if estimate["total_cost"] > SQL_MAX_PLAN_COST:
+        return f"estimated cost {estimate['total_cost']:,.0f} is over the limit of {SQL_MAX_PLAN_COST:,.0f}"
+    if estimate["max_node_rows"] > SQL_MAX_PLAN_ROWS:
+        return f"an estimated {estimate['max_node_rows']:,.0f} intermediate rows is over the limit of {SQL_MAX_PLAN_ROWS:,.0f}"
+    return None
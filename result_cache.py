@@ -0,0 +1,204 @@
+import io
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from contextlib import contextmanager
+from datetime import date
+from pathlib import Path
+
+import pandas as pd
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import ParseError
+
+import metrics
+
+# -------------------------------------------------------------------
+# Configuration
+# -------------------------------------------------------------------
+RESULT_CACHE_PATH = Path(os.getenv("RESULT_CACHE_PATH", ".cache/result_cache.sqlite3"))
+RESULT_CACHE_MAX_MB = float(os.getenv("RESULT_CACHE_MAX_MB", "256"))
+RESULT_CACHE_BYPASS = os.getenv("RESULT_CACHE_BYPASS", "0") == "1"
+RESULT_CACHE_TTL_SECONDS = int(os.getenv("RESULT_CACHE_TTL_SECONDS", "86400"))  # 0 keeps entries until evicted
+
+# Functions whose result changes between runs of the same query. CURRENT_DATE only
+# changes daily, so its results are cached for the day; the others are never cached.
+DAILY_FUNCTIONS = (exp.CurrentDate,)
+VOLATILE_FUNCTIONS = (
+    exp.CurrentTimestamp, exp.CurrentTime, exp.CurrentDatetime, exp.Localtimestamp, exp.Localtime,
+    exp.Rand, exp.Uuid,
+)
+VOLATILE_FUNCTION_NAMES = {"clock_timestamp", "statement_timestamp", "transaction_timestamp", "timeofday", "setseed"}
+
+# -------------------------------------------------------------------
+# Keys
+# -------------------------------------------------------------------
+def canonicalize_sql(sql: str) -> str:
+    """Formatting-, case- and comment-insensitive form of a query"""
+    try:
+        return sqlglot.parse_one(sql, read="postgres").sql(dialect="postgres", normalize=True, comments=False)
+    except ParseError:
+        return re.sub(r'\s+', ' ', sql).strip().lower()
+
+def referenced_tables(sql: str) -> list:
+    """Base tables a query reads (CTE names excluded)"""
+    try:
+        query = sqlglot.parse_one(sql, read="postgres")
+    except ParseError:
+        return []
+    cte_names = {cte.alias_or_name.lower() for cte in query.find_all(exp.CTE)}
+    return sorted({table.name.lower() for table in query.find_all(exp.Table)} - cte_names)
+
+def volatility(sql: str) -> str | None:
+    """"volatile" if a query calls a time-of-day or random function, "daily" if it uses CURRENT_DATE, else None"""
+    try:
+        query = sqlglot.parse_one(sql, read="postgres")
+    except ParseError:
+        return "volatile"
+    found = None
+    for func in query.find_all(exp.Func):
+        if isinstance(func, VOLATILE_FUNCTIONS) or (
+            isinstance(func, exp.Anonymous) and func.name.lower() in VOLATILE_FUNCTION_NAMES
+        ):
+            return "volatile"
+        if isinstance(func, DAILY_FUNCTIONS):
+            found = "daily"
+    return found
+
+def build_result_key(sql: str, params: dict, data_versions: dict, today: date = None) -> str | None:
+    """Key over the canonical SQL, its bound parameters and the versions of the tables it reads.
+
+    Queries using CURRENT_DATE are keyed to today as well; queries whose result changes
+    between runs (NOW(), random()) get no key and are not cached.
+    """
+    scope = volatility(sql)
+    if scope == "volatile":
+        return None
+    day = (today or date.today()).isoformat() if scope == "daily" else None
+    payload = json.dumps(
+        [canonicalize_sql(sql), params or {}, data_versions, day], sort_keys=True, default=str, ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+# -------------------------------------------------------------------
+# Cache
+# -------------------------------------------------------------------
+class ResultCache:
+    """Query results as Parquet blobs in a local SQLite file, evicted LRU by total size and expired by age"""
+
+    def __init__(self, path: Path = RESULT_CACHE_PATH, max_mb: float = RESULT_CACHE_MAX_MB,
+                 bypass: bool = RESULT_CACHE_BYPASS, ttl_seconds: int = RESULT_CACHE_TTL_SECONDS):
+        self.path = Path(path)
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.bypass = bypass
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS result_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    payload BLOB NOT NULL,
+                    status TEXT NOT NULL,
+                    size_bytes INTEGER NOT NULL,
+                    frame_bytes INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0
+                )"""
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_result_cache_last_access ON result_cache (last_access)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            with conn:  # Commits on success, rolls back on error
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, cache_key: str) -> tuple[pd.DataFrame, str] | None:
+        """Cached frame and status message for a key, or None on a miss, an expired entry or when bypassed"""
+        if self.bypass:
+            metrics.incr("result_cache.bypass")
+            return None
+
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT payload, status, frame_bytes, created_at FROM result_cache WHERE cache_key = ?", (cache_key,)
+            ).fetchone()
+            if row and self.ttl_seconds and time.time() - row[3] > self.ttl_seconds:
+                conn.execute("DELETE FROM result_cache WHERE cache_key = ?", (cache_key,))
+                metrics.incr("result_cache.expired")
+                row = None
+            if not row:
+                metrics.incr("result_cache.misses")
+                return None
+            conn.execute(
+                "UPDATE result_cache SET last_access = ?, hits = hits + 1 WHERE cache_key = ?",
+                (time.time(), cache_key)
+            )
+
+        metrics.incr("result_cache.hits")
+        metrics.incr("result_cache.bytes_saved", row[2])
+        return pd.read_parquet(io.BytesIO(row[0])), row[1]
+
+    def put(self, cache_key: str, df: pd.DataFrame, status: str):
+        """Store a result and evict the least recently used entries over the size budget"""
+        if self.bypass:
+            return
+        try:
+            buffer = io.BytesIO()
+            df.to_parquet(buffer, index=False)
+        except Exception as e:
+            # Duplicate column names or mixed-type columns can't be written as Parquet
+            print(f"⚠️ Result not cacheable: {str(e)}")
+            return
+        payload = buffer.getvalue()
+        if len(payload) > self.max_bytes:
+            return
+
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                """INSERT OR REPLACE INTO result_cache
+                   (cache_key, payload, status, size_bytes, frame_bytes, created_at, last_access, hits)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, 0)""",
+                (cache_key, payload, status, len(payload), int(df.memory_usage(deep=True).sum()), now, now)
+            )
+            evicted = conn.execute(
+                """DELETE FROM result_cache WHERE cache_key IN (
+                       SELECT cache_key FROM (
+                           SELECT cache_key, SUM(size_bytes) OVER (ORDER BY last_access DESC, cache_key) AS running
+                           FROM result_cache
+                       ) WHERE running > ?
+                   )""",
+                (self.max_bytes,)
+            ).rowcount
+
+        metrics.incr("result_cache.stored_bytes", len(payload))
+        if evicted:
+            metrics.incr("result_cache.evictions", evicted)
+
+    def clear(self):
+        """Remove every cached result"""
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM result_cache")
+
+    def stats(self) -> dict:
+        """Hit ratio, bytes saved and the current size of the cache"""
+        with self._lock, self._connect() as conn:
+            entries, size_bytes = conn.execute("SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM result_cache").fetchone()
+        return {
+            "entries": entries,
+            "size_bytes": size_bytes,
+            "hits": metrics.get_counter("result_cache.hits"),
+            "misses": metrics.get_counter("result_cache.misses"),
+            "hit_ratio": metrics.ratio("result_cache.hits", ["result_cache.hits", "result_cache.misses"]),
+            "bytes_saved": metrics.get_counter("result_cache.bytes_saved"),
+        }
@@ -0,0 +1,72 @@
+import os
+from decimal import Decimal
+
+import pandas as pd
+
+import metrics
+import tracing
+
+# -------------------------------------------------------------------
+# Configuration
+# -------------------------------------------------------------------
+# Smaller than the default SQL_ROW_LIMIT, so a query that hits the row limit streams
+SQL_FETCH_CHUNK_ROWS = int(os.getenv("SQL_FETCH_CHUNK_ROWS", "250"))  # Results up to this size skip streaming
+SQL_MAX_RESULT_MB = float(os.getenv("SQL_MAX_RESULT_MB", "256"))
+
+# -------------------------------------------------------------------
+# DataFrame building
+# -------------------------------------------------------------------
+def rows_to_frame(rows: list, columns: list) -> pd.DataFrame:
+    """Build a frame column by column; NUMERIC columns (Decimal objects) become float64"""
+    if not rows:
+        return pd.DataFrame(columns=columns)
+    df = pd.DataFrame({i: values for i, values in enumerate(zip(*rows))})
+    df.columns = columns
+    for i, dtype in enumerate(df.dtypes):
+        if dtype == object:
+            values = df.iloc[:, i].dropna()
+            if len(values) and all(isinstance(value, Decimal) for value in values):
+                df.isetitem(i, df.iloc[:, i].astype("float64"))
+    return df
+
+def fetch_dataframe(session, statement, params: dict, expected_rows: int = None) -> tuple[pd.DataFrame, str | None]:
+    """Run a query into a DataFrame without holding the whole result twice.
+
+    Results known to be small (`expected_rows`, e.g. the query's LIMIT, within one
+    chunk) are fetched in one go. Anything else uses a server-side cursor and is built
+    chunk by chunk, stopping at the memory ceiling; the row count is already capped by
+    the LIMIT sql_guard enforces. Returns the frame and, if it was cut short, the reason.
+    """
+    if expected_rows is not None and expected_rows <= SQL_FETCH_CHUNK_ROWS:
+        result = session.execute(statement, params)
+        rows = result.fetchall()
+        with tracing.span("build_dataframe", rows=len(rows)):
+            return rows_to_frame(rows, list(result.keys())), None
+
+    metrics.incr("sql_fetch.streamed")
+    result = session.execute(
+        statement, params, execution_options={"stream_results": True, "yield_per": SQL_FETCH_CHUNK_ROWS}
+    )
+    columns = list(result.keys())
+    max_bytes = SQL_MAX_RESULT_MB * 1024 * 1024
+    chunks, total_bytes, truncated = [], 0, None
+    # Rows arrive while the frame is built, so the span covers both
+    with tracing.span("build_dataframe", streamed=True):
+        try:
+            for rows in result.partitions(SQL_FETCH_CHUNK_ROWS):
+                chunk = rows_to_frame(rows, columns)
+                chunks.append(chunk)
+                total_bytes += int(chunk.memory_usage(deep=True).sum())
+                if total_bytes >= max_bytes:
+                    truncated = f"memory limit of {SQL_MAX_RESULT_MB:g} MB reached"
+                    break
+        finally:
+            # Closes the server-side cursor, discarding any rows not fetched
+            result.close()
+        df = pd.concat(chunks, ignore_index=True) if len(chunks) > 1 else (chunks[0] if chunks else rows_to_frame([], columns))
+        tracing.annotate(rows=len(df), chunks=len(chunks))
+
+    if truncated:
+        metrics.incr("sql_fetch.truncated")
+    metrics.observe("sql_fetch.bytes", total_bytes)
+    return df, truncated
@@ -0,0 +1,89 @@
+import io
+import os
+import hashlib
+from decimal import Decimal
+from pathlib import Path
+
+import pandas as pd
+
+import metrics
+
+# -------------------------------------------------------------------
+# Configuration
+# -------------------------------------------------------------------
+RESULT_STORE_PATH = Path(os.getenv("RESULT_STORE_PATH", ".cache/results"))
+RESULT_STORE_COMPRESSION = os.getenv("RESULT_STORE_COMPRESSION", "zstd")
+
+# -------------------------------------------------------------------
+# Summaries
+# -------------------------------------------------------------------
+def summarize_frame(df: pd.DataFrame) -> dict:
+    """Row and column counts plus min/max/sum of numeric columns, small enough to keep in a message"""
+    numeric = {}
+    for position, column in enumerate(df.columns[:20]):
+        values = df.iloc[:, position].dropna()
+        if values.empty or pd.api.types.is_bool_dtype(values):
+            continue
+        # NUMERIC columns arrive as Decimal objects
+        if not pd.api.types.is_numeric_dtype(values):
+            if not isinstance(values.iloc[0], Decimal):
+                continue
+            values = pd.to_numeric(values, errors="coerce").dropna()
+        numeric[str(column)] = {"min": float(values.min()), "max": float(values.max()), "sum": float(values.sum())}
+    return {"rows": len(df), "columns": [str(column) for column in df.columns], "numeric": numeric}
+
+# -------------------------------------------------------------------
+# Store
+# -------------------------------------------------------------------
+class ResultStore:
+    """Query results as compressed Parquet files on local disk, named by the hash of their content.
+
+    Messages keep only the reference `put` returns, so a session's memory doesn't
+    grow with the results it has seen. Identical results are stored once.
+    """
+
+    def __init__(self, path: Path = RESULT_STORE_PATH, compression: str = RESULT_STORE_COMPRESSION):
+        self.path = Path(path)
+        self.compression = compression
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def _file(self, result_id: str) -> Path:
+        return self.path / result_id[:2] / f"{result_id}.parquet"
+
+    def put(self, df: pd.DataFrame) -> dict:
+        """Store a result and return its reference: result_id (None if it couldn't be stored) plus summary stats"""
+        reference = {"result_id": None, **summarize_frame(df)}
+        try:
+            buffer = io.BytesIO()
+            df.to_parquet(buffer, index=False, compression=self.compression)
+        except Exception as e:
+            # Duplicate column names or mixed-type columns can't be written as Parquet
+            print(f"⚠️ Result not stored: {str(e)}")
+            return reference
+
+        payload = buffer.getvalue()
+        result_id = hashlib.sha256(payload).hexdigest()
+        file = self._file(result_id)
+        if not file.exists():
+            file.parent.mkdir(exist_ok=True)
+            temp_file = file.with_suffix(".tmp")
+            temp_file.write_bytes(payload)
+            temp_file.replace(file)
+            metrics.incr("result_store.stored_bytes", len(payload))
+        else:
+            metrics.incr("result_store.deduplicated")
+        reference.update(result_id=result_id, size_bytes=len(payload))
+        return reference
+
+    def get(self, reference: dict) -> pd.DataFrame | None:
+        """The result a reference points to, or None if it wasn't stored or is gone"""
+        result_id = (reference or {}).get("result_id")
+        if not result_id:
+            return None
+        try:
+            df = pd.read_parquet(self._file(result_id))
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Stored result {result_id[:12]} unavailable: {str(e)}")
+            return None
+        metrics.incr("result_store.loads")
+        return df
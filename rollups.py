@@ -0,0 +1,255 @@
+"""
+Pre-aggregated rollups of the fact tables and routing of aggregate queries onto them.
+
+    python rollups.py           # create missing rollups and refresh stale ones
+    python rollups.py --force   # refresh every rollup
+"""
+import argparse
+import time
+from datetime import date, datetime, timedelta
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import ParseError
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+
+import metrics
+from database import SessionLocal, RollupState, get_data_versions, get_fresh_rollups
+
+# -------------------------------------------------------------------
+# Rollup definitions (coarsest first, so routing picks the smallest that fits)
+# -------------------------------------------------------------------
+ROLLUPS = [
+    {"name": "sales_quarterly_rollup", "source": "sales", "date_column": "date", "grain": "quarter",
+     "dimensions": ["region", "product"], "measures": {"units_sold": "BIGINT", "revenue": None}},
+    {"name": "sales_monthly_rollup", "source": "sales", "date_column": "date", "grain": "month",
+     "dimensions": ["region", "product"], "measures": {"units_sold": "BIGINT", "revenue": None}},
+    {"name": "churn_quarterly_rollup", "source": "churn", "date_column": "month", "grain": "quarter",
+     "dimensions": ["segment"], "measures": {"churned_customers": "BIGINT"}},
+]
+
+# Coarser units a grain can still answer exactly
+GRAIN_UNITS = {"month": {"MONTH", "QUARTER", "YEAR"}, "quarter": {"QUARTER", "YEAR"}}
+
+def _time_column(rollup: dict) -> str:
+    return f"{rollup['grain']}_start"
+
+def rollup_ddl(rollup: dict) -> list:
+    """Statements that create a rollup as a materialized view with the unique index concurrent refreshes need"""
+    keys = ", ".join([_time_column(rollup)] + rollup["dimensions"])
+    measures = ", ".join(f"SUM({measure}) AS {measure}" for measure in rollup["measures"])
+    return [
+        f"""CREATE MATERIALIZED VIEW IF NOT EXISTS {rollup['name']} AS
+            SELECT date_trunc('{rollup['grain']}', {rollup['date_column']})::date AS {_time_column(rollup)},
+                   {', '.join(rollup['dimensions'])}, {measures}, COUNT(*) AS row_count
+            FROM {rollup['source']}
+            GROUP BY {keys}""",
+        f"CREATE UNIQUE INDEX IF NOT EXISTS ux_{rollup['name']} ON {rollup['name']} ({keys})",
+    ]
+
+# -------------------------------------------------------------------
+# Maintenance
+# -------------------------------------------------------------------
+def create_rollups(db):
+    """Create any rollup that doesn't exist yet"""
+    for rollup in ROLLUPS:
+        for statement in rollup_ddl(rollup):
+            db.execute(text(statement))
+    db.commit()
+
+def refresh_rollups(db, *source_tables: str, force: bool = False):
+    """Refresh the rollups of the given source tables (all if none) and record their freshness.
+
+    Rollups already built from the current data version are skipped unless `force`.
+    Loaders call this after bump_data_version so routed queries see the new data.
+    """
+    fresh = set() if force else get_fresh_rollups(db)
+    for rollup in ROLLUPS:
+        if (source_tables and rollup["source"] not in source_tables) or rollup["name"] in fresh:
+            continue
+        # Read the version first: a load that lands mid-refresh leaves the rollup marked stale
+        version = get_data_versions(db, [rollup["source"]])[rollup["source"]]
+        started = time.perf_counter()
+        populated = db.execute(
+            text("SELECT ispopulated FROM pg_matviews WHERE matviewname = :name"), {"name": rollup["name"]}
+        ).scalar()
+        # CONCURRENTLY keeps the rollup readable during the refresh, but needs it populated once
+        db.execute(text(f"REFRESH MATERIALIZED VIEW {'CONCURRENTLY ' if populated else ''}{rollup['name']}"))
+        row_count = db.execute(text(f"SELECT COUNT(*) FROM {rollup['name']}")).scalar()
+        refresh_ms = int((time.perf_counter() - started) * 1000)
+
+        values = {
+            "source_table": rollup["source"], "source_version": version,
+            "row_count": row_count, "refresh_ms": refresh_ms, "refreshed_at": datetime.utcnow(),
+        }
+        db.execute(insert(RollupState).values(rollup_name=rollup["name"], **values).on_conflict_do_update(
+            index_elements=[RollupState.rollup_name], set_=values
+        ))
+        db.commit()
+        print(f"✅ Refreshed {rollup['name']}: {row_count:,} rows in {refresh_ms} ms")
+
+# -------------------------------------------------------------------
+# Routing
+# -------------------------------------------------------------------
+def _date_value(node: exp.Expression, params: dict) -> date | None:
+    while isinstance(node, (exp.Paren, exp.Cast)):
+        node = node.this
+    if isinstance(node, exp.Placeholder):
+        value = params.get(node.name)
+    elif isinstance(node, exp.Literal) and node.is_string:
+        value = node.this
+    else:
+        return None
+    if isinstance(value, datetime):
+        return value.date() if value.time() == datetime.min.time() else None
+    if isinstance(value, date):
+        return value
+    try:
+        return datetime.strptime(str(value), "%Y-%m-%d").date()
+    except ValueError:
+        return None
+
+def _on_boundary(day: date | None, grain: str) -> bool:
+    return day is not None and day.day == 1 and (grain == "month" or day.month % 3 == 1)
+
+def _date_use_fits(column: exp.Column, grain: str, params: dict) -> bool:
+    """True if every row of a rollup period agrees on this use of the date column"""
+    parent = column.parent
+    if isinstance(parent, (exp.TimestampTrunc, exp.DateTrunc)) and parent.this is column:
+        unit = parent.args.get("unit")
+        return unit is not None and unit.name.upper() in GRAIN_UNITS[grain]
+    if isinstance(parent, exp.Extract) and parent.expression is column:
+        return parent.this.name.upper() in GRAIN_UNITS[grain]
+    if isinstance(parent, exp.Between) and parent.this is column:
+        high = _date_value(parent.args["high"], params)
+        return _on_boundary(_date_value(parent.args["low"], params), grain) and \
+            _on_boundary(high + timedelta(days=1) if high else None, grain)
+    if isinstance(parent, (exp.GTE, exp.GT, exp.LTE, exp.LT)):
+        column_left = parent.this is column
+        other = parent.expression if column_left else parent.this
+        value = _date_value(other, params)
+        # `date >= X` and `date < X` need X on a boundary; `date > X` and `date <= X` need X + 1 day
+        op = type(parent)
+        if not column_left:
+            op = {exp.GTE: exp.LTE, exp.GT: exp.LT, exp.LTE: exp.GTE, exp.LT: exp.GT}[op]
+        if op in (exp.GT, exp.LTE) and value:
+            value += timedelta(days=1)
+        return _on_boundary(value, grain)
+    return False
+
+def _from_clause(query: exp.Select) -> exp.From | None:
+    # sqlglot renamed the arg from "from" to "from_"
+    return query.args.get("from_") or query.args.get("from")
+
+def _route(query: exp.Select, rollup: dict, params: dict) -> exp.Select | None:
+    """The query rewritten onto a rollup, or None if the rollup can't answer it exactly"""
+    aliases = {expression.alias.lower() for expression in query.expressions if expression.alias}
+    if aliases & {_time_column(rollup), "row_count"}:
+        return None
+
+    def is_alias_reference(column: exp.Column) -> bool:
+        return column.name.lower() in aliases and not column.table and column.find_ancestor(exp.Order) is not None
+
+    for column in query.find_all(exp.Column):
+        name = column.name.lower()
+        if name in rollup["dimensions"] or is_alias_reference(column):
+            continue
+        if name == rollup["date_column"]:
+            if not _date_use_fits(column, rollup["grain"], params):
+                return None
+        elif name in rollup["measures"]:
+            aggregate = column.find_ancestor(exp.AggFunc)
+            if not isinstance(aggregate, exp.Sum) or aggregate.this is not column:
+                return None
+        else:
+            return None
+    for count in query.find_all(exp.Count):
+        if not isinstance(count.this, (exp.Star, exp.Distinct)):
+            return None
+
+    def rewrite(node: exp.Expression) -> exp.Expression:
+        if isinstance(node, exp.Table) and isinstance(node.parent, exp.From):
+            # Aliased as the fact table so qualified column references keep working
+            return exp.table_(rollup["name"], alias=node.alias or node.name)
+        if isinstance(node, exp.Column) and node.name.lower() == rollup["date_column"] and not is_alias_reference(node):
+            return exp.column(_time_column(rollup), table=node.table or None)
+        if isinstance(node, exp.Count) and isinstance(node.this, exp.Star):
+            # COUNT(*) over no rows is 0 where SUM is NULL
+            counted = exp.cast(exp.func("COALESCE", exp.Sum(this=exp.column("row_count")), exp.Literal.number(0)), "BIGINT")
+            # An unaliased COUNT(*) output column is named "count"; keep that name
+            return exp.alias_(counted, "count") if node.parent is query_copy else counted
+        if isinstance(node, exp.Sum) and isinstance(node.this, exp.Column):
+            # Keep the result type of summing the raw integer column
+            cast_type = rollup["measures"].get(node.this.name.lower())
+            if cast_type and not isinstance(node.parent, exp.Cast):
+                return exp.cast(node.copy(), cast_type)
+        return node
+    query_copy = query.copy()
+    return query_copy.transform(rewrite, copy=False)
+
+def route_to_rollup(sql: str, params: dict, fresh_rollups: set) -> tuple[str, str | None]:
+    """Rewrite an aggregate over one fact table to read from the smallest fresh rollup that answers it.
+
+    Eligible queries are a single SELECT over `sales` or `churn` with no joins,
+    subqueries or window functions, that aggregate (GROUP BY, aggregates or DISTINCT)
+    using SUM of the measures and COUNT(*), and only use the date column truncated or
+    extracted at the rollup's grain or compared with period boundaries. Returns the
+    SQL to run and the rollup it reads from (None when the query stays on the fact table).
+    """
+    if not fresh_rollups:
+        return sql, None
+    try:
+        query = sqlglot.parse_one(sql, read="postgres")
+    except ParseError:
+        return sql, None
+
+    if not isinstance(query, exp.Select) or query.args.get("joins") or query.find(exp.Window):
+        return sql, None
+    if any(select is not query for select in query.find_all(exp.Select)):
+        return sql, None
+    source = _from_clause(query)
+    if source is None or not isinstance(source.this, exp.Table):
+        return sql, None
+    if not (query.args.get("group") or query.args.get("distinct") or query.find(exp.AggFunc)):
+        return sql, None
+
+    table_name = source.this.name.lower()
+    for rollup in ROLLUPS:
+        if rollup["source"] != table_name or rollup["name"] not in fresh_rollups:
+            continue
+        routed = _route(query, rollup, params)
+        if routed is not None:
+            metrics.incr(f"rollups.routed.{rollup['name']}")
+            routed = routed.transform(
+                lambda node: exp.Var(this=f":{node.name}") if isinstance(node, exp.Placeholder) and node.name else node
+            )
+            return routed.sql(dialect="postgres"), rollup["name"]
+    metrics.incr("rollups.fact_table")
+    return sql, None
+
+def route_query(session, sql: str, params: dict) -> tuple[str, str | None]:
+    """route_to_rollup with the rollups that are fresh right now"""
+    try:
+        # A savepoint keeps a failed lookup (e.g. no rollup_state table yet) from aborting the transaction
+        with session.begin_nested():
+            fresh = get_fresh_rollups(session)
+    except Exception as e:
+        print(f"⚠️ Rollup routing skipped: {str(e)}")
+        return sql, None
+    return route_to_rollup(sql, params, fresh)
+
+# -------------------------------------------------------------------
+# Script entrypoint
+# -------------------------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--force", action="store_true", help="Refresh rollups that are already fresh")
+    args = parser.parse_args()
+
+    session = SessionLocal()
+    try:
+        create_rollups(session)
+        refresh_rollups(session, force=args.force)
+    finally:
+        session.close()
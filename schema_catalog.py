@@ -0,0 +1,214 @@
+import os
+import json
+import time
+import threading
+from datetime import date, datetime
+from pathlib import Path
+
+from sqlalchemy import inspect, text
+
+import metrics
+from query_cache import fingerprint
+from database import SessionLocal, get_data_versions
+
+# -------------------------------------------------------------------
+# Configuration
+# -------------------------------------------------------------------
+SCHEMA_CATALOG_PATH = Path(os.getenv("SCHEMA_CATALOG_PATH", ".cache/schema_catalog.json"))
+SCHEMA_CATALOG_TABLES = [
+    table.strip().lower()
+    for table in os.getenv("SCHEMA_CATALOG_TABLES", "sales,churn,jobs").split(",") if table.strip()
+]
+SCHEMA_DIMENSION_COLUMNS = {
+    column.strip().lower()
+    for column in os.getenv("SCHEMA_DIMENSION_COLUMNS", "region,product,segment,job_name").split(",") if column.strip()
+}
+SCHEMA_MAX_DISTINCT = int(os.getenv("SCHEMA_MAX_DISTINCT", "50"))  # More distinct values than this aren't listed
+SCHEMA_REFRESH_SECONDS = int(os.getenv("SCHEMA_REFRESH_SECONDS", "3600"))  # How often the cached catalog is revalidated
+SCHEMA_PROMPT_BUDGET_CHARS = int(os.getenv("SCHEMA_PROMPT_BUDGET_CHARS", "1500"))
+
+CATALOG_FORMAT = 1  # Bump when the cached structure changes
+
+# -------------------------------------------------------------------
+# Introspection
+# -------------------------------------------------------------------
+def _json_value(value):
+    return value.isoformat() if isinstance(value, (date, datetime)) else value
+
+def _table_columns(conn, table_names: list) -> dict:
+    """Column names and types of the tables that exist"""
+    inspector = inspect(conn)
+    return {
+        table: [{"name": column["name"], "type": str(column["type"])} for column in inspector.get_columns(table)]
+        for table in table_names if inspector.has_table(table)
+    }
+
+def _row_count(session, table: str) -> int:
+    """Planner row estimate, or an exact count for tables that were never analyzed"""
+    try:
+        with session.begin_nested():
+            estimate = session.execute(
+                text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:table)"), {"table": table}
+            ).scalar()
+        if estimate is not None and estimate >= 0:
+            return int(estimate)
+    except Exception:
+        pass  # Not PostgreSQL
+    return session.execute(text(f'SELECT COUNT(*) FROM "{table}"')).scalar()
+
+def _scan_column(session, table: str, column: dict) -> dict:
+    """Distinct values of a dimension column and the range of a date column"""
+    name, column_type = column["name"], column["type"].upper()
+    if name.lower() in SCHEMA_DIMENSION_COLUMNS:
+        rows = session.execute(text(
+            f'SELECT "{name}" FROM "{table}" WHERE "{name}" IS NOT NULL '
+            f'GROUP BY "{name}" ORDER BY COUNT(*) DESC LIMIT :limit'
+        ), {"limit": SCHEMA_MAX_DISTINCT + 1}).scalars().all()
+        if len(rows) <= SCHEMA_MAX_DISTINCT:
+            column["values"] = sorted(str(value) for value in rows)
+    elif column_type.startswith(("DATE", "TIMESTAMP")):
+        low, high = session.execute(text(f'SELECT MIN("{name}"), MAX("{name}") FROM "{table}"')).one()
+        if low is not None:
+            column["range"] = [_json_value(low), _json_value(high)]
+    return column
+
+def scan_schema(session, table_names: list) -> dict:
+    """Columns, row counts, dimension values and date ranges of the given tables"""
+    started = time.perf_counter()
+    columns = _table_columns(session.connection(), table_names)
+    tables = {
+        table: {
+            "rows": _row_count(session, table),
+            "columns": [_scan_column(session, table, column) for column in table_columns],
+        }
+        for table, table_columns in columns.items()
+    }
+    metrics.observe("schema_catalog.scan_seconds", time.perf_counter() - started)
+    return tables
+
+# -------------------------------------------------------------------
+# Catalog
+# -------------------------------------------------------------------
+class SchemaCatalog:
+    """Introspected schema cached on disk and revalidated on an interval.
+
+    The cache stays valid while the column definitions and the data versions of
+    the catalogued tables are unchanged, so a restart only rescans after a schema
+    change or a reload of the data.
+    """
+
+    def __init__(self, path: Path = SCHEMA_CATALOG_PATH, tables: list = None,
+                 refresh_seconds: int = SCHEMA_REFRESH_SECONDS, session_factory=SessionLocal):
+        self.path = Path(path)
+        self.tables = tables or SCHEMA_CATALOG_TABLES
+        self.refresh_seconds = refresh_seconds
+        self.session_factory = session_factory
+        self._lock = threading.Lock()
+        self._catalog = None
+        self._checked_at = 0.0
+
+    def _read_cache(self) -> dict | None:
+        try:
+            catalog = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        return catalog if catalog.get("format") == CATALOG_FORMAT else None
+
+    def _write_cache(self, catalog: dict):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.path.with_suffix(".tmp")
+        temp_path.write_text(json.dumps(catalog, ensure_ascii=False, indent=1), encoding="utf-8")
+        temp_path.replace(self.path)
+
+    def refresh(self, force: bool = False) -> dict | None:
+        """Revalidate the catalog against the database and rescan only if it is stale"""
+        with self._lock:
+            catalog = self._catalog or self._read_cache()
+            session = self.session_factory()
+            try:
+                columns = _table_columns(session.connection(), self.tables)
+                signature = {
+                    "columns": fingerprint(columns),
+                    "data_versions": get_data_versions(session, list(columns)),
+                }
+                if force or not catalog or catalog["signature"] != signature:
+                    print("🔄 Scanning database schema...")
+                    catalog = {
+                        "format": CATALOG_FORMAT,
+                        "built_at": time.time(),
+                        "signature": signature,
+                        "tables": scan_schema(session, list(columns)),
+                    }
+                    self._write_cache(catalog)
+                    metrics.incr("schema_catalog.scans")
+                else:
+                    metrics.incr("schema_catalog.reused")
+            except Exception as e:
+                # Keep serving the last known catalog while the database is unreachable
+                print(f"⚠️ Schema catalog refresh failed: {str(e)}")
+            finally:
+                session.close()
+            self._catalog = catalog
+            self._checked_at = time.monotonic()
+            return catalog
+
+    def current(self) -> dict | None:
+        """The catalog, revalidated first if the refresh interval has passed"""
+        if not self._checked_at or time.monotonic() - self._checked_at > self.refresh_seconds:
+            return self.refresh()
+        return self._catalog
+
+    @property
+    def version(self) -> str:
+        """Fingerprint of the columns and dimension values (row counts excluded), for cache keys"""
+        catalog = self.current()
+        if not catalog:
+            return ""
+        return fingerprint({
+            table: [{key: value for key, value in column.items() if key != "range"} for column in info["columns"]]
+            for table, info in catalog["tables"].items()
+        })
+
+    def dimension_values(self, column: str) -> list:
+        """Catalogued values of a dimension column across all tables"""
+        values = set()
+        for info in (self.current() or {}).get("tables", {}).values():
+            for catalogued in info["columns"]:
+                if catalogued["name"] == column:
+                    values.update(catalogued.get("values") or [])
+        return sorted(values)
+
+    def describe(self, tables=None, budget_chars: int = SCHEMA_PROMPT_BUDGET_CHARS) -> str:
+        """Compact schema description for prompts, trimmed to fit `budget_chars`.
+
+        Value lists are shortened first, then dropped, then the date ranges; an empty
+        string means there is no catalog yet.
+        """
+        catalog = self.current()
+        if not catalog:
+            return ""
+        selected = {
+            table: info for table, info in catalog["tables"].items() if tables is None or table in tables
+        }
+
+        description = ""
+        for max_values, with_ranges in ((None, True), (10, True), (5, True), (0, True), (0, False)):
+            lines = ["", "Available Tables ({...} lists a column's values, [...] the span of a date column):"]
+            for table, info in selected.items():
+                columns = []
+                for column in info["columns"]:
+                    part = f"{column['name']} {column['type']}"
+                    values = column.get("values")
+                    if values and max_values != 0:
+                        shown = values if max_values is None else values[:max_values]
+                        more = f", … +{len(values) - len(shown)} more" if len(shown) < len(values) else ""
+                        part += " {" + ", ".join(shown) + more + "}"
+                    if with_ranges and column.get("range"):
+                        part += f" [{column['range'][0][:10]} .. {column['range'][1][:10]}]"
+                    columns.append(part)
+                lines.append(f"- {table}({', '.join(columns)}) ~{info['rows']:,} rows")
+            description = "\n".join(lines) + "\n"
+            if len(description) <= budget_chars:
+                break
+        metrics.set_gauge("schema_catalog.prompt_chars", len(description))
+        return description[:budget_chars]
@@ -9,8 +9,11 @@ from database import (
     Churn,
     Job,
     JobLog,
-    IncidentKB
+    IncidentKB,
+    bump_data_version
 )
+from rollups import create_rollups, refresh_rollups
+from columnar_mirror import ColumnarMirror, ANALYTICS_ENGINE
 
 def seed():
     session = SessionLocal()
@@ -33,6 +36,11 @@ def seed():
         session.bulk_insert_mappings(Churn, churn_df.to_dict(orient="records"))
         session.commit()
         print(f"✅ Seeded {len(sales_df)} sales rows and {len(churn_df)} churn rows.")
+        bump_data_version(session, "sales", "churn")
+        create_rollups(session)
+        refresh_rollups(session, "sales", "churn")
+        if ANALYTICS_ENGINE == "duckdb":
+            ColumnarMirror().refresh(session)
 
         # ── 3) Seed jobs metadata ───────────────────────────
         jobs = [
@@ -101,6 +109,7 @@ def seed():
         session.bulk_insert_mappings(JobLog, job_logs)
         session.commit()
         print(f"✅ Seeded {len(job_logs)} job log entries.")
+        bump_data_version(session, "jobs", "incident_kb", "job_logs")
 
     except Exception as e:
         session.rollback()
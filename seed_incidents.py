@@ -1,6 +1,6 @@
 import pandas as pd
 from sqlalchemy import text
-from database import SessionLocal, Job, JobLog, IncidentKB
+from database import SessionLocal, Job, JobLog, IncidentKB, bump_data_version
 
 def seed_incidents():
     session = SessionLocal()
@@ -20,6 +20,7 @@ def seed_incidents():
         session.bulk_insert_mappings(JobLog,    logs_df.to_dict(orient="records"))
 
         session.commit()
+        bump_data_version(session, "jobs", "incident_kb", "job_logs")
         print("✅ Seeded jobs, incident_kb, and job_logs.")
     except Exception as e:
         session.rollback()
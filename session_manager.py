@@ -1,10 +1,20 @@
 import streamlit as st
 import uuid
 from datetime import datetime
+import tracing
 from database import (
-    SessionLocal, save_chat_session, load_chat_session, 
-    load_all_chat_sessions, delete_chat_session
+    SessionLocal, load_chat_session, load_chat_messages,
+    load_all_chat_sessions, list_chat_sessions, delete_chat_session
 )
+from session_writer import SessionWriter
+from chat_messages import Message, MessageMetadata, CHAT_MESSAGE_WINDOW
+
+@st.cache_resource
+def init_session_writer():
+    """Write-behind persistence of chat messages shared by all sessions"""
+    return SessionWriter()
+
+session_writer = init_session_writer()
 
 def get_or_create_session_id():
     """Get existing session ID from browser session or create a new one"""
@@ -12,6 +22,15 @@ def get_or_create_session_id():
         st.session_state.chat_session_id = str(uuid.uuid4())
     return st.session_state.chat_session_id
 
+def show_loaded_session(session_data: dict):
+    """Make a session loaded from the database the current one, keeping only its latest window in memory"""
+    st.session_state.chat_session_id = session_data['session_id']
+    st.session_state.current_messages = [Message.from_record(msg) for msg in session_data['messages']]
+    st.session_state.session_title = session_data['title']
+    st.session_state.has_earlier_messages = session_data['has_earlier_messages']
+    st.session_state.persisted_message_ids = {msg.id for msg in st.session_state.current_messages}
+    st.session_state.queued_message_ids = set()
+
 def initialize_chat_system():
     """Initialize the chat system with database-based memory"""
     # Get current mode for module-specific chats
@@ -27,10 +46,9 @@ def initialize_chat_system():
     if "session_loaded" not in st.session_state:
         db = SessionLocal()
         try:
-            session_data = load_chat_session(db, session_id)
+            session_data = load_chat_session(db, session_id, limit=CHAT_MESSAGE_WINDOW)
             if session_data and session_data['module'] == current_mode:
-                st.session_state.current_messages = session_data['messages']
-                st.session_state.session_title = session_data['title']
+                show_loaded_session(session_data)
             st.session_state.session_loaded = True
         finally:
             db.close()
@@ -44,51 +62,70 @@ def create_new_chat_session():
     # Create new session
     st.session_state.chat_session_id = str(uuid.uuid4())
     st.session_state.current_messages = []
+    st.session_state.persisted_message_ids = set()
+    st.session_state.queued_message_ids = set()
+    st.session_state.has_earlier_messages = False
+    st.session_state.pop('session_title', None)
+    st.session_state.session_page_cursors = [None]
     st.session_state.session_loaded = False
 
+def apply_write_acknowledgements():
+    """Mark messages the writer has stored as persisted; dropped ones become unsaved again"""
+    written, dropped = session_writer.acknowledged(get_or_create_session_id())
+    st.session_state.setdefault('persisted_message_ids', set()).update(written)
+    st.session_state.setdefault('queued_message_ids', set()).difference_update(written | dropped)
+
 def save_current_session():
-    """Save the current chat session to database"""
+    """Write the current chat session's unsaved messages to the database"""
     if not st.session_state.get('current_messages'):
         return
     
+    apply_write_acknowledgements()
+    persisted = st.session_state.persisted_message_ids
+    queued = st.session_state.queued_message_ids
+    unsaved = [msg for msg in st.session_state.current_messages if msg.id not in persisted and msg.id not in queued]
+    if not unsaved:
+        return
+    
     session_id = get_or_create_session_id()
     current_mode = st.session_state.get('current_mode', 'SQL Query Assistant')
     
-    # Create a title from the first user message (truncated)
-    first_user_msg = next((msg for msg in st.session_state.current_messages if msg["role"] == "user"), None)
-    if first_user_msg:
-        title = first_user_msg["content"][:40] + "..." if len(first_user_msg["content"]) > 40 else first_user_msg["content"]
-    else:
-        title = f"Chat {datetime.now().strftime('%H:%M')}"
+    # Create a title from the first user message (truncated); once the session's start
+    # is out of the in-memory window, keep the title it already has
+    title = st.session_state.get('session_title') if st.session_state.get('has_earlier_messages') else None
+    if not title:
+        first_user_msg = next((msg for msg in st.session_state.current_messages if msg.role == "user"), None)
+        if first_user_msg:
+            title = first_user_msg.content[:40] + "..." if len(first_user_msg.content) > 40 else first_user_msg.content
+        else:
+            title = f"Chat {datetime.now().strftime('%H:%M')}"
     
-    # Save to database
-    db = SessionLocal()
-    try:
-        success = save_chat_session(
-            db=db,
+    # Save to database (queued for the background writer unless SESSION_DURABILITY=sync)
+    with tracing.span("session_save", messages=len(unsaved)):
+        success = session_writer.submit(
             session_id=session_id,
             title=title,
             module=current_mode,
-            messages=st.session_state.current_messages
+            messages=[msg.to_record() for msg in unsaved]
         )
-        if success:
-            st.session_state.session_title = title
-    finally:
-        db.close()
+    if success:
+        st.session_state.session_title = title
+        # Persisted once the writer acknowledges them (at once in sync mode)
+        queued.update(msg.id for msg in unsaved)
+        apply_write_acknowledgements()
 
 def load_session(session_id: str):
     """Load a specific chat session"""
     # Save current session first
     save_current_session()
     
-    # Load the selected session
+    # Load the selected session once its own queued messages are written
+    session_writer.wait_for(session_id)
     db = SessionLocal()
     try:
-        session_data = load_chat_session(db, session_id)
+        session_data = load_chat_session(db, session_id, limit=CHAT_MESSAGE_WINDOW)
         if session_data:
-            st.session_state.chat_session_id = session_id
-            st.session_state.current_messages = session_data['messages']
-            st.session_state.session_title = session_data['title']
+            show_loaded_session(session_data)
             # Force mode switch if needed
             if session_data['module'] != st.session_state.get('current_mode'):
                 st.session_state.current_mode = session_data['module']
@@ -112,28 +149,64 @@ def delete_session(session_id: str):
         db.close()
 
 def load_all_sessions(module: str = None):
-    """Load all chat sessions for display"""
+    """Load all chat sessions for display (messages still queued may not be counted yet)"""
     db = SessionLocal()
     try:
         return load_all_chat_sessions(db, module)
     finally:
         db.close()
 
+def load_sessions_page(module: str = None, cursor: tuple = None, limit: int = 5):
+    """One page of chat sessions for display and the cursor of the next page (None on the last).
+
+    Runs on every rerun, so it doesn't wait for the writer; a session whose first
+    messages are still queued shows up on a later rerun.
+    """
+    db = SessionLocal()
+    try:
+        return list_chat_sessions(db, module, limit=limit, cursor=cursor)
+    finally:
+        db.close()
+
+def load_earlier_messages(limit: int = CHAT_MESSAGE_WINDOW):
+    """Page the messages before the oldest one in memory back in from the database"""
+    messages = st.session_state.get('current_messages', [])
+    if not messages or not st.session_state.get('has_earlier_messages'):
+        return
+    
+    session_writer.wait_for(get_or_create_session_id())
+    db = SessionLocal()
+    try:
+        oldest = messages[0]
+        earlier, has_earlier = load_chat_messages(
+            db, get_or_create_session_id(), limit=limit, before=(oldest.timestamp, oldest.id)
+        )
+    finally:
+        db.close()
+    st.session_state.current_messages = [Message.from_record(msg) for msg in earlier] + messages
+    st.session_state.persisted_message_ids.update(msg["id"] for msg in earlier)
+    st.session_state.has_earlier_messages = has_earlier
+
+def trim_message_window():
+    """Drop the oldest saved messages beyond CHAT_MESSAGE_WINDOW; they can be paged back in.
+
+    Messages still queued, or dropped by the writer, stay in memory until they are written.
+    """
+    apply_write_acknowledgements()
+    messages = st.session_state.current_messages
+    persisted = st.session_state.get('persisted_message_ids', set())
+    while len(messages) > CHAT_MESSAGE_WINDOW and messages[0].id in persisted:
+        persisted.discard(messages.pop(0).id)
+        st.session_state.has_earlier_messages = True
+
 def add_message(role: str, content: str, metadata: dict = None):
     """Add a message to the current chat session"""
-    message = {
-        "role": role,
-        "content": content,
-        "timestamp": datetime.now(),
-        "id": str(uuid.uuid4())
-    }
-    if metadata:
-        message.update(metadata)
-    
+    message = Message(role=role, content=content, metadata=MessageMetadata.from_dict(metadata))
     st.session_state.current_messages.append(message)
     
-    # Auto-save after each message
+    # Auto-save after each message (only the new one is written)
     save_current_session()
+    trim_message_window()
 
 def get_session_memory():
     """Get the conversation history for the current session - useful for AI context"""
@@ -143,8 +216,8 @@ def get_session_memory():
     conversation_history = []
     for msg in messages[-10:]:  # Last 10 messages for context
         conversation_history.append({
-            "role": msg["role"],
-            "content": msg["content"]
+            "role": msg.role,
+            "content": msg.content
         })
     
-    return conversation_history 
\ No newline at end of file
+    return conversation_history
@@ -0,0 +1,198 @@
+import os
+import time
+import queue
+import atexit
+import threading
+
+import metrics
+from database import SessionLocal, append_chat_batch
+
+# -------------------------------------------------------------------
+# Configuration
+# -------------------------------------------------------------------
+SESSION_DURABILITY = os.getenv("SESSION_DURABILITY", "async")  # sync: write before returning, async: write-behind
+SESSION_WRITE_QUEUE_SIZE = int(os.getenv("SESSION_WRITE_QUEUE_SIZE", "1000"))  # Pending saves before callers block
+SESSION_WRITE_BATCH_SIZE = int(os.getenv("SESSION_WRITE_BATCH_SIZE", "200"))  # Messages per transaction
+SESSION_WRITE_LINGER_MS = int(os.getenv("SESSION_WRITE_LINGER_MS", "50"))  # Wait for more saves to batch with
+SESSION_WRITE_RETRIES = 3
+ACKNOWLEDGEMENT_RETENTION_SECONDS = 3600  # Outcomes of sessions nobody asks about again are forgotten after this
+
+# -------------------------------------------------------------------
+# Write-behind queue
+# -------------------------------------------------------------------
+class SessionWriter:
+    """Persists chat messages off the request path.
+
+    In async mode saves go onto a bounded queue that a background thread drains,
+    writing the saves of all sessions that arrive within SESSION_WRITE_LINGER_MS in
+    one transaction. A full queue blocks the caller until the writer catches up,
+    and pending saves are flushed at interpreter exit. Sync mode writes before
+    returning, as saves did before the queue.
+
+    Callers learn which queued messages were written, and which were dropped after
+    the retries, from `acknowledged`; only written ones are safe to evict from memory.
+    """
+
+    def __init__(self, durability: str = SESSION_DURABILITY, max_queue: int = SESSION_WRITE_QUEUE_SIZE,
+                 session_factory=SessionLocal):
+        self.durability = durability
+        self.session_factory = session_factory
+        self.queue = queue.Queue(maxsize=max_queue)
+        # Saves of each session still queued or being written, so readers wait only on their own
+        self._pending = {}
+        self._pending_changed = threading.Condition()
+        # session_id → message ids written or dropped since the session last asked, and when
+        self._acknowledged = {}
+        self._last_prune = time.monotonic()
+        self._thread = None
+        if durability == "async":
+            self._thread = threading.Thread(target=self._run, name="session-writer", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def _write(self, sessions: list) -> bool:
+        db = self.session_factory()
+        try:
+            return append_chat_batch(db, sessions)
+        finally:
+            db.close()
+
+    def submit(self, session_id: str, title: str, module: str, messages: list) -> bool:
+        """Persist new messages of a session; in async mode this returns once they are queued"""
+        save = {"session_id": session_id, "title": title, "module": module, "messages": list(messages)}
+        if self._thread is None or not self._thread.is_alive():
+            written = self._write([save])
+            if written:
+                with self._pending_changed:
+                    self._acknowledge(save, written)
+            return written
+
+        with self._pending_changed:
+            self._pending[session_id] = self._pending.get(session_id, 0) + 1
+        try:
+            self.queue.put_nowait(save)
+        except queue.Full:
+            # Backpressure: wait for room rather than writing around the queue, which could reorder messages
+            metrics.incr("session_writer.backpressure")
+            started = time.perf_counter()
+            self.queue.put(save)
+            metrics.observe("session_writer.enqueue_wait_seconds", time.perf_counter() - started)
+        metrics.set_gauge("session_writer.queue_depth", self.queue.qsize())
+        return True
+
+    def _flush(self, saves: list) -> bool:
+        # Consecutive saves of one session become one entry, keeping the latest title
+        sessions = {}
+        for save in saves:
+            merged = sessions.setdefault(save["session_id"], {**save, "messages": []})
+            merged.update(title=save["title"], module=save["module"])
+            merged["messages"].extend(save["messages"])
+        message_count = sum(len(save["messages"]) for save in saves)
+
+        started = time.perf_counter()
+        for attempt in range(1, SESSION_WRITE_RETRIES + 1):
+            # Inserts are idempotent on message_id, so a retry can't duplicate messages
+            if self._write(list(sessions.values())):
+                metrics.observe("session_writer.flush_seconds", time.perf_counter() - started)
+                metrics.incr("session_writer.messages_written", message_count)
+                return True
+            time.sleep(0.5 * attempt)
+        metrics.incr("session_writer.messages_dropped", message_count)
+        print(f"❌ Dropped {message_count} chat messages of {len(sessions)} sessions after {SESSION_WRITE_RETRIES} failed writes; "
+              f"they are resubmitted with their session's next save")
+        return False
+
+    def _run(self):
+        while True:
+            save = self.queue.get()
+            if save is None:
+                self.queue.task_done()
+                return
+            saves, stopping = [save], False
+            message_count = len(save["messages"])
+            deadline = time.monotonic() + SESSION_WRITE_LINGER_MS / 1000
+            while message_count < SESSION_WRITE_BATCH_SIZE:
+                try:
+                    save = self.queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if save is None:
+                    stopping = True
+                    break
+                saves.append(save)
+                message_count += len(save["messages"])
+
+            written = False
+            try:
+                written = self._flush(saves)
+            except Exception as e:
+                print(f"❌ Chat message writer failed: {str(e)}")
+            finally:
+                self._done(saves, written)
+                for _ in range(len(saves) + stopping):
+                    self.queue.task_done()
+                metrics.set_gauge("session_writer.queue_depth", self.queue.qsize())
+            if stopping:
+                return
+
+    def _acknowledge(self, save: dict, written: bool):
+        # Called with _pending_changed held
+        now = time.monotonic()
+        entry = self._acknowledged.setdefault(save["session_id"], {"written": set(), "dropped": set()})
+        entry["written" if written else "dropped"].update(message["id"] for message in save["messages"])
+        entry["at"] = now
+        if now - self._last_prune > 60:
+            self._last_prune = now
+            stale = [sid for sid, e in self._acknowledged.items() if now - e["at"] > ACKNOWLEDGEMENT_RETENTION_SECONDS]
+            for session_id in stale:
+                del self._acknowledged[session_id]
+
+    def _done(self, saves: list, written: bool):
+        with self._pending_changed:
+            for save in saves:
+                self._acknowledge(save, written)
+                remaining = self._pending.get(save["session_id"], 0) - 1
+                if remaining > 0:
+                    self._pending[save["session_id"]] = remaining
+                else:
+                    self._pending.pop(save["session_id"], None)
+            self._pending_changed.notify_all()
+
+    def acknowledged(self, session_id: str) -> tuple[set, set]:
+        """Ids of a session's messages written and dropped since the last call"""
+        with self._pending_changed:
+            entry = self._acknowledged.pop(session_id, None)
+        return (entry["written"], entry["dropped"]) if entry else (set(), set())
+
+    def wait_for(self, session_id: str, timeout: float = None) -> bool:
+        """Wait until one session's queued saves have been written (or dropped); False on timeout"""
+        if self._thread is None or not self._thread.is_alive():
+            return True
+        started = time.perf_counter()
+        with self._pending_changed:
+            done = self._pending_changed.wait_for(lambda: session_id not in self._pending, timeout)
+        metrics.observe("session_writer.wait_seconds", time.perf_counter() - started)
+        return done
+
+    def flush(self):
+        """Wait until every queued save has been written (or dropped)"""
+        if self._thread is not None and self._thread.is_alive():
+            self.queue.join()
+
+    def stats(self) -> dict:
+        """Queue depth, flush latency and message counters"""
+        return {
+            "durability": self.durability,
+            "queue_depth": self.queue.qsize(),
+            "flush_p50_seconds": metrics.percentile("session_writer.flush_seconds", 50),
+            "flush_p95_seconds": metrics.percentile("session_writer.flush_seconds", 95),
+            "messages_written": metrics.get_counter("session_writer.messages_written"),
+            "messages_dropped": metrics.get_counter("session_writer.messages_dropped"),
+            "backpressure_waits": metrics.get_counter("session_writer.backpressure"),
+        }
+
+    def close(self):
+        """Write the pending saves and stop the background thread"""
+        if self._thread is not None and self._thread.is_alive():
+            self.queue.put(None)
+            self._thread.join()
@@ -0,0 +1,116 @@
+import os
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import ParseError
+
+import metrics
+
+# -------------------------------------------------------------------
+# Configuration
+# -------------------------------------------------------------------
+SQL_ROW_LIMIT = int(os.getenv("SQL_ROW_LIMIT", "1000"))  # LIMIT injected into or clamped on every query
+SQL_STATEMENT_TIMEOUT_MS = int(os.getenv("SQL_STATEMENT_TIMEOUT_MS", "15000"))
+SQL_ALLOWED_TABLES = {
+    table.strip().lower()
+    for table in os.getenv("SQL_ALLOWED_TABLES", "sales,churn").split(",") if table.strip()
+}
+
+# Node types that write, change the schema, take locks or run arbitrary commands
+FORBIDDEN_NODES = tuple(
+    getattr(exp, name) for name in (
+        "Insert", "Update", "Delete", "Merge", "Create", "Drop", "Alter", "AlterTable", "TruncateTable",
+        "Command", "Into", "Lock", "Set", "Grant", "Copy", "Transaction", "Commit", "Rollback",
+    ) if hasattr(exp, name)
+)
+
+# Functions that sleep, touch the filesystem, reach other servers, change server state
+# or reveal server settings, versions, addresses and roles
+FORBIDDEN_FUNCTIONS = {
+    "pg_sleep", "pg_sleep_for", "pg_sleep_until", "pg_read_file", "pg_read_binary_file", "pg_ls_dir",
+    "pg_stat_file", "lo_import", "lo_export", "lo_get", "lo_put", "dblink", "dblink_exec", "dblink_connect",
+    "pg_terminate_backend", "pg_cancel_backend", "pg_reload_conf", "pg_rotate_logfile", "set_config",
+    "pg_advisory_lock", "pg_advisory_xact_lock", "query_to_xml", "generate_series",
+    "current_setting", "version", "current_version", "inet_server_addr", "inet_server_port", "inet_client_addr",
+    "inet_client_port", "current_user", "session_user", "current_role", "current_database", "current_catalog",
+    "current_schema", "current_schemas", "pg_backend_pid", "pg_postmaster_start_time", "pg_conf_load_time",
+    "pg_current_logfile", "pg_ls_logdir", "pg_ls_waldir", "pg_get_userbyid", "pg_has_role",
+    "has_table_privilege", "has_schema_privilege", "has_database_privilege", "txid_current",
+}
+
+# Schemas the allowed tables may be qualified with
+ALLOWED_SCHEMAS = {"", "public"}
+
+# -------------------------------------------------------------------
+# Guard
+# -------------------------------------------------------------------
+class SQLGuardError(ValueError):
+    """The SQL is not a single read-only query over the allowed tables"""
+
+def _function_name(node: exp.Func) -> str:
+    if isinstance(node, exp.Anonymous):
+        return str(node.name).lower()
+    return node.sql_name().lower()
+
+def _clamp_limit(query: exp.Query, max_rows: int) -> tuple[int, bool]:
+    """Add LIMIT max_rows, or lower a larger one; returns the effective limit and whether it changed"""
+    limit = query.args.get("limit")
+    value = limit.expression if isinstance(limit, exp.Limit) else None
+    if isinstance(value, exp.Literal) and not value.is_string and int(value.this) <= max_rows:
+        return int(value.this), False
+    query.set("limit", None)
+    query.limit(max_rows, copy=False)
+    return max_rows, True
+
+def guard_sql(sql: str, max_rows: int = SQL_ROW_LIMIT) -> tuple[str, dict]:
+    """Validate generated SQL and return it with a safe LIMIT.
+
+    Parses the statement (PostgreSQL dialect) and rejects anything other than one
+    SELECT/WITH/set query that reads only the allowed tables of the public schema
+    and calls no dangerous functions. Raises SQLGuardError with a user-presentable reason.
+    """
+    try:
+        statements = [s for s in sqlglot.parse(sql, read="postgres") if s is not None]
+    except ParseError as e:
+        metrics.incr("sql_guard.rejected")
+        raise SQLGuardError(f"Could not parse the query: {str(e).splitlines()[0]}") from e
+
+    if len(statements) != 1:
+        metrics.incr("sql_guard.rejected")
+        raise SQLGuardError(f"Expected a single statement, got {len(statements)}")
+    query = statements[0]
+
+    reason = None
+    if not isinstance(query, exp.Query):
+        reason = f"Only read-only queries are allowed, got {query.key.upper()}"
+    elif (forbidden := next(query.find_all(*FORBIDDEN_NODES), None)) is not None:
+        reason = f"{forbidden.key.upper()} is not allowed in a read-only query"
+    else:
+        functions = {_function_name(node) for node in query.find_all(exp.Func)}
+        cte_names = {cte.alias_or_name.lower() for cte in query.find_all(exp.CTE)}
+        tables = {table.name.lower() for table in query.find_all(exp.Table)}
+        schemas = {
+            part.lower() for table in query.find_all(exp.Table) for part in (table.db, table.catalog)
+        } - ALLOWED_SCHEMAS
+        if functions & FORBIDDEN_FUNCTIONS:
+            reason = f"Function {sorted(functions & FORBIDDEN_FUNCTIONS)[0]} is not allowed"
+        elif "" in tables:
+            reason = "Table functions are not allowed"
+        elif schemas:
+            reason = f"Schema {sorted(schemas)[0]} is not queryable"
+        elif tables - cte_names - SQL_ALLOWED_TABLES:
+            reason = f"Table {sorted(tables - cte_names - SQL_ALLOWED_TABLES)[0]} is not queryable"
+    if reason:
+        metrics.incr("sql_guard.rejected")
+        raise SQLGuardError(reason)
+
+    limit, limit_applied = _clamp_limit(query, max_rows)
+    if limit_applied:
+        metrics.incr("sql_guard.limit_applied")
+    metrics.incr("sql_guard.passed")
+
+    # Keep SQLAlchemy-style :name bind parameters as they were written
+    query = query.transform(
+        lambda node: exp.Var(this=f":{node.name}") if isinstance(node, exp.Placeholder) and node.name else node
+    )
+    return query.sql(dialect="postgres"), {"limit": limit, "limit_applied": limit_applied, "max_rows": max_rows}
@@ -0,0 +1,285 @@
+import re
+from datetime import date, datetime
+
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import ParseError
+
+import metrics
+from dimension_aliases import resolve_alias, column_values
+
+# -------------------------------------------------------------------
+# Date ranges
+# -------------------------------------------------------------------
+def _next_month(day: date) -> date:
+    return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+
+def period_range(year: int, month: int = None, quarter: int = None) -> tuple:
+    """Half-open [start, end) range of a year, quarter or month"""
+    if month:
+        start = date(year, month, 1)
+        return start, _next_month(start)
+    if quarter:
+        start = date(year, 3 * (quarter - 1) + 1, 1)
+        return start, _next_month(_next_month(_next_month(start)))
+    return date(year, 1, 1), date(year + 1, 1, 1)
+
+def truncated_range(unit: str, start: date) -> tuple | None:
+    """Range covered by date_trunc(unit, col) = start, or None if start isn't a unit boundary"""
+    if start.day != 1:
+        return None
+    if unit == "MONTH":
+        return start, _next_month(start)
+    if unit == "QUARTER" and start.month % 3 == 1:
+        return period_range(start.year, quarter=(start.month + 2) // 3)
+    if unit == "YEAR" and start.month == 1:
+        return period_range(start.year)
+    return None
+
+def _date_literal(day: date) -> exp.Expression:
+    return exp.cast(exp.Literal.string(day.isoformat()), "DATE")
+
+def _range_predicate(column: exp.Column, start: date, end: date) -> exp.Expression:
+    return exp.and_(
+        exp.GTE(this=column.copy(), expression=_date_literal(start)),
+        exp.LT(this=column.copy(), expression=_date_literal(end)),
+    )
+
+def _ranges_predicate(column: exp.Column, ranges: list) -> exp.Expression:
+    """OR of ranges, with adjacent ones merged (so 2023 and 2024 become one range)"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(end, merged[-1][1]))
+        else:
+            merged.append((start, end))
+    predicates = [_range_predicate(column, start, end) for start, end in merged]
+    return exp.paren(exp.or_(*predicates)) if len(predicates) > 1 else predicates[0]
+
+# -------------------------------------------------------------------
+# Predicate matching
+# -------------------------------------------------------------------
+def _unwrap(node: exp.Expression) -> exp.Expression:
+    while isinstance(node, (exp.Paren, exp.Cast)):
+        node = node.this
+    return node
+
+def _int_value(node: exp.Expression) -> int | None:
+    node = _unwrap(node)
+    if isinstance(node, exp.Literal) and str(node.this).isdigit():
+        return int(node.this)
+    return None
+
+def _date_value(node: exp.Expression) -> date | None:
+    node = _unwrap(node)
+    if isinstance(node, exp.Literal) and node.is_string:
+        try:
+            return datetime.strptime(str(node.this)[:10], "%Y-%m-%d").date()
+        except ValueError:
+            return None
+    return None
+
+def _date_function(node: exp.Expression) -> tuple | None:
+    """("extract", part, column) or ("trunc", unit, column) for a function of a plain column"""
+    node = _unwrap(node)
+    if isinstance(node, exp.Extract) and isinstance(node.expression, exp.Column):
+        return "extract", node.this.name.upper(), node.expression
+    if isinstance(node, (exp.TimestampTrunc, exp.DateTrunc)) and isinstance(node.this, exp.Column):
+        unit = node.args.get("unit")
+        return "trunc", (unit.name if unit is not None else "").upper(), node.this
+    return None
+
+def _comparison(conjunct: exp.Expression) -> tuple | None:
+    """(function, values) for `f(col) = literal` or `f(col) IN (literals)`"""
+    if isinstance(conjunct, exp.EQ):
+        left, right = conjunct.this, conjunct.expression
+        function = _date_function(left)
+        if function is None:
+            function, right = _date_function(right), left
+        return (function, [right]) if function else None
+    if isinstance(conjunct, exp.In) and conjunct.expressions:
+        function = _date_function(conjunct.this)
+        return (function, conjunct.expressions) if function else None
+    return None
+
+# -------------------------------------------------------------------
+# Rewrite
+# -------------------------------------------------------------------
+def _rewrite_conjuncts(conjuncts: list) -> tuple[list, int]:
+    """Replace EXTRACT/date_trunc filters in one AND-chain with range predicates"""
+    parts = {}  # column sql -> {part: (values, index)}
+    columns = {}
+    remaining = list(conjuncts)
+    rewritten = 0
+
+    for index, conjunct in enumerate(conjuncts):
+        match = _comparison(conjunct)
+        if not match:
+            continue
+        (kind, part, column), literals = match
+        key = column.sql(dialect="postgres")
+        columns[key] = column
+
+        if kind == "trunc":
+            starts = [_date_value(literal) for literal in literals]
+            ranges = [truncated_range(part, start) if start else None for start in starts]
+            if ranges and all(ranges):
+                remaining[index] = _ranges_predicate(column, ranges)
+                rewritten += 1
+        elif part in ("YEAR", "MONTH", "QUARTER"):
+            values = [_int_value(literal) for literal in literals]
+            if values and all(value is not None for value in values):
+                parts.setdefault(key, {})[part] = (values, index)
+
+    for key, found in parts.items():
+        if "YEAR" not in found:
+            # A month or quarter without a year spans every year, so no single range exists
+            continue
+        years, year_index = found["YEAR"]
+        sub_part = "MONTH" if "MONTH" in found else "QUARTER" if "QUARTER" in found else None
+        if sub_part:
+            sub_values, sub_index = found[sub_part]
+            if not all(1 <= v <= (12 if sub_part == "MONTH" else 4) for v in sub_values):
+                continue
+            ranges = [
+                period_range(year, **{sub_part.lower(): value}) for year in years for value in sub_values
+            ]
+            remaining[sub_index] = None
+        else:
+            ranges = [period_range(year) for year in years]
+        remaining[year_index] = _ranges_predicate(columns[key], ranges)
+        rewritten += 1
+
+    return [conjunct for conjunct in remaining if conjunct is not None], rewritten
+
+def make_date_filters_sargable(sql: str) -> tuple[str, int]:
+    """Rewrite EXTRACT/date_trunc equality and IN filters on date columns into half-open ranges.
+
+    `EXTRACT(YEAR FROM date) = 2024 AND EXTRACT(MONTH FROM date) = 1` becomes
+    `date >= '2024-01-01' AND date < '2024-02-01'`, which an index on the column can
+    serve. Only WHERE clauses are touched; returns the SQL and the number of rewrites.
+    """
+    try:
+        query = sqlglot.parse_one(sql, read="postgres")
+    except ParseError:
+        return sql, 0
+
+    total = 0
+    for where in list(query.find_all(exp.Where)):
+        conjuncts = list(where.this.flatten()) if isinstance(where.this, exp.And) else [where.this]
+        conjuncts, rewritten = _rewrite_conjuncts(conjuncts)
+        if rewritten:
+            where.set("this", exp.and_(*conjuncts))
+            total += rewritten
+
+    if not total:
+        return sql, 0
+    metrics.incr("sql_rewrite.sargable_dates", total)
+    return _to_sql(query), total
+
+def _to_sql(query: exp.Expression) -> str:
+    """Postgres SQL with :name bind parameters kept as written"""
+    query = query.transform(
+        lambda node: exp.Var(this=f":{node.name}") if isinstance(node, exp.Placeholder) and node.name else node
+    )
+    return query.sql(dialect="postgres")
+
+# -------------------------------------------------------------------
+# Dimension filters
+# -------------------------------------------------------------------
+FOLDS = {exp.Lower: str.lower, exp.Upper: str.upper}
+
+def _like_regex(pattern: str, ignore_case: bool) -> re.Pattern:
+    regex = "".join(".*" if ch == "%" else "." if ch == "_" else re.escape(ch) for ch in pattern)
+    return re.compile(regex, re.IGNORECASE | re.DOTALL if ignore_case else re.DOTALL)
+
+def _dimension_column(node: exp.Expression, alias_map: dict) -> tuple | None:
+    """(column, fold) for a dimension column, optionally wrapped in LOWER()/UPPER()"""
+    fold = None
+    if type(node) in FOLDS:
+        fold, node = FOLDS[type(node)], node.this
+    if isinstance(node, exp.Column) and node.name.lower() in alias_map:
+        return node, fold
+    return None
+
+def _resolve_literal(literal: exp.Expression, column: str, fold, alias_map: dict,
+                     pattern: bool = False, ignore_case: bool = False) -> list | None:
+    """Canonical values a literal compared with a dimension column selects, or None if unknown"""
+    if not (isinstance(literal, exp.Literal) and literal.is_string):
+        return None
+    text, values = literal.this, column_values(alias_map, column.lower())
+    if pattern:
+        regex = _like_regex(text, ignore_case)
+        matched = [value for value in values if regex.fullmatch(fold(value) if fold else value)]
+    else:
+        matched = [value for value in values if (fold(value) if fold else value) == text]
+    # Spellings the data doesn't use ("الشمالية", "northern") go through the alias map
+    return matched or resolve_alias(alias_map, column.lower(), text.strip("%")) or None
+
+def _equality(column: exp.Column, values: list) -> exp.Expression:
+    literals = [exp.Literal.string(value) for value in values]
+    if len(literals) == 1:
+        return exp.EQ(this=column.copy(), expression=literals[0])
+    return exp.In(this=column.copy(), expressions=literals)
+
+def make_dimension_filters_sargable(sql: str, alias_map: dict) -> tuple[str, int]:
+    """Rewrite ILIKE/LIKE, LOWER()/UPPER() and misspelled comparisons on dimension columns into equality.
+
+    `region ILIKE '%north%'` or `region = 'الشمالية'` becomes `region = 'North'` (or an
+    IN list when a pattern covers several values), which an index on the column can
+    serve. Patterns are evaluated against the complete value lists of the alias map,
+    so the rewritten filter selects the same rows; filters on values that can't be
+    resolved are left alone. Returns the SQL and the number of rewrites.
+    """
+    if not alias_map:
+        return sql, 0
+    try:
+        query = sqlglot.parse_one(sql, read="postgres")
+    except ParseError:
+        return sql, 0
+
+    rewritten = 0
+
+    def rewrite(node: exp.Expression) -> exp.Expression:
+        nonlocal rewritten
+        if isinstance(node.parent, exp.Escape):
+            return node
+        values = None
+        if isinstance(node, (exp.ILike, exp.Like)):
+            target = _dimension_column(node.this, alias_map)
+            if target:
+                column, fold = target
+                values = _resolve_literal(
+                    node.expression, column.name, fold, alias_map,
+                    pattern=True, ignore_case=isinstance(node, exp.ILike)
+                )
+        elif isinstance(node, exp.EQ):
+            target = _dimension_column(node.this, alias_map)
+            if target:
+                column, fold = target
+                literal = node.expression
+                if fold is None and isinstance(literal, exp.Literal) and literal.this in column_values(alias_map, column.name.lower()):
+                    return node  # Already an exact match on a stored value
+                values = _resolve_literal(literal, column.name, fold, alias_map)
+        elif isinstance(node, exp.In) and node.expressions:
+            target = _dimension_column(node.this, alias_map)
+            if target:
+                column, fold = target
+                resolved = [_resolve_literal(literal, column.name, fold, alias_map) for literal in node.expressions]
+                if all(resolved):
+                    values = list(dict.fromkeys(value for found in resolved for value in found))
+                    current = [literal.this for literal in node.expressions]
+                    if fold is None and values == current:
+                        return node
+        if not values:
+            return node
+        rewritten += 1
+        equality = _equality(column, values)
+        # Newer sqlglot versions mark NOT LIKE / NOT IN with a flag instead of a NOT node
+        return exp.Not(this=equality) if node.args.get("negate") else equality
+
+    query = query.transform(rewrite)
+    if not rewritten:
+        return sql, 0
+    metrics.incr("sql_rewrite.dimension_equality", rewritten)
+    return _to_sql(query), rewritten
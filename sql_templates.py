@@ -0,0 +1,340 @@
+import re
+from datetime import date
+
+import metrics
+from query_cache import normalize_question
+from date_context import DateContext, RELATIVE_DATE_PATTERN
+
+# -------------------------------------------------------------------
+# Vocabulary (English and Arabic, matched on normalized text)
+# -------------------------------------------------------------------
+# Arabic business terms and their English meaning, shared with the translation prompts
+BUSINESS_GLOSSARY = {
+    "العملاء المتسربين": "churned customers",
+    "يناير": "January",
+    "العملاء": "customers",
+    "المبيعات": "sales",
+    "الإيرادات": "revenue",
+}
+
+METRIC_TERMS = {
+    "units_sold": ["units", "units sold", "quantity", "الوحدات", "وحدات", "الكميه"],
+    "revenue": ["revenue", "revenues", "sales", "income", "الايرادات", "ايرادات", "المبيعات", "مبيعات", "الدخل"],
+    "churned_customers": ["churn", "churned", "تسرب", "المتسربين", "المغادرين"],
+}
+
+DIMENSION_TERMS = {
+    "region": {"singular": ["region", "منطقه"], "plural": ["regions", "المناطق", "مناطق"]},
+    "product": {"singular": ["product", "منتج"], "plural": ["products", "المنتجات", "منتجات"]},
+    "segment": {"singular": ["segment", "شريحه"], "plural": ["segments", "الشرائح", "شرائح"]},
+}
+
+# Canonical database value → spellings users type
+DIMENSION_VALUES = {
+    "region": {
+        "North": ["north", "northern", "الشماليه", "الشمال"],
+        "South": ["south", "southern", "الجنوبيه", "الجنوب"],
+        "East": ["east", "eastern", "الشرقيه", "الشرق"],
+        "West": ["west", "western", "الغربيه", "الغرب"],
+    },
+    "product": {
+        "Product A": ["product a", "منتج a"],
+        "Product B": ["product b", "منتج b"],
+        "Product C": ["product c", "منتج c"],
+    },
+    "segment": {
+        "Consumer": ["consumer", "consumers", "المستهلكين", "مستهلكين", "الافراد"],
+        "SMB": ["smb", "small business", "الشركات الصغيره", "المنشات الصغيره"],
+        "Enterprise": ["enterprise", "enterprises", "المؤسسات", "الشركات الكبيره"],
+    },
+}
+
+MONTHS = {
+    1: ["january", "jan", "يناير"], 2: ["february", "feb", "فبراير"], 3: ["march", "mar", "مارس"],
+    4: ["april", "apr", "ابريل"], 5: ["مايو"], 6: ["june", "jun", "يونيو"],
+    7: ["july", "jul", "يوليو"], 8: ["august", "aug", "اغسطس"], 9: ["september", "sep", "sept", "سبتمبر"],
+    10: ["october", "oct", "اكتوبر"], 11: ["november", "nov", "نوفمبر"], 12: ["december", "dec", "ديسمبر"],
+}
+
+ARABIC_QUARTERS = {"الربع الاول": 1, "الربع الثاني": 2, "الربع الثالث": 3, "الربع الرابع": 4}
+
+GROWTH_TERMS = ["growth", "grow", "grew", "increase", "نمو", "زياده"]
+QUARTER_TERMS = ["quarter", "quarters", "quarterly", "الارباع", "ربع", "ربعي"]
+
+# Shapes the templates don't cover; these questions go to the LLM
+UNSUPPORTED_TERMS = [
+    "average", "avg", "mean", "median", "trend", "daily", "weekly", "monthly", "per month", "each month",
+    "by month", "per day", "ratio", "compare", "comparison", "versus", "vs", "forecast", "predict",
+    "correlation", "since", "until", "before", "after", "from", "متوسط", "اتجاه", "يومي", "اسبوعي",
+    "شهري", "مقارنه", "قارن", "توقع", "منذ", "حتي", "قبل", "بعد",
+    # Negated filters ("excluding North") would otherwise become the opposite equality filter
+    "excluding", "exclude", "except", "without", "not", "other than", "ما عدا", "عدا", "باستثناء", "بدون",
+    # Partial periods would otherwise widen to the whole year
+    "first half", "second half", "half", "h1", "h2", "النصف",
+    # Counts, extremes, rankings, running totals and shares aren't a plain SUM
+    "count", "how many", "number of", "max", "maximum", "min", "minimum", "highest", "lowest", "top", "bottom",
+    "most", "least", "best", "worst", "largest", "smallest", "biggest", "rank", "ranking", "cumulative",
+    "running total", "share", "عدد", "اعلي", "اقل", "اكبر", "اصغر", "اكثر", "افضل", "اسوا", "اقصي", "ادني",
+    "ترتيب", "تراكمي", "حصه",
+]
+# Only meaningful as part of a growth question ("growth rate between quarters")
+GROWTH_ONLY_TERMS = ["percentage", "percent", "rate", "between", "نسبه", "معدل", "بين"]
+
+GROUP_BY_PREFIXES = ["by", "per", "each", "which", "what", "across", "every", "حسب", "لكل", "كل", "اي"]
+
+# -------------------------------------------------------------------
+# Matching helpers
+# -------------------------------------------------------------------
+def _is_arabic(term: str) -> bool:
+    return bool(re.search(r'[؀-ۿ]', term))
+
+def _find(text: str, term: str) -> re.Match | None:
+    """Locate a term; English terms need word boundaries, Arabic ones may carry prefixes"""
+    term = normalize_question(term)
+    if _is_arabic(term):
+        return re.search(re.escape(term), text)
+    return re.search(rf'\b{re.escape(term)}\b', text)
+
+def _contains_any(text: str, terms: list) -> bool:
+    return any(_find(text, term) for term in terms)
+
+def _quarter_range(year: int, quarter: int) -> tuple:
+    start = date(year, 3 * quarter - 2, 1)
+    end = date(year + 1, 1, 1) if quarter == 4 else date(year, 3 * quarter + 1, 1)
+    return start, end
+
+def _month_range(year: int, month: int) -> tuple:
+    start = date(year, month, 1)
+    end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    return start, end
+
+def _resolve_period(text: str, relative_periods: list) -> tuple:
+    """Find the single period a question asks about.
+
+    Returns ((start, end), granularity, consumed_numbers), where the range is half-open.
+    The range is None when no period is mentioned; a granularity of "ambiguous" means
+    several periods were found and the question can't be templated. Relative periods
+    come pre-resolved from the request's DateContext.
+    """
+    years = [int(y) for y in re.findall(r'\b(20\d{2})\b', text)]
+    if len(set(years)) > 1:
+        return None, "ambiguous", []
+    year = years[0] if years else None
+
+    quarters = [int(q) for q in re.findall(r'\bq([1-4])\b', text)]
+    quarters += [q for term, q in ARABIC_QUARTERS.items() if term in text]
+    months = [m for m, names in MONTHS.items() if _contains_any(text, names)]
+    if re.search(r'\bmay\s+20\d{2}\b|\b\d{1,2}\s+may\b', text):  # "may" is also a verb
+        months.append(5)
+
+    if len(quarters) + len(months) > 1:
+        return None, "ambiguous", []
+    if relative_periods and (years or quarters or months):
+        return None, "ambiguous", []
+
+    if year and quarters:
+        return _quarter_range(year, quarters[0]), "quarter", [str(year)]
+    if year and months:
+        day_match = re.search(r'\b(\d{1,2})\s+\S+\s+' + str(year), text)
+        if day_match and 1 <= int(day_match.group(1)) <= 31:
+            try:
+                start = date(year, months[0], int(day_match.group(1)))
+            except ValueError:
+                return None, "ambiguous", []
+            return (start, date.fromordinal(start.toordinal() + 1)), "day", [str(year), day_match.group(1)]
+        return _month_range(year, months[0]), "month", [str(year)]
+    if quarters or months:
+        # A month or quarter without a year is left for the LLM to resolve from context
+        return None, "ambiguous", []
+    if year:
+        return (date(year, 1, 1), date(year + 1, 1, 1)), "year", [str(year)]
+
+    if len(relative_periods) > 1:
+        return None, "ambiguous", []
+    if relative_periods:
+        period = relative_periods[0]
+        return (period["start"], period["end"]), period["granularity"], period["numbers"]
+    return None, None, []
+
+def extract_slots(question: str, date_context: DateContext = None) -> dict | None:
+    """Pull metric, dimensions, filter values and period out of a question.
+
+    Returns None when the question contains anything the templates can't represent.
+    """
+    date_context = date_context or DateContext(question)
+    text = normalize_question(question)
+
+    if _contains_any(text, UNSUPPORTED_TERMS):
+        return None
+    growth = _contains_any(text, GROWTH_TERMS)
+    if not growth and _contains_any(text, GROWTH_ONLY_TERMS):
+        return None
+
+    metrics_found = [metric for metric, terms in METRIC_TERMS.items() if _contains_any(text, terms)]
+    if not metrics_found:
+        return None
+
+    period, granularity, consumed_numbers = _resolve_period(text, date_context.periods)
+    if granularity == "ambiguous":
+        return None
+    if period is None and RELATIVE_DATE_PATTERN.search(text):
+        # A relative term we couldn't resolve ("recently", "3 months ago")
+        return None
+
+    # Every number must have been understood as part of the period ("top 5" is not)
+    leftover_numbers = re.findall(r'\b\d+\b', re.sub(r'\bq[1-4]\b', "", text))
+    for number in consumed_numbers:
+        if number in leftover_numbers:
+            leftover_numbers.remove(number)
+    if leftover_numbers:
+        return None
+
+    filters = {}
+    for dimension, values in DIMENSION_VALUES.items():
+        matched = [value for value, spellings in values.items() if _contains_any(text, spellings)]
+        if matched:
+            filters[dimension] = matched
+
+    def grouped(dimension: str, prefixes: list) -> bool:
+        terms = DIMENSION_TERMS[dimension]
+        # The Arabic conjunction "و" attaches to the next word ("والمنتج")
+        return _contains_any(text, terms["plural"]) or any(
+            _find(text, f"{prefix}{separator}{article}{term}")
+            for prefix in prefixes for term in terms["singular"]
+            for separator in ([" ", ""] if prefix == "و" else [" "]) for article in ["", "ال"]
+        )
+
+    group_by = [dimension for dimension in DIMENSION_TERMS if grouped(dimension, GROUP_BY_PREFIXES)]
+    if group_by:
+        # "by product and region" groups by both
+        group_by += [
+            dimension for dimension in DIMENSION_TERMS
+            if dimension not in group_by and grouped(dimension, ["and", "و"])
+        ]
+
+    return {
+        "metrics": metrics_found,
+        "group_by": group_by,
+        "filters": filters,
+        "period": period,
+        "granularity": granularity,
+        "growth": growth,
+        "quarters": _contains_any(text, QUARTER_TERMS) or granularity == "quarter",
+    }
+
+# -------------------------------------------------------------------
+# Vetted templates
+# -------------------------------------------------------------------
+def _filter_clause(column: str, values: list, params: dict) -> str:
+    names = []
+    for i, value in enumerate(values):
+        params[f"{column}_{i}"] = value
+        names.append(f":{column}_{i}")
+    return f"{column} = {names[0]}" if len(names) == 1 else f"{column} IN ({', '.join(names)})"
+
+def _where(date_column: str, slots: dict, params: dict) -> str:
+    conditions = []
+    if slots["period"]:
+        params["start_date"], params["end_date"] = slots["period"]
+        conditions.append(f"{date_column} >= :start_date AND {date_column} < :end_date")
+    for column, values in slots["filters"].items():
+        conditions.append(_filter_clause(column, values, params))
+    return f"\nWHERE {' AND '.join(conditions)}" if conditions else ""
+
+def sales_totals_template(slots: dict) -> tuple:
+    """Revenue/units totals, optionally grouped by region and/or product, for a period"""
+    params = {}
+    measures = [f"SUM({metric}) AS total_{metric}" for metric in slots["metrics"]]
+    select = ", ".join(slots["group_by"] + measures)
+    sql = f"SELECT {select}\nFROM sales{_where('date', slots, params)}"
+    if slots["group_by"]:
+        sql += f"\nGROUP BY {', '.join(slots['group_by'])}\nORDER BY total_{slots['metrics'][0]} DESC"
+    return sql, params
+
+def churn_by_segment_template(slots: dict) -> tuple:
+    """Churned customers, optionally by segment, for a period"""
+    params = {}
+    select = ", ".join(slots["group_by"] + ["SUM(churned_customers) AS total_churned_customers"])
+    sql = f"SELECT {select}\nFROM churn{_where('month', slots, params)}"
+    if slots["group_by"]:
+        sql += "\nGROUP BY segment\nORDER BY total_churned_customers DESC"
+    return sql, params
+
+def quarterly_growth_template(slots: dict) -> tuple:
+    """Quarter-over-quarter growth of a sales metric, optionally per region/product, within a year"""
+    params = {}
+    metric = slots["metrics"][0]
+    dims = slots["group_by"]
+    dim_select = "".join(f"{d}, " for d in dims)
+    partition = f"PARTITION BY {', '.join(dims)} " if dims else ""
+    sql = (
+        f"WITH quarterly AS (\n"
+        f"    SELECT {dim_select}date_trunc('quarter', date)::date AS quarter, SUM({metric}) AS total_{metric}\n"
+        f"    FROM sales{_where('date', slots, params).replace(chr(10), chr(10) + '    ')}\n"
+        f"    GROUP BY {dim_select}date_trunc('quarter', date)\n"
+        f"), growth AS (\n"
+        f"    SELECT {dim_select}quarter, total_{metric},\n"
+        f"           LAG(total_{metric}) OVER ({partition}ORDER BY quarter) AS previous_{metric}\n"
+        f"    FROM quarterly\n"
+        f")\n"
+        f"SELECT {dim_select}quarter, total_{metric}, previous_{metric},\n"
+        f"       ROUND((total_{metric} - previous_{metric}) * 100.0 / NULLIF(previous_{metric}, 0), 2) AS growth_percentage\n"
+        f"FROM growth\n"
+        f"WHERE previous_{metric} IS NOT NULL\n"
+        f"ORDER BY growth_percentage DESC"
+    )
+    return sql, params
+
+def choose_template(slots: dict):
+    """Pick the template that fits the extracted slots, or None"""
+    sales_metrics = {"revenue", "units_sold"}
+    metrics_found = set(slots["metrics"])
+
+    if metrics_found == {"churned_customers"}:
+        if set(slots["group_by"]) - {"segment"} or set(slots["filters"]) - {"segment"}:
+            return None
+        if slots["growth"] or slots["granularity"] == "day":
+            return None
+        return churn_by_segment_template
+
+    if not metrics_found <= sales_metrics:
+        return None
+    if "segment" in slots["group_by"] or "segment" in slots["filters"]:
+        return None
+
+    if slots["growth"]:
+        # Growth between the quarters of one year
+        if not slots["quarters"] or slots["granularity"] != "year" or len(metrics_found) > 1:
+            return None
+        return quarterly_growth_template
+
+    return sales_totals_template
+
+def match_template(question: str, date_context: DateContext = None, require_period: bool = False) -> dict | None:
+    """Deterministic SQL for common question shapes, or None to fall through to the LLM"""
+    slots = extract_slots(question, date_context)
+    template = choose_template(slots) if slots and (slots["period"] or not require_period) else None
+    if template is None:
+        metrics.incr("sql_templates.misses")
+        return None
+
+    sql, params = template(slots)
+    metrics.incr("sql_templates.hits")
+    metrics.incr(f"sql_templates.{template.__name__}")
+    return {"template": template.__name__, "sql": sql, "params": params, "slots": slots}
+
+def format_glossary() -> str:
+    """Glossary lines for translation prompts"""
+    return "\n".join(f"- {arabic} = {english}" for arabic, english in BUSINESS_GLOSSARY.items())
+
+def template_hit_rate() -> float:
+    """Share of questions answered by a template instead of the LLM"""
+    return metrics.ratio("sql_templates.hits", ["sql_templates.hits", "sql_templates.misses"])
+
+def render_sql(sql: str, params: dict) -> str:
+    """Inline bound parameters for display and conversation context (values come from the vetted vocabulary)"""
+    for name in sorted(params, key=len, reverse=True):
+        value = params[name]
+        literal = f"DATE '{value.isoformat()}'" if isinstance(value, date) else "'" + str(value).replace("'", "''") + "'"
+        sql = re.sub(rf':{name}\b', literal, sql)
+    return sql
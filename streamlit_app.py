@@ -1,22 +1,43 @@
 import streamlit as st
 import os
 import re
+import html
 import pandas as pd
-from datetime import datetime
-import cohere
+import textwrap
 from sqlalchemy import text
-from database import SessionLocal
+from database import SessionLocal, get_data_versions
+from query_cache import NLSQLCache, build_cache_key
+from date_context import DateContext
+from example_store import ExampleStore, find_reusable_example, format_examples_for_prompt
+from sql_templates import match_template, render_sql, template_hit_rate, format_glossary
+from intent_classifier import decide_intent
+from llm_gateway import LLMGateway
+from llm_backends import create_backend, LLM_BACKEND, LLM_MODEL
+import tracing
+from sql_guard import guard_sql, SQLGuardError, SQL_STATEMENT_TIMEOUT_MS, SQL_ALLOWED_TABLES
+from result_fetch import fetch_dataframe
+from result_cache import ResultCache, build_result_key, referenced_tables
+from result_store import ResultStore
+from query_cost import explain_query, over_budget, SQL_COST_ACTION
+from sql_rewrite import make_date_filters_sargable, make_dimension_filters_sargable
+from schema_catalog import SchemaCatalog, SCHEMA_DIMENSION_COLUMNS
+from dimension_aliases import build_alias_map
+from rollups import route_query
+from columnar_mirror import ColumnarMirror, ANALYTICS_ENGINE
 import json
+import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 # Import simplified session management
 from session_manager import (
     initialize_chat_system, create_new_chat_session, 
     save_current_session, load_session, delete_session,
-    load_all_sessions, add_message, get_session_memory,
-    get_or_create_session_id
+    load_sessions_page, add_message, get_session_memory,
+    get_or_create_session_id, load_earlier_messages
 )
+from chat_messages import Message
 
 # Page configuration
 st.set_page_config(
@@ -415,13 +436,13 @@ with st.sidebar:
 # File path for persistent storage (deprecated - now using database)
 CHAT_STORAGE_FILE = Path("chat_sessions.pkl")
 
-# Initialize Cohere client
+# Initialize LLM backend (Cohere, or the offline stub when LLM_BACKEND=stub)
 @st.cache_resource
-def init_cohere_client():
-    """Initialize Cohere client with caching"""
+def init_llm_backend():
+    """Initialize the LLM backend with caching"""
     with st.spinner("🔄 Initializing AI assistant..."):
         api_key = os.getenv("COHERE_API_KEY")
-        if not api_key:
+        if LLM_BACKEND == "cohere" and not api_key:
             st.error("❌ **COHERE_API_KEY environment variable not set!**")
             st.markdown("""
             <div style="background: #fff3cd; border: 1px solid #ffeaa7; border-radius: 10px; padding: 1rem; margin: 1rem 0;">
@@ -442,22 +463,106 @@ def init_cohere_client():
             print(f"❌ Database connection failed: {str(e)}")
             st.error(f"❌ Database connection failed: {str(e)}")
         
-        return cohere.ClientV2(api_key=api_key)
+        print(f"🔍 LLM backend: {LLM_BACKEND} ({LLM_MODEL})")
+        return create_backend(api_key)
 
-co = init_cohere_client()
+@st.cache_resource
+def init_llm_gateway():
+    """LLM gateway shared by all sessions so retries, hedging and the circuit breaker see all traffic"""
+    return LLMGateway(init_llm_backend(), model=LLM_MODEL)
+
+llm = init_llm_gateway()
 
-# Database schema information (hidden from user)
-SCHEMA_INFO = """
+# Database schema information (hidden from user), used until the catalog has been built
+FALLBACK_SCHEMA_INFO = """
 Available Tables:
 - sales(date DATE, region TEXT, product TEXT, units_sold INTEGER, revenue NUMERIC)
 - churn(month DATE, segment TEXT, churned_customers INTEGER)
 """
 
-def classify_user_intent(user_question: str) -> str:
+@st.cache_resource
+def init_schema_catalog():
+    """Introspected schema shared by all sessions; startup reuses the on-disk catalog while it is valid"""
+    catalog = SchemaCatalog()
+    catalog.refresh()
+    return catalog
+
+schema_catalog = init_schema_catalog()
+
+def get_schema_info() -> str:
+    """Size-budgeted description of the queryable tables for prompts"""
+    return schema_catalog.describe(SQL_ALLOWED_TABLES) or FALLBACK_SCHEMA_INFO
+
+def get_schema_version() -> str:
+    """Version of the schema and dimension values that cached SQL was generated against"""
+    return schema_catalog.version or FALLBACK_SCHEMA_INFO
+
+def get_dimension_aliases() -> dict:
+    """Alias map from English/Arabic spellings to the catalogued dimension values"""
+    return build_alias_map({column: schema_catalog.dimension_values(column) for column in SCHEMA_DIMENSION_COLUMNS})
+
+# Question pipeline mode: "combined" resolves intent, translation and SQL in one
+# structured LLM call; "multi_call" keeps the classify → translate → generate chain
+QUERY_PIPELINE_MODE = os.getenv("QUERY_PIPELINE_MODE", "combined")
+
+# Multi-call mode: overlap classification, translation and speculative SQL generation
+SPECULATIVE_PIPELINE = os.getenv("SPECULATIVE_PIPELINE", "1") == "1"
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", "8"))
+
+@st.cache_resource
+def init_nl_sql_cache():
+    """Persistent question-to-SQL cache shared by all sessions"""
+    return NLSQLCache()
+
+nl_sql_cache = init_nl_sql_cache()
+
+@st.cache_resource
+def init_result_cache():
+    """Persistent query result cache shared by all sessions"""
+    return ResultCache()
+
+result_cache = init_result_cache()
+
+@st.cache_resource
+def init_result_store():
+    """On-disk store of query results that chat messages reference instead of holding the frames"""
+    return ResultStore()
+
+result_store = init_result_store()
+
+@st.cache_resource
+def init_example_store():
+    """Embedded Qdrant store of past successful question→SQL pairs (None if unavailable)"""
+    try:
+        return ExampleStore()
+    except Exception as e:
+        # Local mode locks its directory, so a second app process runs without examples
+        print(f"⚠️ Example store unavailable: {str(e)}")
+        return None
+
+example_store = init_example_store()
+
+@st.cache_resource
+def init_columnar_mirror():
+    """DuckDB mirror of the fact tables when ANALYTICS_ENGINE=duckdb (None otherwise or if unavailable)"""
+    if ANALYTICS_ENGINE != "duckdb":
+        return None
+    try:
+        mirror = ColumnarMirror()
+        mirror.refresh_in_background()
+        return mirror
+    except Exception as e:
+        print(f"⚠️ Columnar mirror unavailable: {str(e)}")
+        return None
+
+columnar_mirror = init_columnar_mirror()
+
+def classify_user_intent(user_question: str, conversation_history: list = None) -> str:
     """Classify user intent to determine if it's data-related, greeting, or irrelevant"""
     try:
         # Get conversation history for context
-        conversation_history = get_session_memory()
+        if conversation_history is None:
+            conversation_history = get_session_memory()
         
         system_prompt = (
             """You are a classifier for user intents in a data analysis chat system. 
@@ -482,8 +587,8 @@ def classify_user_intent(user_question: str) -> str:
         # Add current user question
         messages.append({"role": "user", "content": user_question})
         
-        resp = co.chat(
-            model="command-r-08-2024",
+        resp = llm.chat(
+            "classify",
             messages=messages
         )
         
@@ -527,8 +632,8 @@ def generate_contextual_response(user_question: str, intent: str) -> str:
         # Add current user question
         messages.append({"role": "user", "content": user_question})
         
-        resp = co.chat(
-            model="command-r-08-2024",
+        resp = llm.chat(
+            "contextual_reply",
             messages=messages
         )
         return resp.message.content[0].text.strip()
@@ -536,19 +641,15 @@ def generate_contextual_response(user_question: str, intent: str) -> str:
     except Exception as e:
         return "I'm here to help you analyze your business data. What would you like to know about your sales, customers, or business metrics?"
 
-def execute_sql_query(sql: str) -> tuple[pd.DataFrame, str, bool]:
-    """Execute SQL query and return results as DataFrame, status message, and success flag"""
+def execute_sql_query(sql: str, params: dict = None, query_info: dict = None) -> tuple[pd.DataFrame, str, bool]:
+    """Execute SQL query and return results as DataFrame, status message, and success flag
+    
+    `query_info` receives the planner estimates and, if the cost gate stopped the query,
+    the reason under "cost_exceeded".
+    """
     try:
         print(f"🔍 Executing SQL: {sql}")
         
-        # Validate that the input looks like SQL before attempting to execute
-        sql_stripped = sql.strip()
-        sql_keywords = ['SELECT', 'UPDATE', 'INSERT', 'DELETE', 'WITH', 'CREATE', 'DROP', 'ALTER']
-        
-        # Check if the input starts with a SQL keyword
-        if not any(sql_stripped.upper().startswith(keyword) for keyword in sql_keywords):
-            return pd.DataFrame(), f"❌ Error: Received non-SQL input: {sql[:100]}...", False
-        
         # Check for obvious natural language patterns that shouldn't be in SQL
         natural_language_patterns = [
             r'\b(In \d{4}, a total of)\b',  # "In 2023, a total of"
@@ -566,20 +667,106 @@ def execute_sql_query(sql: str) -> tuple[pd.DataFrame, str, bool]:
         sql_match = re.search(r'```sql\s*(.*?)\s*```', sql, re.DOTALL)
         clean_sql = sql_match.group(1).strip() if sql_match else sql.strip()
         
+        # Only a single read-only query over the data tables reaches the database
+        try:
+            with tracing.span("sql.guard"):
+                clean_sql, guard_info = guard_sql(clean_sql)
+                tracing.annotate(**guard_info)
+        except SQLGuardError as e:
+            print(f"⚠️ SQL rejected: {str(e)}")
+            tracing.annotate(error=str(e))
+            return pd.DataFrame(), f"❌ Error: Query rejected: {str(e)}", False
+        
+        # EXTRACT/date_trunc filters become date ranges an index can serve
+        clean_sql, date_rewrites = make_date_filters_sargable(clean_sql)
+        if date_rewrites:
+            tracing.annotate(sargable_rewrites=date_rewrites)
+        
+        # ILIKE and misspelled filters on region/product/segment become equality on the stored values
+        clean_sql, dimension_rewrites = make_dimension_filters_sargable(clean_sql, get_dimension_aliases())
+        if dimension_rewrites:
+            tracing.annotate(dimension_rewrites=dimension_rewrites)
+        
         print(f"🔍 Clean SQL to execute: {clean_sql}")
         
         session = SessionLocal()
         try:
-            result = session.execute(text(clean_sql))
-            rows = result.fetchall()
-            cols = result.keys()
+            # Both settings last until the transaction ends when the session closes
+            session.execute(text("SET TRANSACTION READ ONLY"))
+            
+            # The same query over tables no loader has touched since returns the cached result
+            result_key = build_result_cache_key(session, clean_sql, params or {})
+            cached = None
+            if result_key:
+                try:
+                    cached = result_cache.get(result_key)
+                except Exception as e:
+                    # A broken cache file is a miss, never a failed query
+                    print(f"⚠️ Result cache lookup failed: {str(e)}")
+            if cached:
+                df, status = cached
+                tracing.annotate(result_cache="hit", rows=len(df))
+                print(f"🔍 Result cache hit ({len(df)} rows)")
+                return df, status, True
+            
+            # Mirrored tables are read from the DuckDB mirror while it is current; misses fall through to PostgreSQL
+            df = None
+            if columnar_mirror is not None:
+                with tracing.span("sql.mirror"):
+                    df = columnar_mirror.query(session, clean_sql, params or {})
+                if df is not None:
+                    truncated = None
+                    print(f"🔍 Served from the columnar mirror ({len(df)} rows)")
+                    tracing.annotate(engine="duckdb", rows=len(df))
+                    if query_info is not None:
+                        query_info["engine"] = "duckdb"
             
-            if not rows:
-                return pd.DataFrame(), "🔍 No rows returned from the query.", True
+            if df is None:
+                session.execute(text(f"SET LOCAL statement_timeout = {SQL_STATEMENT_TIMEOUT_MS}"))
             
-            # Convert to DataFrame
-            df = pd.DataFrame(rows, columns=cols)
-            return df, f"✅ Query executed successfully. Found {len(df)} rows.", True
+                # Eligible aggregates read from the smallest fresh rollup instead of the fact table
+                clean_sql, rollup = route_query(session, clean_sql, params or {})
+                if rollup:
+                    print(f"🔍 Routed to {rollup}: {clean_sql}")
+                    tracing.annotate(rollup=rollup)
+                    if query_info is not None:
+                        query_info["rollup"] = rollup
+            
+                # Planner estimates gate the query before it runs
+                if SQL_COST_ACTION != "off":
+                    with tracing.span("sql.explain"):
+                        estimate = explain_query(session, clean_sql, params or {})
+                        tracing.annotate(total_cost=estimate["total_cost"], max_node_rows=estimate["max_node_rows"])
+                    if query_info is not None:
+                        query_info["plan"] = estimate
+                    reason = over_budget(estimate)
+                    if reason:
+                        print(f"⚠️ Query stopped by the cost gate: {reason}\n{estimate['summary']}")
+                        tracing.annotate(error=f"cost gate: {reason}")
+                        if query_info is not None:
+                            query_info["cost_exceeded"] = reason
+                        return pd.DataFrame(), f"❌ Query not run: {reason}. Try a shorter time period or more specific filters.", False
+            
+                with tracing.span("sql.execute"):
+                    # Rows go straight into the DataFrame, streamed in chunks unless the LIMIT keeps them small
+                    df, truncated = fetch_dataframe(session, text(clean_sql), params or {}, guard_info["limit"])
+                tracing.annotate(rows=len(df), truncated=truncated)
+            
+            if truncated is None and guard_info["limit_applied"] and len(df) >= guard_info["max_rows"]:
+                truncated = "row limit reached"
+            if df.empty:
+                status = "🔍 No rows returned from the query."
+            elif truncated:
+                status = f"✅ Query executed successfully. Showing the first {len(df)} rows ({truncated})."
+            else:
+                status = f"✅ Query executed successfully. Found {len(df)} rows."
+            
+            if result_key:
+                try:
+                    result_cache.put(result_key, df, status)
+                except Exception as e:
+                    print(f"⚠️ Result not cached: {str(e)}")
+            return df, status, True
             
         finally:
             session.close()
@@ -587,29 +774,64 @@ def execute_sql_query(sql: str) -> tuple[pd.DataFrame, str, bool]:
     except Exception as e:
         error_msg = str(e)
         print(f"🔍 SQL execution error: {error_msg}")
+        tracing.annotate(error=error_msg)
+        if "statement timeout" in error_msg:
+            return pd.DataFrame(), f"❌ Error executing SQL: the query took longer than {SQL_STATEMENT_TIMEOUT_MS / 1000:g}s and was cancelled.", False
         return pd.DataFrame(), f"❌ Error executing SQL: {error_msg}", False
     
 
+def build_result_cache_key(session, sql: str, params: dict) -> str | None:
+    """Result cache key for a query at the current data versions (None if they can't be read or the query is volatile)"""
+    try:
+        # A savepoint keeps a failed lookup from aborting the query's transaction
+        with session.begin_nested():
+            versions = get_data_versions(session, referenced_tables(sql))
+        return build_result_key(sql, params, versions)
+    except Exception as e:
+        print(f"⚠️ Result cache skipped, data versions unavailable: {str(e)}")
+        return None
+
+def rewrite_expensive_sql(user_question: str, sql_query: str, query_info: dict, date_context: DateContext = None) -> str:
+    """Ask the LLM for a cheaper query with the same answer, given the plan the cost gate rejected"""
+    try:
+        messages = [{"role": "system", "content": build_sql_system_prompt(date_context)}]
+        messages.append({"role": "user", "content": f"""Database Schema:{get_schema_info()}
+
+Question: {user_question}
+
+This query answers the question but is too expensive to run ({query_info['cost_exceeded']}):
+{sql_query}
+
+PostgreSQL plan estimate:
+{query_info['plan']['summary']}
+
+Rewrite it so it returns the same answer more cheaply: filter on date ranges instead of functions of the date column, aggregate before joining, avoid cross joins and repeated scans of the same table. Keep any :period_N_start / :period_N_end parameters as they are. Return pure SQL code only."""})
+        
+        resp = llm.chat("rewrite_sql", messages=messages, temperature=0.1)
+        sql = clean_generated_sql(resp.message.content[0].text.strip())
+        print(f"🔍 Cheaper rewrite: {sql}")
+        return sql
+    
+    except Exception as e:
+        print(f"🔍 Exception in rewrite_expensive_sql: {str(e)}")
+        return f"Error rewriting SQL: {str(e)}"
+
 def translate_to_english(text: str) -> str:
     """Translate non-English text to English for better SQL generation"""
     try:
         system_prompt = (
-            """You are a translator. If the input text is in a language other than English, translate it to English while preserving the exact meaning and context, especially for business and data analysis terms.
+            f"""You are a translator. If the input text is in a language other than English, translate it to English while preserving the exact meaning and context, especially for business and data analysis terms.
 
             If the text is already in English, return it unchanged.
             
             For business terms:
-            - العملاء المتسربين = churned customers
-            - يناير = January
-            - العملاء = customers
-            - المبيعات = sales
-            - الإيرادات = revenue
+            {format_glossary()}
             
             Return ONLY the translated text or original text if already in English."""
         )
         
-        resp = co.chat(
-            model="command-r-08-2024",
+        resp = llm.chat(
+            "translate",
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": text}
@@ -624,120 +846,154 @@ def translate_to_english(text: str) -> str:
 
 
 
-def generate_sql_query(user_question: str) -> str:
-    """Generate SQL query using Cohere API with conversation history for context"""
+def build_sql_system_prompt(date_context: DateContext = None) -> str:
+    """Build the system prompt shared by SQL generation and the combined plan stage"""
+    # Relative periods are resolved once per request and reach the SQL as bind parameters
+    date_context = date_context or DateContext("")
     
-    english_question = translate_to_english(user_question)
+    return (
+        f"""You are a SQL generator. Your ONLY job is to generate valid PostgreSQL SQL queries.
+
+        **CRITICAL INSTRUCTIONS**:
+        - You MUST return ONLY SQL code - no explanations, no natural language, no markdown
+        - Do NOT provide any commentary, analysis, or description
+        - Do NOT return results or data - only the SQL query itself
+        - Your response should be executable SQL that starts with SELECT, UPDATE, INSERT, etc.
+        
+        **CURRENT DATE CONTEXT**:
+{textwrap.indent(date_context.prompt_block(), "        ")}
+        
+        IMPORTANT RULES:
+        1. **Filter `region`, `product` and `segment` with exact equality (=) or IN, using the values listed in the schema - never ILIKE, LIKE or LOWER()**
+        2. **For date filtering, use proper date format and column names from the schema**
+        3. **Do NOT use user input directly as column values - map them to actual database values**
+        4. **For churn analysis, use the correct table structure provided in the schema**
+        5. **If asking about churned customers, look for churn-related columns like `churn_status`, `churned`, or similar**
+        6. **For time periods, use the actual date columns in the database**
+        7. **For product filtering: map the user's wording to the stored value and compare with =**
+            PRODUCT FILTERING EXAMPLES:
+            - "Product A" → WHERE product = 'Product A'
+            - "المنتج A" → WHERE product = 'Product A'
+            - "products A and B" → WHERE product IN ('Product A', 'Product B')
+        8. **For region and segment filtering: translate Arabic or informal names to the stored value and compare with =**
+            REGION FILTERING EXAMPLES:
+            - "northern region" → WHERE region = 'North'
+            - "الشمالية" → WHERE region = 'North'
+            - "المؤسسات" → WHERE segment = 'Enterprise'
+        
+        **RELATIVE DATE INTERPRETATION**:
+        - Use the :period_N_start / :period_N_end parameters listed above for relative terms ("last month", "YTD", "الشهر الماضي")
+        - Only relative terms that are not listed above need converting to literal date ranges from today's date
+        
+        **DATE FILTERS - ALWAYS USE RANGES**:
+        - Filter on the raw date column with a half-open range so indexes can be used:
+            * January 2024 → WHERE date >= '2024-01-01' AND date < '2024-02-01'
+            * Q2 2024 → WHERE date >= '2024-04-01' AND date < '2024-07-01'
+            * Churn in 2024 → WHERE month >= '2024-01-01' AND month < '2025-01-01'
+        - NEVER wrap the date column in EXTRACT() or date_trunc() inside WHERE (grouping by them is fine)
+        
+        **CRITICAL - YEAR-OVER-YEAR GROWTH CALCULATIONS**:
+        - **AVOID complex window functions with GROUP BY** - they cause PostgreSQL errors
+        - **For growth percentage between years**, use simple conditional aggregation:
+          ```sql
+          SELECT 
+              SUM(CASE WHEN date < '2024-01-01' THEN revenue ELSE 0 END) AS revenue_2023,
+              SUM(CASE WHEN date >= '2024-01-01' THEN revenue ELSE 0 END) AS revenue_2024,
+              ((SUM(CASE WHEN date >= '2024-01-01' THEN revenue ELSE 0 END) - 
+                SUM(CASE WHEN date < '2024-01-01' THEN revenue ELSE 0 END)) / 
+               NULLIF(SUM(CASE WHEN date < '2024-01-01' THEN revenue ELSE 0 END), 0)) * 100 AS growth_percentage
+          FROM sales 
+          WHERE date >= '2023-01-01' AND date < '2025-01-01';
+          ```
+        - **For comparing years**, always use CASE WHEN statements instead of window functions
+        - **Use NULLIF() to prevent division by zero errors**
+        
+        **CRITICAL - CONVERSATION CONTEXT & FOLLOW-UP QUESTIONS**:
+        - **ANALYZE the conversation history carefully** to understand what the user previously asked about
+        - **INHERIT the same data type, metrics, and structure** from previous queries when user asks follow-up questions
+        - **EXAMPLES of follow-up handling**:
+            * Previous: "Sales data for January 2024" → Current: "What about February?" → Generate: Sales data for February 2024
+            * Previous: "Revenue by region in Q1" → Current: "Show me Q2" → Generate: Revenue by region in Q2
+            * Previous: "Product A sales" → Current: "What about Product B?" → Generate: Product B sales with same structure
+            * Previous: "Churn in North region" → Current: "How about South?" → Generate: Churn in South region
+        - **RECOGNIZE implicit references**: "last month", "next quarter", "same period", "other regions", etc.
+        - **MAINTAIN consistency** in date formats, column selections, and aggregation methods from previous queries
+        - **BUILD UPON** previous analysis rather than starting fresh each time
+        
+        Schema Information:
+        - Always refer to the actual column names in the database
+        - Use proper date filtering with DATE columns
+        - Don't assume column names based on the question - use schema column names
+        
+        REMEMBER: Return ONLY the SQL query, nothing else. No explanations, no markdown, no natural language.
+        """
+    )
+
+def build_sql_context_messages(conversation_history: list) -> list:
+    """Reduce conversation history to the user turns and previous SQL queries"""
+    if not conversation_history:
+        print("🔍 No conversation history available")
+        return []
+    
+    # Only add previous SQL queries for context, not natural language responses.
+    # The history is the tail of current_messages, so align the indexes first.
+    full_messages = st.session_state.get('current_messages', [])[-len(conversation_history):]
+    sql_context = []
+    for i, msg in enumerate(conversation_history):
+        if msg["role"] == "user":
+            sql_context.append(msg)
+        elif msg["role"] == "assistant" and i < len(conversation_history) - 1:
+            # Look for SQL queries in the full messages (which include metadata)
+            if i < len(full_messages):
+                full_msg = full_messages[i]
+                if full_msg.metadata.sql_query:
+                    sql_context.append({"role": "assistant", "content": f"Previous SQL: {full_msg.metadata.sql_query}"})
+    
+    return sql_context[-4:]  # Only last 4 messages for context
+
+def clean_generated_sql(sql: str) -> str:
+    """Strip markdown from a model SQL response and make sure it looks like SQL"""
+    # Remove any markdown formatting
+    sql = re.sub(r'```sql\n?|```\n?', '', sql).strip()
+    
+    # Validate that the response looks like SQL
+    sql_keywords = ['SELECT', 'UPDATE', 'INSERT', 'DELETE', 'WITH']
+    if not any(sql.upper().startswith(keyword) for keyword in sql_keywords):
+        print(f"⚠️ Warning: Response doesn't look like SQL: {sql}")
+        # Try to extract SQL from the response if it's embedded
+        sql_match = re.search(r'(SELECT.*?)(?:\n\n|\Z)', sql, re.DOTALL | re.IGNORECASE)
+        if sql_match:
+            sql = sql_match.group(1).strip()
+            print(f"🔍 Extracted SQL: {sql}")
+        else:
+            return f"Error: AI returned non-SQL response: {sql[:100]}..."
+    
+    return sql
+
+def generate_sql_query(user_question: str, english_question: str = None, sql_context: list = None,
+                       examples: list = None, date_context: DateContext = None) -> str:
+    """Generate SQL query using Cohere API with conversation history for context
+    
+    `english_question` and `sql_context` can be precomputed by the caller, which lets the
+    concurrent pipeline run this off the Streamlit script thread.
+    """
+    
+    if english_question is None:
+        english_question = translate_to_english(user_question)
     
     try:
         # Get conversation history for context
-        conversation_history = get_session_memory()
-        
-        # Get current date for context
-        current_date = datetime.now()
-        current_date_str = current_date.strftime('%Y-%m-%d')
-        current_month = current_date.strftime('%B %Y')
-        last_month = (current_date.replace(day=1) - pd.Timedelta(days=1)).strftime('%B %Y')
-        
-        system_prompt = (
-            f"""You are a SQL generator. Your ONLY job is to generate valid PostgreSQL SQL queries.
-
-            **CRITICAL INSTRUCTIONS**:
-            - You MUST return ONLY SQL code - no explanations, no natural language, no markdown
-            - Do NOT provide any commentary, analysis, or description
-            - Do NOT return results or data - only the SQL query itself
-            - Your response should be executable SQL that starts with SELECT, UPDATE, INSERT, etc.
-            
-            **CURRENT DATE CONTEXT**:
-            - Today's date: {current_date_str}
-            - Current month: {current_month}
-            - Last month: {last_month}
-            - Use this context to interpret relative date terms like "last month", "this month", "this quarter", etc.
-            
-            IMPORTANT RULES:
-            1. **Use case-insensitive matching (ILIKE) when filtering text columns like `region` or `segment`**
-            2. **For date filtering, use proper date format and column names from the schema**
-            3. **Do NOT use user input directly as column values - map them to actual database values**
-            4. **For churn analysis, use the correct table structure provided in the schema**
-            5. **If asking about churned customers, look for churn-related columns like `churn_status`, `churned`, or similar**
-            6. **For time periods, use the actual date columns in the database**
-            7. **For product filtering: Use = (exact match) for single letters/numbers, ILIKE for partial text**
-                PRODUCT FILTERING EXAMPLES:
-                - "Product A" → WHERE product ILIKE 'Product A'
-                - "المنتج A" → WHERE product ILIKE 'Product A'
-            8. **For region filtering: Use = (exact match) for single letters/numbers, ILIKE for partial text**
-                REGION FILTERING EXAMPLES:
-                - "Region A" → WHERE region ILIKE 'Region A'
-                - "المنطقة A" → WHERE region ILIKE 'Region A'
-                - "الشمالية" → WHERE region ILIKE 'North'
-            
-            **RELATIVE DATE INTERPRETATION**:
-            - "last month" = {last_month} = use WHERE EXTRACT(YEAR FROM date) = {(current_date.replace(day=1) - pd.Timedelta(days=1)).year} AND EXTRACT(MONTH FROM date) = {(current_date.replace(day=1) - pd.Timedelta(days=1)).month}
-            - "this month" = {current_month} = use WHERE EXTRACT(YEAR FROM date) = {current_date.year} AND EXTRACT(MONTH FROM date) = {current_date.month}
-            - "last quarter" = previous complete quarter based on current date
-            - Always convert relative terms to specific date ranges
-            
-            **CRITICAL - YEAR-OVER-YEAR GROWTH CALCULATIONS**:
-            - **AVOID complex window functions with GROUP BY** - they cause PostgreSQL errors
-            - **For growth percentage between years**, use simple conditional aggregation:
-              ```sql
-              SELECT 
-                  SUM(CASE WHEN EXTRACT(YEAR FROM date) = 2023 THEN revenue ELSE 0 END) AS revenue_2023,
-                  SUM(CASE WHEN EXTRACT(YEAR FROM date) = 2024 THEN revenue ELSE 0 END) AS revenue_2024,
-                  ((SUM(CASE WHEN EXTRACT(YEAR FROM date) = 2024 THEN revenue ELSE 0 END) - 
-                    SUM(CASE WHEN EXTRACT(YEAR FROM date) = 2023 THEN revenue ELSE 0 END)) / 
-                   NULLIF(SUM(CASE WHEN EXTRACT(YEAR FROM date) = 2023 THEN revenue ELSE 0 END), 0)) * 100 AS growth_percentage
-              FROM sales 
-              WHERE EXTRACT(YEAR FROM date) IN (2023, 2024);
-              ```
-            - **For comparing years**, always use CASE WHEN statements instead of window functions
-            - **Use NULLIF() to prevent division by zero errors**
-            
-            **CRITICAL - CONVERSATION CONTEXT & FOLLOW-UP QUESTIONS**:
-            - **ANALYZE the conversation history carefully** to understand what the user previously asked about
-            - **INHERIT the same data type, metrics, and structure** from previous queries when user asks follow-up questions
-            - **EXAMPLES of follow-up handling**:
-                * Previous: "Sales data for January 2024" → Current: "What about February?" → Generate: Sales data for February 2024
-                * Previous: "Revenue by region in Q1" → Current: "Show me Q2" → Generate: Revenue by region in Q2
-                * Previous: "Product A sales" → Current: "What about Product B?" → Generate: Product B sales with same structure
-                * Previous: "Churn in North region" → Current: "How about South?" → Generate: Churn in South region
-            - **RECOGNIZE implicit references**: "last month", "next quarter", "same period", "other regions", etc.
-            - **MAINTAIN consistency** in date formats, column selections, and aggregation methods from previous queries
-            - **BUILD UPON** previous analysis rather than starting fresh each time
-            
-            Schema Information:
-            - Always refer to the actual column names in the database
-            - Use proper date filtering with DATE columns
-            - Don't assume column names based on the question - use schema column names
-            
-            REMEMBER: Return ONLY the SQL query, nothing else. No explanations, no markdown, no natural language.
-            """
-        )
+        if sql_context is None:
+            sql_context = build_sql_context_messages(get_session_memory())
         
         # Build messages array with conversation history but only include SQL-related context
-        messages = [{"role": "system", "content": system_prompt}]
-        
-        # Add conversation history for context, but filter to only include SQL queries
-        if conversation_history:
-            # Only add previous SQL queries for context, not natural language responses
-            sql_context = []
-            for i, msg in enumerate(conversation_history):
-                if msg["role"] == "user":
-                    sql_context.append(msg)
-                elif msg["role"] == "assistant" and i < len(conversation_history) - 1:
-                    # Look for SQL queries in the full messages (which include metadata)
-                    full_messages = st.session_state.get('current_messages', [])
-                    if i < len(full_messages):
-                        full_msg = full_messages[i]
-                        if "sql_query" in full_msg:
-                            sql_context.append({"role": "assistant", "content": f"Previous SQL: {full_msg['sql_query']}"})
-            
-            messages.extend(sql_context[-4:])  # Only last 4 messages for context
-        else:
-            print("🔍 No conversation history available")
+        messages = [{"role": "system", "content": build_sql_system_prompt(date_context)}]
+        messages.extend(sql_context)
         
         # Add current question with schema info and very explicit instructions
-        user_prompt = f"""Database Schema:{SCHEMA_INFO}
+        user_prompt = f"""Database Schema:{get_schema_info()}
+
+{format_examples_for_prompt(examples)}
 
 Original Question: {user_question}
 English Translation: {english_question}
@@ -747,8 +1003,8 @@ Generate ONLY the SQL query to answer this question. Do not include any explanat
         
         print(f"🔍 Messages being sent to Cohere: {messages}")
         
-        resp = co.chat(
-            model="command-r-08-2024",
+        resp = llm.chat(
+            "generate_sql",
             messages=messages,
             temperature=0.1  # Lower temperature for more consistent SQL generation
         )
@@ -756,20 +1012,9 @@ Generate ONLY the SQL query to answer this question. Do not include any explanat
         sql = resp.message.content[0].text.strip()
         print(f"🔍 Raw response from Cohere: {sql}")
         
-        # Remove any markdown formatting
-        sql = re.sub(r'```sql\n?|```\n?', '', sql).strip()
-        
-        # Validate that the response looks like SQL
-        sql_keywords = ['SELECT', 'UPDATE', 'INSERT', 'DELETE', 'WITH']
-        if not any(sql.upper().startswith(keyword) for keyword in sql_keywords):
-            print(f"⚠️ Warning: Response doesn't look like SQL: {sql}")
-            # Try to extract SQL from the response if it's embedded
-            sql_match = re.search(r'(SELECT.*?)(?:\n\n|\Z)', sql, re.DOTALL | re.IGNORECASE)
-            if sql_match:
-                sql = sql_match.group(1).strip()
-                print(f"🔍 Extracted SQL: {sql}")
-            else:
-                return f"Error: AI returned non-SQL response: {sql[:100]}..."
+        sql = clean_generated_sql(sql)
+        if sql.startswith("Error"):
+            return sql
         
         print(f"🔍 Final SQL query: {sql}")
         return sql
@@ -778,8 +1023,191 @@ Generate ONLY the SQL query to answer this question. Do not include any explanat
         print(f"🔍 Exception in generate_sql_query: {str(e)}")
         return f"Error generating SQL: {str(e)}"
 
-def generate_natural_language_response(user_question: str, sql_query: str, df: pd.DataFrame, execution_status: str, success: bool) -> str:
-    """Generate a natural language response based on the query results with conversation history"""
+# JSON schema for the combined plan response (intent + translation + SQL or reply)
+QUERY_PLAN_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "intent": {"type": "string", "enum": ["data_query", "greeting", "irrelevant"]},
+        "english_question": {"type": "string"},
+        "sql": {"type": "string"},
+        "reply": {"type": "string"}
+    },
+    "required": ["intent", "english_question", "sql", "reply"]
+}
+
+def generate_query_plan(user_question: str, examples: list = None, date_context: DateContext = None) -> dict | None:
+    """Classify, translate and generate SQL for a question in a single structured Cohere call.
+    
+    Returns a plan dict with intent, english_question, sql and reply keys, or None when
+    the structured response could not be obtained so the caller can fall back to the
+    multi-call path.
+    """
+    try:
+        # Get conversation history for context
+        conversation_history = get_session_memory()
+        
+        plan_instructions = (
+            f"""You also act as the intent classifier and translator for a data analysis chat system.
+            
+            Classify the user's message into one of these categories:
+            - 'data_query': Questions about data, analytics, sales, revenue, customers, churn, products, regions, etc.
+            - 'greeting': Greetings, hellos, how are you, etc.
+            - 'irrelevant': Questions not related to data analysis (weather, sports, personal questions, etc.)
+            If the user is following up on a previous data-related conversation, classify as 'data_query'.
+            
+            Translate the message to English if it is in another language, preserving business terms:
+            {format_glossary()}
+            
+            Respond with a JSON object with these fields:
+            - "intent": the category
+            - "english_question": the English rendering of the message
+            - "sql": for 'data_query', the PostgreSQL query (pure SQL, no markdown); otherwise an empty string
+            - "reply": for 'greeting' or 'irrelevant', a short friendly reply in the user's language that steers them
+              towards asking about their sales, customers, churn or other business data; otherwise an empty string"""
+        )
+        
+        messages = [{"role": "system", "content": build_sql_system_prompt(date_context) + "\n\n" + plan_instructions}]
+        messages.extend(build_sql_context_messages(conversation_history))
+        messages.append({"role": "user", "content": f"""Database Schema:{get_schema_info()}
+
+{format_examples_for_prompt(examples)}
+
+Question: {user_question}"""})
+        
+        resp = llm.chat(
+            "plan",
+            messages=messages,
+            temperature=0.1,
+            response_format={"type": "json_object", "schema": QUERY_PLAN_SCHEMA}
+        )
+        
+        raw = resp.message.content[0].text.strip()
+        print(f"🔍 Raw plan from Cohere: {raw}")
+        plan = json.loads(raw)
+        
+        intent = str(plan.get("intent", "")).strip().lower()
+        plan = {
+            "intent": intent if intent in ['data_query', 'greeting', 'irrelevant'] else 'data_query',
+            "english_question": (plan.get("english_question") or user_question).strip(),
+            "sql": (plan.get("sql") or "").strip(),
+            "reply": (plan.get("reply") or "").strip()
+        }
+        
+        if plan["intent"] == 'data_query':
+            plan["sql"] = clean_generated_sql(plan["sql"])
+            if plan["sql"].startswith("Error"):
+                return None
+        
+        return plan
+        
+    except Exception as e:
+        print(f"🔍 Exception in generate_query_plan: {str(e)}")
+        return None
+
+@st.cache_resource
+def init_pipeline_executor():
+    """Thread pool shared by all sessions for running pipeline stages concurrently"""
+    return ThreadPoolExecutor(max_workers=PIPELINE_WORKERS, thread_name_prefix="pipeline")
+
+pipeline_executor = init_pipeline_executor()
+
+def run_timed_stage(timings: dict, stage: str, fn, *args, **kwargs):
+    """Run a pipeline stage in its own trace span and record its wall-clock duration in `timings`"""
+    started = time.perf_counter()
+    try:
+        with tracing.span(stage):
+            return fn(*args, **kwargs)
+    finally:
+        timings[stage] = round(time.perf_counter() - started, 3)
+
+def plan_multi_call_concurrent(user_question: str, timings: dict, examples: list = None,
+                               date_context: DateContext = None) -> dict:
+    """Multi-call path with classification, translation and SQL generation overlapped.
+    
+    SQL generation starts speculatively alongside classification because nearly all
+    traffic is data queries; its result is thrown away for greetings and irrelevant
+    questions. Translation runs in parallel with classification and feeds SQL generation.
+    """
+    # Session state is only readable from the script thread, so snapshot the context here
+    conversation_history = get_session_memory()
+    sql_context = build_sql_context_messages(conversation_history)
+    
+    # The worker records into its own dict so a discarded run can't touch `timings` later
+    speculative_timings = {}
+    
+    def translate_and_generate():
+        english_question = run_timed_stage(speculative_timings, "translate", translate_to_english, user_question)
+        sql = run_timed_stage(
+            speculative_timings, "generate_sql", generate_sql_query,
+            user_question, english_question=english_question, sql_context=sql_context, examples=examples,
+            date_context=date_context
+        )
+        return english_question, sql
+    
+    # Translation and speculative SQL run on a worker while this thread classifies
+    speculative_future = pipeline_executor.submit(tracing.bind(translate_and_generate))
+    intent = run_timed_stage(timings, "classify", classify_user_intent, user_question, conversation_history)
+    
+    if intent == 'greeting' or intent == 'irrelevant':
+        # Discard the speculative SQL; an already running call is left to finish on its own
+        speculative_future.cancel()
+        timings["speculation_discarded"] = True
+        tracing.annotate(speculation_discarded=True)
+        return {"intent": intent, "english_question": user_question, "sql": "", "reply": ""}
+    
+    english_question, sql = speculative_future.result()
+    timings.update(speculative_timings)
+    return {"intent": intent, "english_question": english_question, "sql": sql, "reply": ""}
+
+def plan_user_question(user_question: str, timings: dict, examples: list = None, date_context: DateContext = None) -> dict:
+    """Resolve intent and SQL for a question using the configured pipeline mode"""
+    if QUERY_PIPELINE_MODE == "combined":
+        plan = run_timed_stage(timings, "plan", generate_query_plan, user_question, examples, date_context)
+        if plan is not None:
+            return plan
+        print("⚠️ Combined plan failed, falling back to the multi-call pipeline")
+    
+    # Clear-cut questions skip the classification call (and any speculative work)
+    intent = run_timed_stage(timings, "classify_local", decide_intent, user_question)
+    
+    if intent is None:
+        if SPECULATIVE_PIPELINE:
+            return plan_multi_call_concurrent(user_question, timings, examples, date_context)
+        
+        # Serial multi-call path: classify, then translate and generate SQL separately
+        intent = run_timed_stage(timings, "classify", classify_user_intent, user_question)
+    
+    if intent == 'greeting' or intent == 'irrelevant':
+        return {"intent": intent, "english_question": user_question, "sql": "", "reply": ""}
+    
+    english_question = run_timed_stage(timings, "translate", translate_to_english, user_question)
+    return {
+        "intent": intent,
+        "english_question": english_question,
+        "sql": run_timed_stage(
+            timings, "generate_sql", generate_sql_query,
+            user_question, english_question=english_question, examples=examples, date_context=date_context
+        ),
+        "reply": ""
+    }
+
+def stream_chat_text(messages: list, on_token) -> str:
+    """Stream a chat completion, passing the accumulated text to `on_token` as tokens arrive"""
+    parts = []
+    
+    def on_delta(delta: str):
+        parts.append(delta)
+        on_token("".join(parts))
+    
+    return llm.chat_stream("summarize", on_delta, messages=messages).strip()
+
+def generate_natural_language_response(user_question: str, sql_query: str, df: pd.DataFrame, execution_status: str, success: bool,
+                                       on_token=None, date_context: DateContext = None) -> str:
+    """Generate a natural language response based on the query results with conversation history
+    
+    When `on_token` is given the response is streamed and the callback receives the text
+    accumulated so far after every token.
+    """
     try: 
 
          # 1) Check if the question contains any Arabic‐range character
@@ -878,17 +1306,18 @@ SQL Query Used: {sql_query}
 Results Summary: {data_summary}
 
 Current Date Context:
-- Today's date: {datetime.now().strftime('%Y-%m-%d')}
-- Current month: {datetime.now().strftime('%B %Y')}
-- Last month: {(datetime.now().replace(day=1) - pd.Timedelta(days=1)).strftime('%B %Y')}
+{(date_context or DateContext(user_question)).describe()}
 
 Please provide a natural, conversational response summarizing these findings and any business insights. Consider the conversation history to provide contextual analysis. When referring to time periods, be specific about what period was actually analyzed based on the current date context.
 """
         print(f"🔍 User question: {user_question}")
         messages.append({"role": "user", "content": user_prompt})
         
-        resp = co.chat(
-            model="command-r-08-2024",
+        if on_token:
+            return stream_chat_text(messages, on_token)
+        
+        resp = llm.chat(
+            "summarize",
             messages=messages
         )
         
@@ -899,48 +1328,175 @@ Please provide a natural, conversational response summarizing these findings and
     except Exception as e:
         return f"I found some data for your question ({len(df)} records), but had trouble summarizing it. Could you try asking in a different way?"
 
-def process_user_question(user_question: str):
-    """Process user question based on intent"""
+def resolve_question_plan(user_question: str, prior_context: list, date_context: DateContext,
+                          cache_key: str, timings: dict) -> dict:
+    """Find SQL for a question from the cheapest source that can answer it.
+    
+    Vetted templates come first, then the question-to-SQL cache, then a near-identical
+    past example; otherwise the LLM pipeline classifies intent and generates SQL with
+    similar examples as few-shots. The plan's "source" records which one answered.
+    """
+    # Follow-ups without their own period inherit it from earlier turns, which only the LLM sees
+    template_match = run_timed_stage(
+        timings, "template_match", match_template, user_question, date_context, require_period=bool(prior_context)
+    )
+    if template_match:
+        print(f"🧩 Template {template_match['template']} matched (hit rate {template_hit_rate():.0%})")
+        timings["template"] = template_match["template"]
+        return {
+            "intent": "data_query", "english_question": user_question, "sql": template_match["sql"],
+            "params": template_match["params"], "reply": "", "source": "template"
+        }
+    
+    cached = nl_sql_cache.get(cache_key)
+    if cached:
+        timings["nl_sql_cache"] = "hit"
+        print(f"🔍 NL-to-SQL cache hit: {cached['sql']}")
+        return {
+            "intent": "data_query", "english_question": cached["english_question"], "sql": cached["sql"],
+            "reply": "", "source": "nl_sql_cache"
+        }
+    
+    examples = []
+    if example_store:
+        try:
+            examples = run_timed_stage(
+                timings, "retrieve_examples", example_store.search, user_question, get_schema_version()
+            )
+        except Exception as e:
+            print(f"⚠️ Example retrieval failed: {str(e)}")
+        
+        # Follow-ups depend on the earlier turns, so only standalone questions reuse SQL
+        reusable = None if prior_context else find_reusable_example(examples, user_question, date_context.key)
+        if reusable:
+            timings["example_reused"] = True
+            print(f"🔍 Reusing SQL of a near-identical question: {reusable['sql']}")
+            return {
+                "intent": "data_query", "english_question": reusable["english_question"], "sql": reusable["sql"],
+                "reply": "", "source": "example_store"
+            }
+    
+    # Classify intent and generate SQL (one round trip in combined mode)
+    plan = plan_user_question(user_question, timings, examples, date_context)
+    plan["source"] = "llm"
+    return plan
+
+def log_stage_timings(timings: dict):
+    """Print the per-stage timing breakdown of a processed question"""
+    breakdown = ", ".join(
+        f"{stage}={value:.3f}s" for stage, value in timings.items() if isinstance(value, float)
+    )
+    print(f"⏱️ Stage timings: {breakdown}")
+
+@tracing.start_trace("process_user_question")
+def process_user_question(user_question: str, on_token=None):
+    """Process user question based on intent
+    
+    `on_token` receives the partial answer while the natural-language summary streams.
+    """
+    timings = {}
+    started = time.perf_counter()
+    trace = tracing.current_trace()
+    tracing.annotate(question=user_question)
+    
+    # Cache key covers the prior turns, so compute it before adding this question
+    date_context = DateContext(user_question)
+    prior_context = build_sql_context_messages(get_session_memory())
+    cache_key = build_cache_key(user_question, get_schema_version(), date_context.key, prior_context)
     
     # Add user message using session manager
     add_message("user", user_question)
     
-    # Classify user intent
-    intent = classify_user_intent(user_question)
+    plan = resolve_question_plan(user_question, prior_context, date_context, cache_key, timings)
+    intent = plan["intent"]
+    tracing.annotate(intent=intent, sql_source=plan.get("source"))
     
     if intent == 'greeting' or intent == 'irrelevant':
         # Let Cohere handle greetings and irrelevant questions naturally
-        response = generate_contextual_response(user_question, intent)
-        add_message("assistant", response)
+        response = plan["reply"] or run_timed_stage(
+            timings, "contextual_reply", generate_contextual_response, user_question, intent
+        )
+        timings["total"] = round(time.perf_counter() - started, 3)
+        log_stage_timings(timings)
+        add_message("assistant", response, {"timings": timings, "trace_id": trace.trace_id, "trace": trace.spans})
         return
     
     # Handle data query
     else:
-        # Generate SQL
-        sql_query = generate_sql_query(user_question)
+        sql_query = plan["sql"]
         
         if sql_query.startswith("Error"):
             # Use Cohere to generate a natural response for SQL generation errors
-            error_response = generate_contextual_response(
+            error_response = run_timed_stage(
+                timings, "contextual_reply", generate_contextual_response,
                 f"I had trouble generating a query for: {user_question}", 'data_query'
             )
-            add_message("assistant", error_response)
+            timings["total"] = round(time.perf_counter() - started, 3)
+            log_stage_timings(timings)
+            add_message("assistant", error_response, {"timings": timings, "trace_id": trace.trace_id, "trace": trace.spans})
             return
         
-        # Execute SQL
-        df, execution_status, success = execute_sql_query(sql_query)
+        # Execute SQL; generated and cached SQL reference the resolved periods as bind parameters
+        sql_params = plan.get("params") or date_context.bind_params(sql_query)
+        query_info = {}
+        df, execution_status, success = run_timed_stage(
+            timings, "execute_sql", execute_sql_query, sql_query, sql_params, query_info
+        )
         
-        # Generate natural language response
-        nl_response = generate_natural_language_response(
-            user_question, sql_query, df, execution_status, success
+        # Generated SQL that the cost gate stopped gets one chance at a cheaper rewrite
+        if query_info.get("cost_exceeded") and SQL_COST_ACTION == "rewrite" and plan["source"] != "template":
+            cheaper_sql = run_timed_stage(
+                timings, "rewrite_sql", rewrite_expensive_sql, user_question, sql_query, query_info, date_context
+            )
+            if not cheaper_sql.startswith("Error"):
+                sql_query = cheaper_sql
+                sql_params = date_context.bind_params(sql_query)
+                query_info = {"rewritten_for_cost": True, "original_plan": query_info["plan"]}
+                df, execution_status, success = run_timed_stage(
+                    timings, "execute_sql_rewrite", execute_sql_query, sql_query, sql_params, query_info
+                )
+        # Keep a readable copy for display and as context for follow-up questions
+        display_sql = render_sql(sql_query, sql_params) if sql_params else sql_query
+        
+        # Only LLM-generated SQL that actually ran is worth reusing, and only if it
+        # takes its periods from the bind parameters rather than today's literal dates
+        if success and plan["source"] == "llm" and date_context.sql_is_portable(sql_query):
+            nl_sql_cache.put(cache_key, user_question, plan["english_question"], sql_query)
+            if example_store:
+                try:
+                    example_store.add(
+                        user_question, plan["english_question"], sql_query, execution_status,
+                        get_schema_version(), date_context.key
+                    )
+                except Exception as e:
+                    print(f"⚠️ Failed to index example: {str(e)}")
+        
+        # Generate natural language response, recording when the first token shows up
+        stream_callback = None
+        if on_token:
+            def stream_callback(partial_text: str):
+                if "first_token" not in timings:
+                    timings["first_token"] = round(time.perf_counter() - started, 3)
+                on_token(partial_text)
+        
+        nl_response = run_timed_stage(
+            timings, "summarize", generate_natural_language_response,
+            user_question, display_sql, df, execution_status, success, stream_callback, date_context
         )
+        timings["total"] = round(time.perf_counter() - started, 3)
+        log_stage_timings(timings)
         
         # Add assistant response with metadata using session manager
         add_message("assistant", nl_response, {
-            "sql_query": sql_query,
-            "data": df,
+            "sql_query": display_sql,
+            "sql_source": plan["source"],
+            "result": result_store.put(df),
             "execution_status": execution_status,
-            "success": success
+            "success": success,
+            "query_plan": query_info or None,
+            "timings": timings,
+            "trace_id": trace.trace_id,
+            "trace": trace.spans
         })
 
 # ────────────────────────────────────────────────────────────────
@@ -1059,12 +1615,15 @@ tool_defs = [
     for f in functions
 ]
 
+@tracing.start_trace("explain_incident_agent")
 def explain_incident_agent(log_id: int, language: str = "english") -> str:
     """
     Analyze and explain an incident by fetching log details and providing 
     root cause analysis with resolution steps in the specified language.
     """
     
+    tracing.annotate(log_id=log_id, language=language)
+    
     # Get conversation history for context
     conversation_history = get_session_memory()
     
@@ -1111,8 +1670,8 @@ def explain_incident_agent(log_id: int, language: str = "english") -> str:
         messages.append({"role": "user", "content": user_msg})
         
         # First API call with tools
-        first_response = co.chat(
-            model="command-r-08-2024",
+        first_response = llm.chat(
+            "incident_tools",
             messages=messages,
             tools=tool_defs,
             temperature=0.1
@@ -1139,7 +1698,10 @@ def explain_incident_agent(log_id: int, language: str = "english") -> str:
         for call in tool_calls:
             try:
                 args = json.loads(call.function.arguments)
-                result = func_map[call.function.name](**args)
+                with tracing.span(f"tool.{call.function.name}", **args):
+                    result = func_map[call.function.name](**args)
+                    if isinstance(result, dict) and result.get("error"):
+                        tracing.annotate(error=result["error"])
                 
                 tool_results.append({
                     "role": "tool", 
@@ -1235,8 +1797,8 @@ def explain_incident_agent(log_id: int, language: str = "english") -> str:
         })
         
         # Second API call WITHOUT tools
-        second_response = co.chat(
-            model="command-r-08-2024",
+        second_response = llm.chat(
+            "incident_report",
             messages=conversation,
             temperature=0.1
         )
@@ -1284,6 +1846,47 @@ def explain_incident_agent(log_id: int, language: str = "english") -> str:
         error_trace = traceback.format_exc()
         return f"Error in incident analysis: {str(e)}\n\nFull traceback:\n{error_trace}"
 
+def render_trace_waterfall(spans: list):
+    """Debug view of where an answer's time went: one bar per span, offset by its start"""
+    rows = tracing.waterfall(spans)
+    total_ms = max((row["start_ms"] + row["duration_ms"] for row in rows), default=0) or 1
+    bars = ['<div style="font-family: monospace; font-size: 0.8rem; direction: ltr;">']
+    for row in rows:
+        details = ", ".join(f"{key}={value}" for key, value in row["attributes"].items() if key != "question")
+        color = "#dc3545" if row["error"] else "#6f42c1"
+        bars.append(f"""
+        <div style="display: flex; align-items: center; margin: 2px 0;">
+            <div style="width: 35%; padding-left: {row['depth'] * 12}px; white-space: nowrap; overflow: hidden; text-overflow: ellipsis;" title="{html.escape(details)}">{html.escape(row['name'])}</div>
+            <div style="width: 50%; position: relative; height: 12px; background: #f1f3f5;">
+                <div style="position: absolute; left: {row['start_ms'] / total_ms * 100:.1f}%; width: {max(row['duration_ms'] / total_ms * 100, 0.5):.1f}%; height: 100%; background: {color};"></div>
+            </div>
+            <div style="width: 15%; text-align: right;">{row['duration_ms']:.0f} ms</div>
+        </div>""")
+    bars.append("</div>")
+    st.markdown("".join(bars), unsafe_allow_html=True)
+    for row in rows:
+        if row["error"] or row["attributes"].get("error"):
+            st.caption(f"❌ {row['name']}: {row['error'] or row['attributes']['error']}")
+
+def render_earlier_messages_button(key: str):
+    """Button that pages older messages of the session back in, shown when some aren't in memory"""
+    if st.session_state.get("has_earlier_messages") and st.button("⬆️ الرسائل السابقة", key=f"earlier_{key}", help="Load earlier messages"):
+        load_earlier_messages()
+        st.rerun()
+
+def render_result_reference(message: Message):
+    """Summary of a message's stored result, with the rows loaded only when asked for"""
+    reference = message.metadata.result
+    if not reference:
+        return
+    st.caption(f"{reference['rows']} rows × {len(reference['columns'])} columns")
+    if reference.get("result_id") and st.toggle("📊 Show results", key=f"result_{message.id}"):
+        df = result_store.get(reference)
+        if df is None:
+            st.info("This result is no longer stored.")
+        else:
+            st.dataframe(df, use_container_width=True)
+
 def render_sidebar():
     """Render the chat history sidebar"""
     with st.sidebar:
@@ -1309,19 +1912,13 @@ def render_sidebar():
         
         st.markdown("---")
         
-        # Display chat sessions
-        all_sessions = load_all_sessions(current_mode)
+        # Display one page of chat sessions (newest first); earlier pages' cursors allow going back
+        page_cursors = st.session_state.setdefault("session_page_cursors", [None])
+        sessions_page, next_cursor = load_sessions_page(current_mode, page_cursors[-1])
         
-        if all_sessions:
-            # Sort sessions by updated time (newest first)
-            sorted_sessions = sorted(
-                all_sessions.items(),
-                key=lambda x: x[1]["updated_at"],
-                reverse=True
-            )
-            
-            # Show only recent 5 sessions for cleaner look
-            for session_id_item, session_data in sorted_sessions[:5]:
+        if sessions_page:
+            for session_data in sessions_page:
+                session_id_item = session_data["session_id"]
                 col1, col2 = st.columns([3.5, 0.5])
                 
                 with col1:
@@ -1352,9 +1949,21 @@ def render_sidebar():
                 msg_count = session_data.get("message_count", 0)
                 st.markdown(f"<small style='color: rgba(255, 255, 255, 0.5); font-size: 0.7rem;'>{timestamp_str} • {msg_count} msg</small>", unsafe_allow_html=True)
                 
-            # Show more sessions indicator if there are more than 5
-            if len(sorted_sessions) > 5:
-                st.markdown(f"<small style='color: rgba(255, 255, 255, 0.6); text-align: center; display: block;'>+{len(sorted_sessions) - 5} more sessions</small>", unsafe_allow_html=True)
+            # Page through older sessions
+            if next_cursor or len(page_cursors) > 1:
+                newer_col, older_col = st.columns(2)
+                with newer_col:
+                    if len(page_cursors) > 1 and st.button("◀", key="sessions_newer", help="Newer", use_container_width=True):
+                        page_cursors.pop()
+                        st.rerun()
+                with older_col:
+                    if next_cursor and st.button("▶", key="sessions_older", help="Older", use_container_width=True):
+                        page_cursors.append(next_cursor)
+                        st.rerun()
+        elif len(page_cursors) > 1:
+            # The page emptied (e.g. its last session was deleted); go back one
+            page_cursors.pop()
+            st.rerun()
         else:
             # Empty state
             st.markdown("""
@@ -1374,6 +1983,7 @@ def main():
         st.session_state.current_mode = mode
         # Reset session loaded flag to load correct module
         st.session_state.session_loaded = False
+        st.session_state.session_page_cursors = [None]
         # Force page reload on mode switch
         st.rerun()
     
@@ -1445,17 +2055,18 @@ def main():
             """, unsafe_allow_html=True)
         
         # Display current chat messages with RTL support for Arabic
+        render_earlier_messages_button("sql")
         for message in st.session_state.current_messages:
-            with st.chat_message(message["role"]):
+            with st.chat_message(message.role):
                 # Check if content is in Arabic (simple check for Arabic characters)
-                is_arabic = any('\u0600' <= c <= '\u06FF' for c in message["content"])
+                is_arabic = any('\u0600' <= c <= '\u06FF' for c in message.content)
                 if is_arabic:
-                    st.markdown(f'<div style="direction: rtl; text-align: right;">{message["content"]}</div>', unsafe_allow_html=True)
+                    st.markdown(f'<div style="direction: rtl; text-align: right;">{message.content}</div>', unsafe_allow_html=True)
                 else:
-                    st.markdown(message["content"])
+                    st.markdown(message.content)
                 
                 # Show optional details for data queries
-                if message["role"] == "assistant" and "sql_query" in message:
+                if message.role == "assistant" and message.metadata.sql_query:
                     with st.expander("🔍 عرض SQL المولد" if is_arabic else "🔍 View Generated SQL", expanded=False):
                         st.markdown("""
                         <div style="background: #1e1e1e; 
@@ -1463,8 +2074,18 @@ def main():
                                     border: 1px solid #2d2d2d;
                                     margin-top: 0.5rem;">
                         """, unsafe_allow_html=True)
-                        st.code(message["sql_query"], language="sql")
+                        st.code(message.metadata.sql_query, language="sql")
                         st.markdown("</div>", unsafe_allow_html=True)
+                        render_result_reference(message)
+                        if message.metadata.timings:
+                            st.caption(" • ".join(
+                                f"{stage}: {value:.2f}s" for stage, value in message.metadata.timings.items()
+                                if isinstance(value, float)
+                            ))
+                
+                if message.role == "assistant" and message.metadata.trace:
+                    with st.expander("🧭 Trace", expanded=False):
+                        render_trace_waterfall(message.metadata.trace)
         
         # Enhanced chat input with RTL placeholder
         if prompt := st.chat_input("💭 اسألني عن بيانات عملك"):
@@ -1479,12 +2100,20 @@ def main():
             with st.chat_message("assistant"):
                 placeholder = st.empty()
                 placeholder.markdown('<p class="processing-text">🤔 جاري معالجة سؤالك</p>', unsafe_allow_html=True)
-                process_user_question(prompt)
+                
+                def render_partial_answer(partial_text: str):
+                    # Render tokens into the assistant bubble as they arrive
+                    if any('\u0600' <= c <= '\u06FF' for c in partial_text):
+                        placeholder.markdown(f'<div style="direction: rtl; text-align: right;">{partial_text}▌</div>', unsafe_allow_html=True)
+                    else:
+                        placeholder.markdown(partial_text + "▌")
+                
+                process_user_question(prompt, on_token=render_partial_answer)
                 placeholder.empty()
                 latest = st.session_state.current_messages[-1]
-                st.markdown(latest["content"])
+                st.markdown(latest.content)
                 
-                if "sql_query" in latest:
+                if latest.metadata.sql_query:
                     with st.expander("🔍 View Generated SQL", expanded=False):
                         st.markdown("""
                         <div style="background: #1e1e1e; 
@@ -1492,7 +2121,7 @@ def main():
                                     border: 1px solid #2d2d2d;
                                     margin-top: 0.5rem;">
                         """, unsafe_allow_html=True)
-                        st.code(latest["sql_query"], language="sql")
+                        st.code(latest.metadata.sql_query, language="sql")
                         st.markdown("</div>", unsafe_allow_html=True)
             
             st.rerun()
@@ -1655,20 +2284,20 @@ def main():
         st.markdown("---")
         st.markdown('<h3 style="direction: rtl; text-align: right;">💬 محادثة التحليل</h3>', unsafe_allow_html=True)
         
+        render_earlier_messages_button("incident")
         for message in st.session_state.current_messages:
-            with st.chat_message(message["role"]):
+            with st.chat_message(message.role):
                 # Check if content is in Arabic (simple check for Arabic characters)
-                is_arabic = any('\u0600' <= c <= '\u06FF' for c in message["content"])
+                is_arabic = any('\u0600' <= c <= '\u06FF' for c in message.content)
                 if is_arabic:
-                    st.markdown(f'<div style="direction: rtl; text-align: right;">{message["content"]}</div>', unsafe_allow_html=True)
+                    st.markdown(f'<div style="direction: rtl; text-align: right;">{message.content}</div>', unsafe_allow_html=True)
                 else:
-                    st.markdown(message["content"])
+                    st.markdown(message.content)
                 
                 # Show metadata for incident analysis
-                if message["role"] == "assistant" and "analysis_type" in message:
+                if message.role == "assistant" and message.metadata.analysis_type:
                     with st.expander("🔍 عرض تفاصيل التحليل" if is_arabic else "🔍 View Analysis Details", expanded=False):
-                        metadata = {k: v for k, v in message.items() if k not in ["role", "content", "timestamp", "id"]}
-                        st.json(metadata)
+                        st.json(message.metadata.to_dict())
 
     # Render footer
     # render_footer()
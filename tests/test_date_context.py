@@ -0,0 +1,48 @@
+from datetime import date
+
+from date_context import DateContext
+
+TODAY = date(2026, 10, 18)
+
+def periods(question: str) -> list:
+    return [(p["phrase"], p["start"], p["end"], p["label"]) for p in DateContext(question, today=TODAY).periods]
+
+def test_same_period_last_year_shifts_this_month():
+    assert periods("revenue this month vs same period last year")[1] == (
+        "same_period_last_year", date(2025, 10, 1), date(2025, 11, 1), "October 2025"
+    )
+
+def test_same_period_last_year_shifts_last_quarter():
+    assert periods("revenue last quarter compared to the same period last year")[1] == (
+        "same_period_last_year", date(2025, 7, 1), date(2025, 10, 1), "Q3 2025"
+    )
+
+def test_same_period_last_year_in_arabic():
+    assert periods("الإيرادات هذا الشهر مقارنة بنفس الفترة من العام الماضي")[1][1:3] == (date(2025, 10, 1), date(2025, 11, 1))
+
+def test_same_period_last_year_without_anchor_is_left_to_the_llm():
+    context = DateContext("revenue for the same period last year", today=TODAY)
+    assert context.periods == []
+    assert context.key == TODAY.isoformat()
+
+def test_prompt_block_names_both_date_columns():
+    block = DateContext("churn last month", today=TODAY).prompt_block()
+    assert block.startswith("- Today's date: 2026-10-18")
+    assert "sales.date, churn.month" in block
+    assert "<date column> >= :period_0_start AND <date column> < :period_0_end" in block
+
+def test_arabic_phrases_do_not_match_inside_words():
+    # اليوم ("today") inside اليومية ("daily"), امس ("yesterday") inside الخامس ("fifth")
+    for question in ["المبيعات اليومية في يناير 2024", "إيرادات المنتج الخامس في 2024"]:
+        context = DateContext(question, today=TODAY)
+        assert context.periods == []
+        assert context.key == "absolute"
+
+def test_arabic_phrases_with_attached_prefixes():
+    assert periods("الإيرادات للعام الماضي")[0][0] == "last_year"
+    assert periods("مبيعات الشهر الماضي واليوم")[1][0] == "today"
+
+def test_demonstratives_are_not_relative_dates():
+    assert DateContext("what is the revenue of this product in 2023", today=TODAY).key == "absolute"
+    assert DateContext("ما هي إيرادات هذا المنتج في 2023", today=TODAY).key == "absolute"
+    assert DateContext("revenue this week", today=TODAY).key == "relative:this_week"
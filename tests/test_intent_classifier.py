@@ -0,0 +1,39 @@
+import pytest
+
+from intent_classifier import classify_intent_locally, decide_intent, _count_hits, DATA_LEXICON, IRRELEVANT_LEXICON
+from query_cache import normalize_question
+
+def test_arabic_terms_do_not_match_inside_words():
+    # كم ("how many") inside عليكم
+    assert _count_hits("السلام عليكم", DATA_LEXICON) == 0
+    assert classify_intent_locally("السلام عليكم")[0] == "greeting"
+
+def test_arabic_terms_match_with_attached_prefixes():
+    assert _count_hits("وكم", DATA_LEXICON) == 1
+    assert _count_hits("للعملاء", DATA_LEXICON) >= 1
+    assert _count_hits("بالربع", DATA_LEXICON) >= 1
+
+def test_arabic_data_question():
+    assert classify_intent_locally("كم عدد العملاء في الربع الاول")[0] == "data_query"
+
+@pytest.mark.parametrize("question", [
+    "how many goals did Messi score in 2022",
+    "list the best movies",
+    "who is the most famous singer",
+    "show me a picture of a cat",
+    "كم عمرك",
+])
+def test_generic_wording_alone_is_not_a_confident_data_query(question):
+    assert decide_intent(question) is None or decide_intent(question) == "irrelevant"
+
+@pytest.mark.parametrize("question", ["list the best movies", "recommend some songs"])
+def test_plural_irrelevant_terms(question):
+    assert _count_hits(normalize_question(question), IRRELEVANT_LEXICON) >= 1
+
+@pytest.mark.parametrize("question", [
+    "show total revenue by region in 2024",
+    "how many units were sold last month",
+    "كم الإيرادات في 2024",
+])
+def test_data_questions_are_decided_locally(question):
+    assert decide_intent(question) == "data_query"
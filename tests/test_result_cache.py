@@ -0,0 +1,33 @@
+import sqlite3
+import time
+from datetime import date
+
+import pandas as pd
+
+from result_cache import ResultCache, build_result_key, volatility
+
+VERSIONS = {"sales": 3}
+
+def test_volatility():
+    assert volatility("SELECT SUM(revenue) FROM sales") is None
+    assert volatility("SELECT SUM(revenue) FROM sales WHERE date >= CURRENT_DATE - INTERVAL '30 days'") == "daily"
+    assert volatility("SELECT SUM(revenue) FROM sales WHERE date >= NOW() - INTERVAL '1 hour'") == "volatile"
+    assert volatility("SELECT * FROM sales ORDER BY random() LIMIT 5") == "volatile"
+    assert volatility("SELECT clock_timestamp()") == "volatile"
+
+def test_current_date_queries_are_keyed_by_day():
+    sql = "SELECT SUM(revenue) FROM sales WHERE date = CURRENT_DATE"
+    monday = build_result_key(sql, {}, VERSIONS, today=date(2026, 10, 19))
+    assert monday == build_result_key(sql, {}, VERSIONS, today=date(2026, 10, 19))
+    assert monday != build_result_key(sql, {}, VERSIONS, today=date(2026, 10, 20))
+
+def test_volatile_queries_get_no_key():
+    assert build_result_key("SELECT NOW()", {}, VERSIONS) is None
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = ResultCache(path=tmp_path / "cache.sqlite3", ttl_seconds=60)
+    cache.put("key", pd.DataFrame({"revenue": [1.5]}), "ok")
+    assert cache.get("key")[1] == "ok"
+    with sqlite3.connect(tmp_path / "cache.sqlite3") as conn:
+        conn.execute("UPDATE result_cache SET created_at = ?", (time.time() - 61,))
+    assert cache.get("key") is None
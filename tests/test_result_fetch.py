@@ -0,0 +1,33 @@
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+import result_fetch
+import tracing
+from result_fetch import fetch_dataframe
+
+def make_session(rows: int) -> Session:
+    session = Session(create_engine("sqlite:///:memory:"))
+    session.execute(text("CREATE TABLE sales (region TEXT, revenue REAL)"))
+    session.execute(text("INSERT INTO sales VALUES (:region, :revenue)"),
+                    [{"region": f"r{i}", "revenue": float(i)} for i in range(rows)])
+    return session
+
+def test_default_row_limit_streams():
+    from sql_guard import SQL_ROW_LIMIT
+    assert SQL_ROW_LIMIT > result_fetch.SQL_FETCH_CHUNK_ROWS
+
+def test_small_limit_fetched_in_one_go(monkeypatch):
+    monkeypatch.setattr(tracing, "TRACE_EXPORT", "off")
+    with tracing.start_trace("test") as root:
+        df, truncated = fetch_dataframe(make_session(10), text("SELECT * FROM sales LIMIT 10"), {}, 10)
+    assert len(df) == 10 and truncated is None
+    assert [span["name"] for span in root.trace.spans if span["name"] == "build_dataframe"] == ["build_dataframe"]
+
+def test_large_result_streamed_in_chunks(monkeypatch):
+    monkeypatch.setattr(result_fetch, "SQL_FETCH_CHUNK_ROWS", 100)
+    monkeypatch.setattr(tracing, "TRACE_EXPORT", "off")
+    with tracing.start_trace("test") as root:
+        df, truncated = fetch_dataframe(make_session(1000), text("SELECT * FROM sales LIMIT 1000"), {}, 1000)
+    assert len(df) == 1000 and truncated is None
+    build = next(span for span in root.trace.spans if span["name"] == "build_dataframe")
+    assert build["attributes"]["chunks"] == 10
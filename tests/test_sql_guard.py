@@ -0,0 +1,21 @@
+import pytest
+
+from sql_guard import SQLGuardError, guard_sql
+
+@pytest.mark.parametrize("sql", [
+    "SELECT * FROM pg_catalog.sales",
+    "SELECT * FROM information_schema.sales",
+    "SELECT * FROM other.public.sales",
+    "SELECT current_setting('data_directory') FROM sales",
+    "SELECT version()",
+    "SELECT inet_server_addr(), current_user FROM sales",
+    "SELECT set_config('work_mem', '1GB', true)",
+])
+def test_rejects_other_schemas_and_server_introspection(sql):
+    with pytest.raises(SQLGuardError):
+        guard_sql(sql)
+
+def test_allows_public_schema():
+    sql, info = guard_sql("SELECT region, SUM(revenue) FROM public.sales GROUP BY region")
+    assert "public.sales" in sql
+    assert info["limit_applied"]
@@ -0,0 +1,143 @@
+import os
+import json
+import time
+import uuid
+import threading
+import contextvars
+from pathlib import Path
+from contextlib import contextmanager
+
+# -------------------------------------------------------------------
+# Configuration
+# -------------------------------------------------------------------
+TRACE_EXPORT = os.getenv("TRACE_EXPORT", "jsonl")  # jsonl | off
+TRACE_EXPORT_PATH = Path(os.getenv("TRACE_EXPORT_PATH", ".cache/traces.jsonl"))
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+_export_lock = threading.Lock()
+
+# -------------------------------------------------------------------
+# Spans
+# -------------------------------------------------------------------
+class Trace:
+    """One traced request; finished spans are collected in `spans` as plain dicts"""
+
+    def __init__(self, name: str):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.started_at = time.time()
+        self.started = time.perf_counter()
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, record: dict):
+        with self._lock:
+            self.spans.append(record)
+
+class Span:
+    def __init__(self, trace: Trace, name: str, parent: "Span" = None, attributes: dict = None):
+        self.trace = trace
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = dict(attributes or {})
+        self.error = None
+        self.started = time.perf_counter()
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def finish(self):
+        self.trace.add({
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ms": round((self.started - self.trace.started) * 1000, 1),
+            "duration_ms": round((time.perf_counter() - self.started) * 1000, 1),
+            "attributes": self.attributes,
+            "error": self.error,
+            "thread": threading.current_thread().name,
+        })
+
+@contextmanager
+def span(name: str, **attributes):
+    """Child span of the current one; a no-op outside a trace"""
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+    current = Span(parent.trace, name, parent, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except Exception as e:
+        current.error = f"{type(e).__name__}: {str(e)}"
+        raise
+    finally:
+        _current_span.reset(token)
+        current.finish()
+
+@contextmanager
+def start_trace(name: str, **attributes):
+    """Root span of a new trace, exported when it ends; nests as a child inside another trace"""
+    if _current_span.get() is not None:
+        with span(name, **attributes) as current:
+            yield current
+        return
+    trace = Trace(name)
+    root = Span(trace, name, attributes=attributes)
+    token = _current_span.set(root)
+    try:
+        yield root
+    except Exception as e:
+        root.error = f"{type(e).__name__}: {str(e)}"
+        raise
+    finally:
+        _current_span.reset(token)
+        root.finish()
+        export(trace)
+
+def annotate(**attributes):
+    """Add attributes (tokens, rows, errors...) to the current span"""
+    current = _current_span.get()
+    if current is not None:
+        current.set(**attributes)
+
+def current_trace() -> Trace | None:
+    current = _current_span.get()
+    return current.trace if current else None
+
+def bind(fn):
+    """Carry the current span into a worker thread"""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+# -------------------------------------------------------------------
+# Export
+# -------------------------------------------------------------------
+def export(trace: Trace):
+    """Append the finished trace as one JSON line"""
+    if TRACE_EXPORT != "jsonl":
+        return
+    record = {
+        "trace_id": trace.trace_id,
+        "name": trace.name,
+        "started_at": trace.started_at,
+        "spans": sorted(trace.spans, key=lambda s: s["start_ms"]),
+    }
+    try:
+        TRACE_EXPORT_PATH.parent.mkdir(parents=True, exist_ok=True)
+        with _export_lock, open(TRACE_EXPORT_PATH, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, default=str, ensure_ascii=False) + "\n")
+    except Exception as e:
+        print(f"⚠️ Failed to export trace: {str(e)}")
+
+def waterfall(spans: list) -> list:
+    """Spans in start order with their nesting depth, for display"""
+    depths = {}
+    rows = []
+    for record in sorted(spans, key=lambda s: (s["start_ms"], -s["duration_ms"])):
+        depth = depths.get(record["parent_id"], -1) + 1
+        depths[record["span_id"]] = depth
+        rows.append({**record, "depth": depth})
+    return rows